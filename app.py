@@ -1,29 +1,76 @@
 # app.py
 
+import asyncio
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import uvicorn
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, HTTPException
+from fastapi.responses import StreamingResponse
 
 from src.chatbot import PDFChatBot
+from src.inference import embedding_model, llm_model, reranker
+from src.search.index_store import chunk_index_paths, load_chunk_index, load_sections, section_store_paths
+from src.utils.admission import AdmissionController, Overloaded
 
 app = FastAPI()
 
-# 1) Load section information (sections_with_emb.json)
-sections_path = "data/extracted/sections_with_emb.json"
-with open(sections_path, 'r', encoding='utf-8') as f:
-    sections_data = json.load(f)
+# 1) Load section information (sections_with_emb)
+#    The binary store is memory-mapped, so every worker process shares the
+#    embedding pages through the OS page cache. Legacy JSON is still accepted.
+sections_prefix = "data/extracted/sections_with_emb"
+if os.path.exists(section_store_paths(sections_prefix)[2]):
+    sections_data = load_sections(sections_prefix)
+else:
+    with open(f"{sections_prefix}.json", 'r', encoding='utf-8') as f:
+        sections_data = json.load(f)
 
-# 2) Load chunk index (sample_chunks_vectors.json)
-chunk_index_path = "data/index/sample_chunks_vectors.json"
-with open(chunk_index_path, 'r', encoding='utf-8') as f:
-    chunk_index_data = json.load(f)
+# 2) Load chunk index (sample_chunks_vectors)
+#    QUERYDOC_INDEX_TYPE=ivf|sq8|pq switches to the approximate/compressed
+#    backend built by `python scripts/build_index.py --index <type>`.
+chunk_index_prefix = "data/index/sample_chunks_vectors"
+index_type = os.environ.get("QUERYDOC_INDEX_TYPE", "exact")
+if os.path.exists(chunk_index_paths(chunk_index_prefix)[1]):
+    chunk_index_data = load_chunk_index(chunk_index_prefix, index_type=index_type)
+else:
+    with open(f"{chunk_index_prefix}.json", 'r', encoding='utf-8') as f:
+        chunk_index_data = json.load(f)
 
-chatbot = PDFChatBot(sections_data, chunk_index_data)
+# QUERYDOC_REWRITE=0 skips the LLM query-rewrite round trip;
+# QUERYDOC_REWRITE_MAX_TOKENS bounds it separately from the answer.
+# QUERYDOC_RERANK=1 re-ranks the top QUERYDOC_RERANK_DEPTH chunks with a
+# cross-encoder before they go into the prompt.
+use_reranker = os.environ.get("QUERYDOC_RERANK", "0") == "1"
+chatbot = PDFChatBot(sections_data, chunk_index_data, index_type=index_type,
+                     rewrite_query=os.environ.get("QUERYDOC_REWRITE", "1") != "0",
+                     rewrite_max_new_tokens=int(os.environ.get("QUERYDOC_REWRITE_MAX_TOKENS", "256")),
+                     cross_encoder=use_reranker,
+                     cross_encoder_depth=int(os.environ.get("QUERYDOC_RERANK_DEPTH", "20")))
+
+# Concurrent /ask requests share decode steps through the continuous-batching
+# scheduler (QUERYDOC_MAX_BATCH sequences at most).
+max_batch_size = int(os.environ.get("QUERYDOC_MAX_BATCH", "8"))
+llm_model.get_local_llm().enable_batching(max_batch_size=max_batch_size)
+
+# Embedding/search run on a small CPU pool; generations go through a GPU pool
+# with one worker per batch slot, so at most a full batch is handed to the
+# scheduler and the rest wait in the pool's queue.
+cpu_workers = int(os.environ.get("QUERYDOC_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="querydoc-cpu")
+gpu_executor = ThreadPoolExecutor(max_workers=max_batch_size, thread_name_prefix="querydoc-gpu")
+
+# Admission control: QUERYDOC_MAX_IN_FLIGHT requests are processed at once and
+# QUERYDOC_MAX_QUEUE more may wait; beyond that /ask answers 429 right away.
+# QUERYDOC_DEADLINE (seconds) bounds the total time of one request.
+admission = AdmissionController(max_in_flight=int(os.environ.get("QUERYDOC_MAX_IN_FLIGHT", str(2 * max_batch_size))),
+                                max_queue=int(os.environ.get("QUERYDOC_MAX_QUEUE", "32")))
+request_deadline = float(os.environ.get("QUERYDOC_DEADLINE", "120"))
 
 
 @app.post("/ask")
-def ask_question(question: str = Body(..., embed=True)):
+async def ask_question(question: str = Body(..., embed=True)):
     """
     FastAPI endpoint that returns an answer for the given question.
 
@@ -35,10 +82,116 @@ def ask_question(question: str = Body(..., embed=True)):
     Returns
     -------
     dict
-        A JSON dictionary with a single key ``"answer"``.
+        A JSON dictionary with the ``"answer"`` text and the per-stage
+        ``"stats"`` (timings in seconds, rewrite outcome, generation latency).
+
+    Raises
+    ------
+    HTTPException
+        429 when the server is at capacity, 504 when the request deadline
+        passes.
+    """
+    deadline = time.monotonic() + request_deadline
+    stats = {}
+    try:
+        async with admission.slot(deadline=deadline):
+            stats["timings"] = {"queue_wait": request_deadline - (deadline - time.monotonic())}
+            answer = await asyncio.wait_for(
+                chatbot.answer_async(question, stats=stats, cpu_executor=cpu_executor,
+                                     gpu_executor=gpu_executor, deadline=deadline),
+                timeout=max(deadline - time.monotonic(), 0.0) + 1.0,
+            )
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=f"Server overloaded: {e}", headers={"Retry-After": "1"})
+    except (TimeoutError, asyncio.TimeoutError):
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    return {"answer": answer, "stats": stats}
+
+
+@app.get("/health")
+def health():
+    """Report admission-control counters, the number of sequences being decoded and prefix-cache counters."""
+    llm = llm_model.get_local_llm()
+    return {"admission": admission.stats(), "active_generations": llm.scheduler.active,
+            "prefix_cache": llm.prefix_cache.stats() if llm.prefix_cache is not None else None}
+
+
+def _sse(data: dict, event: str = None) -> str:
+    """Format one server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(question: str = Body(..., embed=True)):
     """
-    answer = chatbot.answer(question)
-    return {"answer": answer}
+    Server-sent-events variant of ``/ask``.
+
+    Each generated text delta is sent as ``data: {"delta": "..."}``; the
+    stream ends with an ``event: done`` message carrying the ``"stats"``
+    (including time-to-first-token). If the client disconnects, generation
+    is cancelled.
+
+    The request holds an admission slot while the stream runs and is bound
+    by the same deadline as ``/ask``. The slot is taken inside the stream,
+    so a response that is never iterated holds nothing; a rejection is
+    sent as an ``event: error`` message with ``"status"`` 429 or 504, like
+    any error after the stream has started. The answer generator is
+    advanced on the GPU pool, never on the event loop.
+    """
+    deadline = time.monotonic() + request_deadline
+
+    async def events():
+        try:
+            async with admission.slot(deadline=deadline):
+                stats = {"timings": {"queue_wait": request_deadline - (deadline - time.monotonic())}}
+                answer = chatbot.answer_stream(question, stats=stats, deadline=deadline)
+                step = None
+                try:
+                    while True:
+                        step = gpu_executor.submit(next, answer, None)
+                        delta = await asyncio.wrap_future(step)
+                        if delta is None:
+                            break
+                        yield _sse({"delta": delta})
+                    yield _sse({"stats": stats}, event="done")
+                except Exception as e:  # noqa: BLE001 - report to the client, the stream is already open
+                    yield _sse({"error": str(e)}, event="error")
+                finally:
+                    def close():
+                        # A step still running (client gone mid-token) must finish before the generator can be closed
+                        if step is not None:
+                            wait([step])
+                        answer.close()
+
+                    await asyncio.get_running_loop().run_in_executor(None, close)
+        except Overloaded as e:
+            yield _sse({"error": f"Server overloaded: {e}", "status": 429}, event="error")
+        except (TimeoutError, asyncio.TimeoutError):
+            yield _sse({"error": "Request deadline exceeded", "status": 504}, event="error")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.on_event("startup")
+def warm_up_models():
+    # Models load lazily; load them (and run one tiny inference each) before
+    # the first request so it doesn't pay for it. QUERYDOC_WARMUP=0 skips this.
+    if os.environ.get("QUERYDOC_WARMUP", "1") != "0":
+        embedding_model.warm_up()
+        llm_model.warm_up()
+        if chatbot.hybrid and chatbot.lexical == "bm25":
+            # Build the BM25 index now if the index was loaded without one (e.g. legacy JSON)
+            chatbot.chunk_index.lexical_index()
+        if use_reranker:
+            reranker.get_reranker().score("warm-up", ["warm-up"])
+
+
+@app.on_event("shutdown")
+def shutdown():
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+    gpu_executor.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,29 @@
 # scripts/build_index.py
 
+import argparse
 import os
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import json
-from src.inference.embedding_model import embedding_model
+
+import numpy as np
+
+from scripts.section_rep_builder import build_section_reps, update_section_reps
+from src.inference.embedding_model import get_embedding_model
+from src.search.chunk_index import ChunkIndex
+from src.search.index_store import (chunk_index_paths, compact_chunk_index, content_hash, load_chunk_header,
+                                    load_chunk_index, load_sections, read_chunk_rows, save_chunk_index,
+                                    save_lexical_index, save_multi_vector_index, save_sections, save_vector_index,
+                                    section_store_paths, update_chunk_rows)
+from src.search.multi_vector import MultiVectorStore, SparseIndex, prune_token_vectors
+from src.search.vector_index import build_vector_index
+
+# Rewrite an index without its deleted rows once they exceed this share
+COMPACT_RATIO = 0.25
+
+# Chunks encoded per bge-m3 call when building sparse / multi-vector indexes
+MULTI_VECTOR_BATCH = 256
 
 
 def build_chunk_index(chunks):
@@ -15,7 +33,7 @@ def build_chunk_index(chunks):
     [{ "embedding": [...], "metadata": {...} }, ...] 형태로 반환
     """
     contents = [c["content"] for c in chunks]
-    embeddings = embedding_model.get_embeddings(contents)  # shape: (N, emb_dim)
+    embeddings = get_embedding_model().get_embeddings(contents)  # shape: (N, emb_dim)
 
     index_data = []
     for i, emb in enumerate(embeddings):
@@ -26,7 +44,139 @@ def build_chunk_index(chunks):
     return index_data
 
 
+def build_multi_vector_index(chunk_index, max_tokens=64):
+    """
+    Encode every chunk with bge-m3's sparse and multi-vector heads and attach
+    a :class:`SparseIndex` and a pruned float16 :class:`MultiVectorStore` to
+    *chunk_index*. Token vectors are pruned batch by batch, so the full-size
+    vectors of the whole document are never held at once.
+    """
+    model = get_embedding_model()
+    contents = [m.get("content", "") for m in chunk_index.metadata]
+    sparse, token_vectors = [], []
+    for start in range(0, len(contents), MULTI_VECTOR_BATCH):
+        out = model.get_multi_embeddings(contents[start:start + MULTI_VECTOR_BATCH])
+        sparse.extend(out["sparse"])
+        token_vectors.extend(prune_token_vectors(v, max_tokens).astype(np.float16) for v in out["colbert"])
+    chunk_index.set_sparse(SparseIndex.build(sparse))
+    chunk_index.set_multi_vectors(MultiVectorStore.build(token_vectors, dedup_threshold=None))
+
+
+def _section_key(meta):
+    return meta.get("file_path"), meta.get("section_title", "")
+
+
+def update_chunk_index(chunks, prefix, dtype="float32"):
+    """
+    Incrementally bring the saved index at *prefix* in line with *chunks*.
+
+    Every stored chunk carries a content hash. A new chunk whose text matches
+    a live stored chunk reuses that row and embedding (only its metadata is
+    refreshed); the remaining chunks are embedded and appended, and stored
+    chunks that no longer appear are marked deleted (see
+    ``index_store.update_chunk_rows``). Without an existing index everything
+    is embedded and saved.
+
+    Returns
+    -------
+    dict
+        Counts (``"reused"``, ``"added"``, ``"deleted"``, ``"full"``) plus the
+        embeddings/metadata entering (``"added_*"``) and leaving
+        (``"removed_*"``) each section, for :func:`update_section_reps`.
+        A reused chunk that moved to another section appears in both.
+    """
+    if not os.path.exists(chunk_index_paths(prefix)[1]):
+        model = get_embedding_model()
+        if chunks:
+            embeddings = np.asarray(model.get_embeddings([c["content"] for c in chunks]), dtype=np.float32)
+            embeddings = embeddings.reshape(len(chunks), -1)
+        else:
+            embeddings = np.empty((0, model.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        index = ChunkIndex(embeddings, chunks)
+        save_chunk_index(index, prefix, dtype=dtype)
+        return {"reused": 0, "added": len(chunks), "deleted": 0, "full": True}
+
+    header = load_chunk_header(prefix)
+    old_metadata = header["metadata"]
+    hashes = header.get("content_hashes") or [content_hash(m.get("content", "")) for m in old_metadata]
+    tombstones = set(header.get("tombstones", []))
+    free = {}  # content hash -> live rows not matched yet
+    for row, h in enumerate(hashes):
+        if row not in tombstones:
+            free.setdefault(h, []).append(row)
+
+    metadata = list(old_metadata)
+    keep, moved_rows, moved_metadata, new_chunks = [], [], [], []
+    for chunk in chunks:
+        rows = free.get(content_hash(chunk["content"]))
+        if rows:
+            row = rows.pop(0)
+            keep.append(row)
+            if _section_key(old_metadata[row]) != _section_key(chunk):
+                moved_rows.append(row)
+                moved_metadata.append(chunk)
+            metadata[row] = chunk
+        else:
+            new_chunks.append(chunk)
+    deleted = sorted(row for rows in free.values() for row in rows)
+
+    if new_chunks:
+        new_embeddings = get_embedding_model().get_embeddings([c["content"] for c in new_chunks])
+    else:
+        new_embeddings = np.empty((0, header["shape"][1]), dtype=np.float32)
+    new_rows = update_chunk_rows(prefix, metadata, keep, new_embeddings, new_chunks)
+
+    return {
+        "reused": len(keep),
+        "added": len(new_chunks),
+        "deleted": len(deleted),
+        "full": False,
+        "added_embeddings": read_chunk_rows(prefix, list(new_rows) + moved_rows),
+        "added_metadata": new_chunks + moved_metadata,
+        "removed_embeddings": read_chunk_rows(prefix, deleted + moved_rows),
+        "removed_metadata": [old_metadata[row] for row in deleted + moved_rows],
+    }
+
+
+def refresh_sections(sections_prefix, index_prefix, delta):
+    """
+    Update a saved section store after :func:`update_chunk_index`.
+
+    Stores with running sums are updated through the delta; older stores (or
+    a fully rebuilt index) get their representations rebuilt.
+    """
+    if not os.path.exists(section_store_paths(sections_prefix)[2]):
+        return
+    sections = load_sections(sections_prefix)
+    if not delta["full"] and all("chunk_emb_sum" in sec for sec in sections):
+        update_section_reps(sections, delta["added_embeddings"], delta["added_metadata"],
+                            delta["removed_embeddings"], delta["removed_metadata"])
+    else:
+        sections = [{k: v for k, v in sec.items() if k not in ("title_emb", "avg_chunk_emb", "chunk_emb_sum")}
+                    for sec in sections]
+        sections = build_section_reps(sections, load_chunk_index(index_prefix))
+    save_sections(sections, sections_prefix)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed chunk files and write the binary chunk index.")
+    parser.add_argument("--index", choices=["exact", "ivf", "sq8", "pq"], default="exact",
+                        help="Search backend to build next to each index.")
+    parser.add_argument("--n-lists", type=int, default=None, help="IVF: number of k-means lists.")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF: default lists probed per query.")
+    parser.add_argument("--pq-m", type=int, default=None, help="PQ: sub-quantizers (bytes) per vector.")
+    parser.add_argument("--rerank", type=int, default=0,
+                        help="SQ8/PQ: default number of candidates re-scored with float32 vectors.")
+    parser.add_argument("--multi-vector", action="store_true",
+                        help="Also store bge-m3 sparse weights and token vectors for late-interaction re-ranking "
+                             "(with --incremental every live chunk is re-encoded).")
+    parser.add_argument("--colbert-max-tokens", type=int, default=64,
+                        help="Token vectors kept per chunk in the multi-vector store.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-embed only new/changed chunks of existing indexes and update "
+                             "their section representations in place.")
+    args = parser.parse_args()
+
     chunk_folder = "data/chunks"
     index_folder = "data/index"
     os.makedirs(index_folder, exist_ok=True)
@@ -37,11 +187,36 @@ if __name__ == "__main__":
             with open(path, 'r', encoding='utf-8') as f:
                 chunked_data = json.load(f)
 
-            index_data = build_chunk_index(chunked_data)
-
+            # Binary format: raw float32 matrix + compact metadata (see src/search/index_store.py)
             base_name = os.path.splitext(fname)[0]
-            out_path = os.path.join(index_folder, f"{base_name}_vectors.json")
-            with open(out_path, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
+            out_prefix = os.path.join(index_folder, f"{base_name}_vectors")
+            if args.incremental:
+                delta = update_chunk_index(chunked_data, out_prefix)
+                print(f"{fname}: reused {delta['reused']}, embedded {delta['added']}, deleted {delta['deleted']}")
+                header = load_chunk_header(out_prefix)
+                if len(header.get("tombstones", [])) > COMPACT_RATIO * header["shape"][0]:
+                    compact_chunk_index(out_prefix)
+                doc_name = base_name[:-len("_chunks")]
+                refresh_sections(os.path.join("data", "extracted", f"{doc_name}-sections_with_emb"), out_prefix, delta)
+                chunk_index = load_chunk_index(out_prefix)
+            else:
+                index_data = build_chunk_index(chunked_data)
+                chunk_index = ChunkIndex.from_records(index_data)
+                save_chunk_index(chunk_index, out_prefix)
+            # BM25 postings over the live rows, for hybrid retrieval
+            save_lexical_index(chunk_index, out_prefix)
+            if args.multi_vector:
+                build_multi_vector_index(chunk_index, max_tokens=args.colbert_max_tokens)
+                save_multi_vector_index(chunk_index, out_prefix)
+
+            index_params = {
+                "exact": {},
+                "ivf": {"n_lists": args.n_lists, "nprobe": args.nprobe},
+                "sq8": {"rerank": args.rerank},
+                "pq": {"m": args.pq_m, "rerank": args.rerank},
+            }[args.index]
+            if args.index != "exact":
+                chunk_index.set_backend(build_vector_index(args.index, chunk_index.embeddings, **index_params))
+                save_vector_index(chunk_index, out_prefix)
 
     print("Build index complete.")
@@ -3,15 +3,37 @@
 import json
 import os
 import sys
-from typing import List, Dict, Any
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from src.utils.text_cleaning import basic_clean_text
+from src.inference.embedding_model import DEFAULT_EMBEDDING_MODEL
+from src.utils.text_cleaning import basic_clean_text, split_sentences
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # Tune these two to balance chunk length and redundancy
-CHUNK_SIZE = 1200  # characters per chunk
-OVERLAP = 200  # characters of overlap between consecutive chunks
+CHUNK_SIZE = 1200  # characters per chunk (chunk_text)
+OVERLAP = 200  # characters of overlap between consecutive chunks (chunk_text)
+
+# Token-aware chunking, measured with the embedding model's tokenizer
+CHUNK_TOKENS = 384  # target tokens per chunk
+OVERLAP_TOKENS = 64  # at most this many tokens of trailing sentences are repeated in the next chunk
+CROSS_PAGE = False  # let chunks span page breaks inside a section
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_chunk_tokenizer():
+    """Return the (fast) tokenizer of the embedding model, loading it on first use."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(DEFAULT_EMBEDDING_MODEL, cache_dir="data/hub")
+    return _tokenizer
 
 
 def get_section_of_page(page_num: int, toc: List[List[Any]]) -> str:
@@ -53,6 +75,178 @@ def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
     return chunks
 
 
+def _split_long_sentence(sentence: str, max_tokens: int, tokenizer) -> List[Tuple[str, int]]:
+    """
+    Cut a sentence longer than *max_tokens* at token boundaries.
+
+    A cut piece is re-tokenized on its own and can come out longer than its
+    window (e.g. XLM-R adds a ``"▁"`` where a piece now starts mid-word), so
+    the window shrinks until every piece fits.
+    """
+    offsets = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    window = max_tokens
+    while True:
+        pieces = []
+        for start in range(0, len(offsets), window):
+            span = offsets[start:start + window]
+            piece = sentence[span[0][0]:span[-1][1]].strip()
+            if piece:
+                pieces.append(piece)
+        counts = [len(ids) for ids in tokenizer(pieces, add_special_tokens=False)["input_ids"]] if pieces else []
+        excess = max(counts, default=0) - max_tokens
+        if excess <= 0 or window == 1:
+            return list(zip(pieces, counts))
+        window = max(window - excess, 1)
+
+
+def pack_sentences(sentences: List[str], max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                   tokenizer=None, counts: Optional[List[int]] = None) -> List[Tuple[int, int]]:
+    """
+    Greedily pack consecutive sentences into chunks of at most *max_tokens*.
+
+    Token counts come from one batched call of the embedding tokenizer,
+    unless already known (*counts*, as returned by
+    :func:`split_long_sentences`). Each chunk after the first starts with
+    the trailing sentences of the previous one that fit in *overlap_tokens*.
+    Sentences longer than *max_tokens* must be split beforehand (see
+    :func:`split_long_sentences`).
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        ``(start, stop)`` sentence ranges, one per chunk.
+    """
+    if not sentences:
+        return []
+    if counts is None:
+        tokenizer = tokenizer or get_chunk_tokenizer()
+        counts = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+
+    ranges = []
+    start, total = 0, 0
+    for i, n in enumerate(counts):
+        if i > start and total + n > max_tokens:
+            ranges.append((start, i))
+            # Carry trailing sentences over as overlap, never the whole chunk
+            new_start, carried = i, 0
+            while new_start - 1 > start and carried + counts[new_start - 1] <= overlap_tokens:
+                new_start -= 1
+                carried += counts[new_start]
+            if carried + n > max_tokens:
+                new_start, carried = i, 0
+            start, total = new_start, carried
+        total += n
+    ranges.append((start, len(counts)))
+    return ranges
+
+
+def split_long_sentences(sentences: List[str], max_tokens: int = CHUNK_TOKENS,
+                         tokenizer=None) -> Tuple[List[str], List[int], List[int]]:
+    """
+    Cut sentences longer than *max_tokens* at token boundaries.
+
+    Every sentence is measured with the tokenizer (character length does not
+    bound the token count), and cut pieces are measured again after cutting.
+
+    Returns
+    -------
+    tuple
+        ``(pieces, source, counts)``: the resulting sentences, for each the
+        index of the input sentence it came from, and its token count (to
+        pass on to :func:`pack_sentences`).
+    """
+    if not sentences:
+        return [], [], []
+    tokenizer = tokenizer or get_chunk_tokenizer()
+    token_counts = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+    pieces, source, counts = [], [], []
+    for i, (s, n) in enumerate(zip(sentences, token_counts)):
+        parts = _split_long_sentence(s, max_tokens, tokenizer) if n > max_tokens else [(s, n)]
+        pieces.extend(piece for piece, _ in parts)
+        counts.extend(count for _, count in parts)
+        source.extend([i] * len(parts))
+    return pieces, source, counts
+
+
+def chunk_text_tokens(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                      tokenizer=None) -> List[str]:
+    """
+    Split text into sentence-aligned chunks of at most *max_tokens* embedding
+    tokens, with up to *overlap_tokens* of whole sentences shared between
+    consecutive chunks.
+    """
+    text = basic_clean_text(text)
+    if not text:
+        return []
+    sentences, _, counts = split_long_sentences(split_sentences(text), max_tokens, tokenizer)
+    ranges = pack_sentences(sentences, max_tokens, overlap_tokens, counts=counts)
+    return [" ".join(sentences[a:b]) for a, b in ranges]
+
+
+def _section_runs(pages: Iterable[str], toc: List[List[Any]]) -> Iterator[Tuple[str, List[Tuple[int, str]]]]:
+    """Group consecutive pages that belong to the same section."""
+    run_title, run = None, []
+    for page_idx, text in enumerate(pages):
+        section_title = get_section_of_page(page_idx, toc)
+        if run and section_title != run_title:
+            yield run_title, run
+            run = []
+        run_title = section_title
+        run.append((page_idx, text))
+    if run:
+        yield run_title, run
+
+
+def iter_chunks(pages: Iterable[str], toc: List[List[Any]], pdf_path: str,
+                cross_page: bool = CROSS_PAGE) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk pages as they arrive.
+
+    pages: iterable of page texts in page order (e.g. a generator fed by the
+    extractor); chunk records are yielded page by page.
+
+    Chunks are packed from whole sentences up to ``CHUNK_TOKENS`` tokens of
+    the embedding tokenizer (see :func:`chunk_text_tokens`). With
+    *cross_page*, the pages of a section are chunked as one text, so
+    sentences broken by a page boundary stay together; such records are
+    yielded when the section ends, carry the first page as ``page_idx`` and
+    the last one as ``page_end``.
+    """
+    if not cross_page:
+        for page_idx, text in enumerate(pages):
+            section_title = get_section_of_page(page_idx, toc)
+            # chunkify
+            splitted = chunk_text_tokens(text)
+            for c_i, c_text in enumerate(splitted):
+                yield {
+                    "file_path": pdf_path,
+                    "page_idx": page_idx,
+                    "section_title": section_title,
+                    "chunk_index": c_i,
+                    "content": c_text
+                }
+        return
+
+    for section_title, run in _section_runs(pages, toc):
+        sentences, sentence_pages = [], []
+        for page_idx, text in run:
+            page_sentences = split_sentences(basic_clean_text(text))
+            sentences.extend(page_sentences)
+            sentence_pages.extend([page_idx] * len(page_sentences))
+        sentences, source, counts = split_long_sentences(sentences)
+        sentence_pages = [sentence_pages[i] for i in source]
+        ranges = pack_sentences(sentences, counts=counts)
+        for c_i, (a, b) in enumerate(ranges):
+            yield {
+                "file_path": pdf_path,
+                "page_idx": sentence_pages[a],
+                "page_end": sentence_pages[b - 1],
+                "section_title": section_title,
+                "chunk_index": c_i,
+                "content": " ".join(sentences[a:b])
+            }
+
+
 def process_extracted_file(json_data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
     json_data: {
@@ -61,24 +255,7 @@ def process_extracted_file(json_data: Dict[str, Any]) -> List[Dict[str, Any]]:
       "pages_text": ["page0 text", "page1 text", ...]
     }
     """
-    pdf_path = json_data["file_path"]
-    toc = json_data["toc"]
-    pages_text = json_data["pages_text"]
-
-    chunked_result = []
-    for page_idx, text in enumerate(pages_text):
-        section_title = get_section_of_page(page_idx, toc)
-        # chunkify
-        splitted = chunk_text(text, CHUNK_SIZE, OVERLAP)
-        for c_i, c_text in enumerate(splitted):
-            chunked_result.append({
-                "file_path": pdf_path,
-                "page_idx": page_idx,
-                "section_title": section_title,
-                "chunk_index": c_i,
-                "content": c_text
-            })
-    return chunked_result
+    return list(iter_chunks(json_data["pages_text"], json_data["toc"], json_data["file_path"]))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,33 @@
+# scripts/convert_index.py
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.search.index_store import convert_json_chunk_index, convert_json_sections
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert JSON chunk indexes and section files to the memory-mappable binary format."
+    )
+    parser.add_argument("--index-folder", default="data/index")
+    parser.add_argument("--sections-folder", default="data/extracted")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    for fname in os.listdir(args.index_folder):
+        if fname.endswith("_chunks_vectors.json"):
+            path = os.path.join(args.index_folder, fname)
+            prefix = os.path.splitext(path)[0]
+            convert_json_chunk_index(path, prefix, dtype=args.dtype)
+            print(f"Converted {path} -> {prefix}.emb")
+
+    for fname in os.listdir(args.sections_folder):
+        if fname.endswith("sections_with_emb.json"):
+            path = os.path.join(args.sections_folder, fname)
+            prefix = os.path.splitext(path)[0]
+            convert_json_sections(path, prefix, dtype=args.dtype)
+            print(f"Converted {path} -> {prefix}.title.emb")
+
+    print("Index conversion complete.")
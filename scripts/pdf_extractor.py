@@ -2,9 +2,14 @@
 
 import io
 import json
+import multiprocessing
 import os
+import signal
 import sys
-from typing import Dict, Any, List
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 import cv2
 import fitz  # PyMuPDF
@@ -14,7 +19,6 @@ import pdfplumber
 import pytesseract
 from PIL import Image
 from pdfminer.pdfparser import PDFSyntaxError
-from sklearn.cluster import KMeans
 
 
 def build_sections_from_toc(toc: List[List], total_pages: int) -> List[Dict[str, Any]]:
@@ -87,8 +91,120 @@ def build_sections_from_layout(pdf_path: str,
 # ────────────────────────────────────────────────
 # OCR and multi‑column handling helpers
 # ────────────────────────────────────────────────
+OCR_LOW_DPI = 200  # first OCR pass; pages are re-read at ``ocr_dpi`` only when it is not confident
+OCR_MIN_CONF = 70.0  # mean word confidence (0-100) below which the page is OCRed again at full DPI
+OCR_CONFIG = "--oem 1 --psm 3 -c preserve_interword_spaces=1"
+
+
+def render_page_gray(page, dpi: int) -> Tuple[np.ndarray, Any]:
+    """
+    Render *page* as an 8-bit grayscale image.
+
+    The array is a view of the pixmap's sample buffer (no PNG round trip or
+    copy); the pixmap is returned alongside it and must be kept alive while
+    the array is in use.
+    """
+    zoom = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    img = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return img, pix
+
+
+def detect_text_regions(binary: np.ndarray, dpi: int, min_height_in: float = 0.03) -> np.ndarray:
+    """
+    Find blocks of text in a binarized page (black text on white).
+
+    Ink is smeared horizontally across word gaps and vertically across line
+    gaps, and the bounding boxes of the resulting connected components are
+    returned as an ``(n, 4)`` array of pixel ``x0, y0, x1, y1``. Components
+    shorter than *min_height_in* inches (speckle, rules) are dropped.
+    """
+    ink = cv2.bitwise_not(binary)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(int(dpi * 0.12), 1), max(int(dpi * 0.05), 1)))
+    blobs = cv2.dilate(ink, kernel)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(blobs, connectivity=8)
+    stats = stats[1:]  # label 0 is the background
+    stats = stats[stats[:, cv2.CC_STAT_HEIGHT] >= min_height_in * dpi]
+    x0, y0 = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    return np.stack([x0, y0, x0 + stats[:, cv2.CC_STAT_WIDTH], y0 + stats[:, cv2.CC_STAT_HEIGHT]], axis=1)
+
+
+def _ocr_words(img: np.ndarray, lang: str, scale: float,
+               offset: Tuple[int, int] = (0, 0)) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """Run Tesseract on *img*; return word boxes in PDF points, texts and confidences."""
+    data = pytesseract.image_to_data(Image.fromarray(img), lang=lang, config=OCR_CONFIG,
+                                     output_type=pytesseract.Output.DICT)
+    conf = np.asarray(data["conf"], dtype=np.float64)
+    texts = [str(t).strip() for t in data["text"]]
+    keep = np.flatnonzero((conf != -1) & np.array([bool(t) for t in texts], dtype=bool))
+    left = np.asarray(data["left"], dtype=np.float64)[keep] + offset[0]
+    top = np.asarray(data["top"], dtype=np.float64)[keep] + offset[1]
+    width = np.asarray(data["width"], dtype=np.float64)[keep]
+    height = np.asarray(data["height"], dtype=np.float64)[keep]
+    boxes = np.stack([left, top, left + width, top + height], axis=1) * scale
+    return boxes, [texts[i] for i in keep], conf[keep]
+
+
+def _ocr_regions(page, dpi: int, lang: str) -> Tuple[np.ndarray, List[str], np.ndarray, int]:
+    """OCR the text regions of *page* rendered at *dpi* in a single Tesseract call."""
+    gray, pix = render_page_gray(page, dpi)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    del gray, pix
+    regions = detect_text_regions(binary, dpi)
+    if len(regions) == 0:
+        return np.empty((0, 4)), [], np.empty(0), 0
+
+    # Blank everything outside the regions (figures, speckle, margins) and
+    # crop to their union, so Tesseract only reads text blocks.
+    masked = np.full_like(binary, 255)
+    for x0, y0, x1, y1 in regions:
+        masked[y0:y1, x0:x1] = binary[y0:y1, x0:x1]
+    ux0, uy0 = regions[:, :2].min(axis=0)
+    ux1, uy1 = regions[:, 2:].max(axis=0)
+    boxes, texts, conf = _ocr_words(masked[uy0:uy1, ux0:ux1], lang, 72 / dpi, offset=(ux0, uy0))
+    return boxes, texts, conf, len(regions)
+
+
+def _mean_conf(texts: List[str], conf: np.ndarray) -> float:
+    """Character-weighted mean word confidence (0 when nothing was read)."""
+    if not texts:
+        return 0.0
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.float64, count=len(texts))
+    return float((conf * lengths).sum() / lengths.sum())
+
+
+def ocr_page_fast(page, dpi: int = 350, lang: str = "kor+eng", low_dpi: int = OCR_LOW_DPI,
+                  min_conf: float = OCR_MIN_CONF) -> Tuple[np.ndarray, List[str], Dict[str, Any]]:
+    """
+    OCR a page without a text layer, reading only its text regions.
+
+    The page is first rendered at *low_dpi*; it is rendered again at *dpi*
+    only when the mean word confidence is below *min_conf*, and the more
+    confident of the two readings is kept.
+
+    Returns
+    -------
+    tuple
+        ``(boxes, texts, info)``: an ``(n_words, 4)`` array of word boxes in
+        PDF points (the same units as ``page.get_text("words")``), the word
+        strings and ``{"dpi", "mean_conf", "regions", "escalated"}`` for
+        measuring recognition quality.
+    """
+    passes = [low_dpi, dpi] if low_dpi < dpi else [dpi]
+    best = None
+    for pass_dpi in passes:
+        boxes, texts, conf, n_regions = _ocr_regions(page, pass_dpi, lang)
+        mean_conf = _mean_conf(texts, conf)
+        if best is None or mean_conf > best[2]["mean_conf"]:
+            best = (boxes, texts, {"dpi": pass_dpi, "mean_conf": mean_conf, "regions": n_regions,
+                                   "escalated": pass_dpi != passes[0]})
+        if n_regions == 0 or mean_conf >= min_conf:
+            break
+    return best
+
+
 def ocr_page_words(page, dpi: int = 350, lang: str = "kor+eng") -> pd.DataFrame:
-    """Render a page to high‑DPI PNG and return a DataFrame of word boxes."""
+    """Render a page to high‑DPI PNG and return a DataFrame of word boxes (legacy full-page OCR)."""
     zoom = dpi / 72
     pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
     img = Image.open(io.BytesIO(pix.tobytes("png")))
@@ -121,7 +237,9 @@ def is_multicol(df: pd.DataFrame, page_width: float, gap_ratio_thr: float = 0.15
 
 
 def assign_columns_kmeans(df: pd.DataFrame, max_cols: int = 3) -> pd.DataFrame:
-    """Cluster words into columns using 1‑D KMeans and label them."""
+    """Cluster words into columns using 1‑D KMeans and label them (legacy layout engine)."""
+    from sklearn.cluster import KMeans
+
     k = min(max_cols, len(df))
     km = KMeans(n_clusters=k, n_init="auto").fit(
         ((df.x0 + df.x1) / 2).to_numpy().reshape(-1, 1)
@@ -133,7 +251,7 @@ def assign_columns_kmeans(df: pd.DataFrame, max_cols: int = 3) -> pd.DataFrame:
 
 
 def rebuild_text_from_columns(df: pd.DataFrame, line_tol: int = 8) -> str:
-    """Reconstruct reading order: left‑to‑right columns, then top‑to‑bottom."""
+    """Reconstruct reading order: left‑to‑right columns, then top‑to‑bottom (legacy layout engine)."""
     lines = []
     for col in sorted(df.col.unique()):
         col_df = df[df.col == col].sort_values(["y0", "x0"])
@@ -150,40 +268,262 @@ def rebuild_text_from_columns(df: pd.DataFrame, line_tol: int = 8) -> str:
     return "\n".join(lines)
 
 
-def extract_pdf_content(pdf_path: str,
-                        ocr_lang: str = "kor+eng",
-                        ocr_dpi: int = 350) -> Dict[str, Any]:
-    """Extract text from a PDF with optional OCR and column reordering."""
-    doc = fitz.open(pdf_path)
-    total_pages = len(doc)
-    pages_text: List[str] = []
+# ────────────────────────────────────────────────
+# Vectorized layout engine (NumPy)
+# ────────────────────────────────────────────────
+def assign_columns_gaps(centers: np.ndarray, page_width: float, gap_ratio_thr: float = 0.15,
+                        max_cols: int = 3) -> np.ndarray:
+    """
+    Label words with a column id (0 = leftmost) by cutting the sorted word
+    centers at horizontal gaps wider than ``gap_ratio_thr * page_width``.
+    At most the ``max_cols - 1`` widest gaps are used.
+    """
+    order = np.argsort(centers, kind="stable")
+    gaps = np.diff(centers[order])
+    cuts = np.flatnonzero(gaps > gap_ratio_thr * page_width)
+    if len(cuts) > max_cols - 1:
+        cuts = np.sort(cuts[np.argsort(-gaps[cuts], kind="stable")[:max_cols - 1]])
+    starts = np.zeros(len(centers), dtype=np.int64)
+    starts[cuts + 1] = 1
+    cols = np.empty(len(centers), dtype=np.int64)
+    cols[order] = np.cumsum(starts)
+    return cols
+
+
+def layout_text(boxes: np.ndarray, texts: List[str], page_width: float, line_tol: float = 8,
+                gap_ratio_thr: float = 0.15, max_cols: int = 3) -> str:
+    """
+    Reading-order text of a page from its word boxes, without per-word Python loops.
+
+    Parameters
+    ----------
+    boxes : np.ndarray
+        ``(n_words, 4)`` array of ``x0, y0, x1, y1``.
+    texts : list[str]
+        Word strings, parallel to *boxes*.
+    page_width : float
+        Width of the page in the units of *boxes*.
+
+    Notes
+    -----
+    Same rules as :func:`is_multicol` / :func:`rebuild_text_from_columns`:
+    a page is multi-column when it has at least 30 words and a gap between
+    word centers wider than ``gap_ratio_thr`` of the page width. Multi-column
+    pages are read column by column; words are ordered by ``(y0, x0)`` and a
+    new line starts when ``y0`` jumps by more than *line_tol* from the
+    previous word. Single-column pages are joined with spaces.
+    """
+    n = len(texts)
+    if n == 0:
+        return ""
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    words = [t if isinstance(t, str) else str(t) for t in texts]
+
+    centers = (x0 + boxes[:, 2]) / 2
+    multicol = n >= 30 and np.diff(np.sort(centers)).max() / page_width > gap_ratio_thr
+    if not multicol:
+        return " ".join(words[i] for i in np.lexsort((x0, y0)))
+
+    cols = assign_columns_gaps(centers, page_width, gap_ratio_thr, max_cols)
+    order = np.lexsort((x0, y0, cols))
+    ys, cs = y0[order], cols[order]
+    new_line = np.ones(n, dtype=bool)
+    new_line[1:] = (cs[1:] != cs[:-1]) | (np.abs(np.diff(ys)) > line_tol)
+    bounds = np.append(np.flatnonzero(new_line), n)
+    ordered = [words[i] for i in order]
+    return "\n".join(" ".join(ordered[a:b]) for a, b in zip(bounds[:-1], bounds[1:]))
+
+
+def extract_page_text(page, ocr_lang: str = "kor+eng", ocr_dpi: int = 350, layout: str = "numpy",
+                      ocr_info: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Extract the text of one page, OCRing it when it has no text layer and reordering columns.
 
-    for i in range(total_pages):
-        page = doc[i]
-        raw_text = page.get_text("text").strip()
+    *layout* selects the reading-order engine: ``"numpy"`` (vectorized,
+    :func:`layout_text`, with region-level OCR by :func:`ocr_page_fast`) or
+    ``"kmeans"`` (the original pandas/scikit-learn path with full-page OCR).
+    When the numpy path OCRs the page, *ocr_info* (if given) is updated with
+    the ``{"dpi", "mean_conf", "regions", "escalated"}`` of the kept reading.
+    """
+    raw_text = page.get_text("text").strip()
 
-        # Build a DataFrame of word boxes
+    if layout == "numpy":
         if raw_text:
             words = page.get_text("words")
-            words_df = pd.DataFrame(
-                words,
-                columns=["x0", "y0", "x1", "y1", "text", "_b", "_l", "_w"]
-            )[["x0", "y0", "x1", "y1", "text"]]
+            boxes = np.array([w[:4] for w in words], dtype=np.float64).reshape(-1, 4)
+            texts = [w[4] for w in words]
         else:
-            words_df = ocr_page_words(page, dpi=ocr_dpi, lang=ocr_lang)
+            boxes, texts, info = ocr_page_fast(page, dpi=ocr_dpi, lang=ocr_lang)
+            if ocr_info is not None:
+                ocr_info.update(info)
+        return layout_text(boxes, texts, page.rect.width)
+
+    # Build a DataFrame of word boxes
+    if raw_text:
+        words = page.get_text("words")
+        words_df = pd.DataFrame(
+            words,
+            columns=["x0", "y0", "x1", "y1", "text", "_b", "_l", "_w"]
+        )[["x0", "y0", "x1", "y1", "text"]]
+    else:
+        words_df = ocr_page_words(page, dpi=ocr_dpi, lang=ocr_lang)
+
+    # Determine layout and rebuild text accordingly
+    if is_multicol(words_df, page.rect.width):
+        words_df = assign_columns_kmeans(words_df, max_cols=3)
+        return rebuild_text_from_columns(words_df)
+    return " ".join(
+        w.text for _, w in
+        words_df.sort_values(["y0", "x0"]).iterrows()
+    )
 
-        # Determine layout and rebuild text accordingly
-        if is_multicol(words_df, page.rect.width):
-            words_df = assign_columns_kmeans(words_df, max_cols=3)
-            page_text = rebuild_text_from_columns(words_df)
-        else:
-            page_text = " ".join(
-                w.text for _, w in
-                words_df.sort_values(["y0", "x0"]).iterrows()
-            )
-        pages_text.append(page_text)
 
-    toc = doc.get_toc(simple=True)  # using get_toc
+# Extra seconds a worker gets on top of the per-page timeouts of a page range
+PAGE_TIMEOUT_GRACE = 10.0
+
+
+class PageTimeout(Exception):
+    pass
+
+
+class TimedOutPage(str):
+    """
+    Empty text standing in for a page whose extraction timed out.
+
+    It chunks like any empty page, but callers can tell it from a page that
+    really has no text (``isinstance(text, TimedOutPage)``) and avoid
+    caching the result.
+    """
+
+
+@contextmanager
+def _page_deadline(seconds: Optional[float]):
+    """
+    Raise :class:`PageTimeout` if the block runs longer than *seconds*.
+
+    Uses ``SIGALRM``, so it only applies in the main thread of a process on
+    Unix (which is where pool workers run); elsewhere it is a no-op, which is
+    why :func:`iter_pages_text` always uses the pool when a timeout is set.
+    """
+    if (not seconds or not hasattr(signal, "SIGALRM")
+            or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def _raise(signum, frame):
+        raise PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, _raise)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _iter_page_range(pdf_path: str, start: int, stop: int, ocr_lang: str, ocr_dpi: int,
+                     page_timeout: Optional[float]) -> Iterator[str]:
+    """Open *pdf_path* independently and yield the text of pages ``start:stop``."""
+    doc = fitz.open(pdf_path)
+    try:
+        for i in range(start, stop):
+            ocr_info = {}
+            try:
+                with _page_deadline(page_timeout):
+                    text = extract_page_text(doc[i], ocr_lang=ocr_lang, ocr_dpi=ocr_dpi, ocr_info=ocr_info)
+            except PageTimeout:
+                print(f"[WARN] Page {i + 1} of '{pdf_path}' exceeded {page_timeout}s; skipped.")
+                text = TimedOutPage()
+            if ocr_info.get("regions") and ocr_info["mean_conf"] < OCR_MIN_CONF:
+                print(f"[WARN] Page {i + 1} of '{pdf_path}' OCRed with low confidence "
+                      f"({ocr_info['mean_conf']:.0f} at {ocr_info['dpi']} dpi); text may be unreliable.")
+            yield text
+    finally:
+        doc.close()
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int, ocr_lang: str, ocr_dpi: int,
+                        page_timeout: Optional[float]) -> List[str]:
+    """Worker: extract pages ``start:stop`` (see :func:`_iter_page_range`)."""
+    return list(_iter_page_range(pdf_path, start, stop, ocr_lang, ocr_dpi, page_timeout))
+
+
+def iter_pages_text(pdf_path: str, total_pages: int, ocr_lang: str = "kor+eng", ocr_dpi: int = 350,
+                    workers: Optional[int] = None, page_timeout: Optional[float] = None,
+                    pages_per_task: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the text of every page, in page order, as soon as it is extracted.
+
+    Parameters
+    ----------
+    pdf_path : str
+        PDF to read.
+    total_pages : int
+        Number of pages in the document.
+    ocr_lang, ocr_dpi
+        Passed to :func:`ocr_page_words` for pages without a text layer.
+    workers : int, optional
+        Number of worker processes (``None`` = CPU count). With ``1`` and no
+        *page_timeout* pages are extracted in this process.
+    page_timeout : float, optional
+        Seconds allowed per page; a page that takes longer is yielded as an
+        empty :class:`TimedOutPage`.
+    pages_per_task : int, optional
+        Size of the page ranges handed to workers. By default every worker
+        gets about four ranges, so one slow (scanned) range does not leave
+        the others idle.
+    """
+    workers = min(workers or os.cpu_count() or 1, max(total_pages, 1))
+    if workers <= 1 and not page_timeout:
+        yield from _iter_page_range(pdf_path, 0, total_pages, ocr_lang, ocr_dpi, page_timeout)
+        return
+
+    step = pages_per_task or max(1, -(-total_pages // (workers * 4)))
+    starts = list(range(0, total_pages, step))
+    stops = [min(start + step, total_pages) for start in starts]
+    # Workers are started fresh rather than forked: the caller (web demo,
+    # API server) may be running other threads, whose locks a fork would copy.
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+    stuck = False
+    try:
+        # Each worker opens its own fitz document; futures are read in page order
+        futures = [executor.submit(_extract_page_range, pdf_path, start, stop, ocr_lang, ocr_dpi, page_timeout)
+                   for start, stop in zip(starts, stops)]
+        for future, start, stop in zip(futures, starts, stops):
+            # The in-worker alarm cannot interrupt native code (rendering,
+            # OCR), so a range also gets a hard limit, counted from when the
+            # consumer starts waiting for it.
+            limit = page_timeout * (stop - start) + PAGE_TIMEOUT_GRACE if page_timeout else None
+            try:
+                texts = future.result(timeout=limit)
+            except FutureTimeout:
+                print(f"[WARN] Pages {start + 1}-{stop} of '{pdf_path}' exceeded {limit:.0f}s; skipped.")
+                future.cancel()
+                stuck = True
+                texts = [TimedOutPage() for _ in range(start, stop)]
+            yield from texts
+    finally:
+        # A consumer that stops early should not wait for the remaining
+        # ranges, and nobody should wait for a stuck worker.
+        executor.shutdown(wait=not stuck, cancel_futures=True)
+
+
+def extract_pages_text(pdf_path: str, total_pages: int, ocr_lang: str = "kor+eng", ocr_dpi: int = 350,
+                       workers: Optional[int] = None, page_timeout: Optional[float] = None,
+                       pages_per_task: Optional[int] = None) -> List[str]:
+    """Return the text of every page in page order (see :func:`iter_pages_text`)."""
+    return list(iter_pages_text(pdf_path, total_pages, ocr_lang=ocr_lang, ocr_dpi=ocr_dpi, workers=workers,
+                                page_timeout=page_timeout, pages_per_task=pages_per_task))
+
+
+def build_sections(pdf_path: str, toc: List[List], total_pages: int) -> List[Dict[str, Any]]:
+    """
+    Section list for a document: from its TOC when present, otherwise from
+    heading-sized fonts, otherwise one section per page.
+    """
     if toc:
         sections = build_sections_from_toc(toc, total_pages)
     else:
@@ -196,6 +536,33 @@ def extract_pdf_content(pdf_path: str,
                 "method": "Page-based"
             } for i in range(total_pages)]
 
+    # Tag sections with their source document so chunk lookups can tell
+    # equal titles from different PDFs apart
+    for sec in sections:
+        sec["file_path"] = pdf_path
+    return sections
+
+
+def extract_pdf_content(pdf_path: str,
+                        ocr_lang: str = "kor+eng",
+                        ocr_dpi: int = 350,
+                        workers: Optional[int] = 1,
+                        page_timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Extract text from a PDF with optional OCR and column reordering.
+
+    With *workers* > 1 (or ``None`` for one per CPU) pages are extracted in
+    a process pool, see :func:`extract_pages_text`; *page_timeout* bounds
+    the time spent on a single page.
+    """
+    doc = fitz.open(pdf_path)
+    total_pages = len(doc)
+    pages_text = extract_pages_text(pdf_path, total_pages, ocr_lang=ocr_lang, ocr_dpi=ocr_dpi,
+                                    workers=workers, page_timeout=page_timeout)
+
+    toc = doc.get_toc(simple=True)  # using get_toc
+    sections = build_sections(pdf_path, toc, total_pages)
+
     return {
         "file_path": pdf_path,
         "toc": toc,
@@ -229,7 +596,7 @@ if __name__ == "__main__":
             pdf_path = os.path.join(pdf_folder, selected_file)
             print(f"Processing file: {selected_file}")
 
-            extracted_data = extract_pdf_content(pdf_path)
+            extracted_data = extract_pdf_content(pdf_path, workers=None)
 
             base_name = os.path.splitext(selected_file)[0]
             output_json = os.path.join(output_folder, f"{base_name}.json")
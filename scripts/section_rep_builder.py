@@ -2,8 +2,12 @@
 import json
 import os
 import sys
+
 import numpy as np
-from src.inference.embedding_model import embedding_model
+
+from src.inference.embedding_model import get_embedding_model
+from src.search.chunk_index import ChunkIndex
+from src.search.index_store import chunk_index_paths, load_chunk_index, save_sections
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -14,39 +18,88 @@ def build_section_reps(sections, chunk_index):
       { "title": "2장 설치방법", "start_page":10, "end_page":19, ... },
       ...
     ]
-    chunk_index: [{ "embedding": [...], "metadata": {"section_title": "...", ...}}, ...]
+    chunk_index: ChunkIndex 또는 [{ "embedding": [...], "metadata": {"section_title": "...", ...}}, ...]
 
     => 각 섹션에
        sec["title_emb"], sec["avg_chunk_emb"] 필드를 추가해 반환
+       (증분 갱신용으로 sec["chunk_emb_sum"], sec["chunk_count"] 도 함께 저장)
     """
+    if isinstance(chunk_index, list):
+        chunk_index = ChunkIndex.from_records(chunk_index)
+
     # 1) 섹션 제목 임베딩 (batch)
     titles = [sec["title"] for sec in sections]
-    title_embs = embedding_model.get_embeddings(titles)  # shape: (num_sections, dim)
+    title_embs = get_embedding_model().get_embeddings(titles)  # shape: (num_sections, dim)
     for i, sec in enumerate(sections):
         sec["title_emb"] = title_embs[i].tolist()
 
-    # 2) 섹션별 청크 모으기
-    section2embs = {}
-    for item in chunk_index:
-        sec_t = item["metadata"]["section_title"]
-        emb = item["embedding"]  # list[float]
-        if sec_t not in section2embs:
-            section2embs[sec_t] = []
-        section2embs[sec_t].append(emb)
-
-    # 3) 섹션 내부 청크들의 평균 임베딩
+    # 2) 섹션 내부 청크들의 평균 임베딩 (섹션 -> 행 매핑 사용)
     for sec in sections:
-        stitle = sec["title"]
-        if stitle not in section2embs:
+        rows = chunk_index.rows_for_sections([sec])
+        if len(rows) == 0:
             sec["avg_chunk_emb"] = None
+            sec["chunk_emb_sum"] = None
+            sec["chunk_count"] = 0
         else:
-            arr = np.array(section2embs[stitle])  # shape: (num_chunks, emb_dim)
-            avg_vec = arr.mean(axis=0)  # (emb_dim,)
-            sec["avg_chunk_emb"] = avg_vec.tolist()
+            arr = chunk_index.embeddings[rows].astype("float32")  # shape: (num_chunks, emb_dim)
+            total = arr.sum(axis=0)
+            sec["avg_chunk_emb"] = (total / len(rows)).tolist()
+            sec["chunk_emb_sum"] = total.tolist()
+            sec["chunk_count"] = int(len(rows))
 
     return sections
 
 
+def update_section_reps(sections, added_embeddings, added_metadata, removed_embeddings, removed_metadata):
+    """
+    Incrementally update ``avg_chunk_emb`` after chunks were added/removed.
+
+    Each section keeps a running ``chunk_emb_sum`` and ``chunk_count`` (set by
+    :func:`build_section_reps`); added chunk embeddings are added to the sum
+    of their section and removed ones subtracted, and only the touched
+    sections get a new average. A chunk belongs to a section when its
+    ``section_title`` equals the section title and, if the section has a
+    ``file_path``, it comes from that file.
+
+    Returns
+    -------
+    list[int]
+        Indices of the updated sections.
+    """
+    by_title = {}
+    for i, sec in enumerate(sections):
+        by_title.setdefault(sec["title"], []).append(i)
+
+    sums = {}
+
+    def apply(embeddings, metadata, sign):
+        for emb, meta in zip(embeddings, metadata):
+            for i in by_title.get(meta.get("section_title", ""), []):
+                sec = sections[i]
+                if sec.get("file_path") is not None and sec["file_path"] != meta.get("file_path"):
+                    continue
+                if i not in sums:
+                    base = sec.get("chunk_emb_sum")
+                    sums[i] = np.zeros(len(emb), dtype=np.float32) if base is None \
+                        else np.array(base, dtype=np.float32)
+                sums[i] += sign * np.asarray(emb, dtype=np.float32)
+                sec["chunk_count"] = sec.get("chunk_count", 0) + sign
+
+    apply(added_embeddings, added_metadata, 1)
+    apply(removed_embeddings, removed_metadata, -1)
+
+    for i, total in sums.items():
+        sec = sections[i]
+        if sec["chunk_count"] > 0:
+            sec["chunk_emb_sum"] = total.tolist()
+            sec["avg_chunk_emb"] = (total / sec["chunk_count"]).tolist()
+        else:
+            sec["chunk_count"] = 0
+            sec["chunk_emb_sum"] = None
+            sec["avg_chunk_emb"] = None
+    return sorted(sums)
+
+
 if __name__ == "__main__":
     section_jsons = [f for f in os.listdir(os.path.join("../data", "extracted")) if f.lower().endswith("sections.json")]
 
@@ -55,21 +108,23 @@ if __name__ == "__main__":
         chunk_json_name = section_json_name.split('-')[0]
         # 예시: data/extracted/sections.json (목차 기반 섹션 정보)
         sections = f"../data/extracted/{section_json}"
-        # 예시: data/index/sample_chunks_vectors.json (청크 임베딩)
-        chunk_index_json = f"../data/index/{chunk_json_name}_chunks_vectors.json"
+        # 예시: data/index/sample_chunks_vectors (청크 임베딩, 바이너리 포맷)
+        chunk_index_prefix = f"../data/index/{chunk_json_name}_chunks_vectors"
 
         with open(sections, 'r', encoding='utf-8') as f:
             sections_data = json.load(f)
 
-        with open(chunk_index_json, 'r', encoding='utf-8') as f:
-            chunk_index_data = json.load(f)
+        if os.path.exists(chunk_index_paths(chunk_index_prefix)[1]):
+            chunk_index_data = load_chunk_index(chunk_index_prefix)
+        else:
+            with open(f"{chunk_index_prefix}.json", 'r', encoding='utf-8') as f:
+                chunk_index_data = json.load(f)
 
         # 섹션 대표 벡터 생성
         updated_sections = build_section_reps(sections_data, chunk_index_data)
 
-        # 저장(예: data/extracted/sections_with_emb.json)
-        out_path = f"../data/extracted/{section_json_name}_with_emb.json"
-        with open(out_path, 'w', encoding='utf-8') as f:
-            json.dump(updated_sections, f, ensure_ascii=False, indent=2)
+        # 저장(예: data/extracted/sections_with_emb.meta.json + *.emb)
+        out_prefix = f"../data/extracted/{section_json_name}_with_emb"
+        save_sections(updated_sections, out_prefix)
 
         print("Section reps built and saved.")
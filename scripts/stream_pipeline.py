@@ -0,0 +1,247 @@
+# scripts/stream_pipeline.py
+
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts import chunker, pdf_extractor, section_rep_builder
+from src.inference.embedding_model import DEFAULT_EMBEDDING_MODEL, get_embedding_model
+from src.search.chunk_index import ChunkIndex
+from src.search.index_store import (load_chunk_index, load_sections, save_chunk_index, save_lexical_index,
+                                    save_sections)
+from src.utils.content_cache import ContentCache, DiscardEntry, file_sha256
+
+EMBED_BATCH_SIZE = 64  # chunks embedded per model call
+PAGE_QUEUE_SIZE = 8  # extracted pages waiting to be chunked
+CHUNK_QUEUE_SIZE = 256  # chunks waiting to be embedded
+
+# Bump when extraction or chunking changes so stale cache entries are not reused
+EXTRACT_VERSION = "2"
+PIPELINE_VERSION = "2"
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    Iterate *iterable* on a background thread, handing items over through a
+    bounded queue.
+
+    The producer runs ahead of the consumer by at most *maxsize* items, so
+    two stages overlap without either materializing its whole output. An
+    exception in the producer is re-raised in the consumer; closing the
+    returned generator stops the producer.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:  # noqa: BLE001 - handed to the consumer
+            put((_DONE, e))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_embedded_batches(pdf_path: str, toc: List[List[Any]], total_pages: int,
+                          batch_size: int = EMBED_BATCH_SIZE, workers: Optional[int] = None,
+                          page_timeout: Optional[float] = None, ocr_lang: str = "kor+eng",
+                          ocr_dpi: int = 350, pages: Optional[Iterable[str]] = None,
+                          ) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+    """
+    Stream a PDF through extraction → chunking → embedding.
+
+    Pages are extracted (in a process pool, see
+    :func:`pdf_extractor.iter_pages_text`) on one thread and chunked on
+    another, connected by bounded queues, while this generator embeds full
+    batches of chunks. OCR of later pages therefore overlaps with embedding
+    of earlier ones. Page texts that are already known (e.g. from the
+    content cache) can be passed as *pages* to skip extraction.
+
+    Yields
+    ------
+    tuple
+        ``(embeddings, chunks)``: a ``(batch, dim)`` float32 matrix and the
+        matching chunk records.
+    """
+    if pages is None:
+        pages = pdf_extractor.iter_pages_text(pdf_path, total_pages, ocr_lang=ocr_lang, ocr_dpi=ocr_dpi,
+                                              workers=workers, page_timeout=page_timeout)
+    pages = prefetch(pages, PAGE_QUEUE_SIZE)
+    chunks = prefetch(chunker.iter_chunks(pages, toc, pdf_path), CHUNK_QUEUE_SIZE)
+    model = get_embedding_model()
+    try:
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                yield np.asarray(model.get_embeddings([c["content"] for c in batch]), dtype=np.float32), batch
+                batch = []
+        if batch:
+            yield np.asarray(model.get_embeddings([c["content"] for c in batch]), dtype=np.float32), batch
+    finally:
+        chunks.close()
+        pages.close()
+
+
+def index_pdf_streaming(pdf_path: str, batch_size: int = EMBED_BATCH_SIZE, workers: Optional[int] = None,
+                        page_timeout: Optional[float] = None, ocr_lang: str = "kor+eng",
+                        ocr_dpi: int = 350, pages: Optional[Iterable[str]] = None,
+                        ) -> Tuple[List[Dict[str, Any]], ChunkIndex]:
+    """
+    Build the sections and chunk index of a PDF with the streaming pipeline.
+
+    Equivalent to ``extract_pdf_content`` → ``process_extracted_file`` →
+    ``build_chunk_index`` → ``build_section_reps``, but pages never pile up
+    in memory, embeddings are kept as float32 matrices instead of Python
+    lists, and the section layout scan runs alongside the page stream.
+    *pages* replaces extraction with known page texts.
+
+    Returns
+    -------
+    tuple
+        ``(sections, chunk_index)`` with ``title_emb``/``avg_chunk_emb`` set
+        on every section.
+    """
+    doc = fitz.open(pdf_path)
+    total_pages = len(doc)
+    toc = doc.get_toc(simple=True)
+    doc.close()
+
+    embeddings, metadata = [], []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        sections_future = executor.submit(pdf_extractor.build_sections, pdf_path, toc, total_pages)
+        for batch_embs, batch_chunks in iter_embedded_batches(pdf_path, toc, total_pages, batch_size=batch_size,
+                                                              workers=workers, page_timeout=page_timeout,
+                                                              ocr_lang=ocr_lang, ocr_dpi=ocr_dpi, pages=pages):
+            embeddings.append(batch_embs)
+            metadata.extend(batch_chunks)
+        sections = sections_future.result()
+
+    matrix = np.concatenate(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+    chunk_index = ChunkIndex(matrix, metadata)
+    sections = section_rep_builder.build_section_reps(sections, chunk_index)
+    return sections, chunk_index
+
+
+def _tee_lines(items: Iterable[str], path: str) -> Iterator[str]:
+    """Yield *items* unchanged while writing each one as a JSON line to *path*."""
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            yield item
+
+
+def _read_lines(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _track_timeouts(pages: Iterable[str], timed_out: List[int]) -> Iterator[str]:
+    """Yield *pages* unchanged, appending the index of every :class:`pdf_extractor.TimedOutPage` to *timed_out*."""
+    for i, text in enumerate(pages):
+        if isinstance(text, pdf_extractor.TimedOutPage):
+            timed_out.append(i)
+        yield text
+
+
+def index_pdf_cached(pdf_path: str, cache: ContentCache, batch_size: int = EMBED_BATCH_SIZE,
+                     workers: Optional[int] = None, page_timeout: Optional[float] = None,
+                     ocr_lang: str = "kor+eng", ocr_dpi: int = 350) -> Tuple[List[Dict[str, Any]], ChunkIndex]:
+    """
+    :func:`index_pdf_streaming` behind a content-addressed cache.
+
+    Two entries are kept per document, both keyed by the SHA-256 of the PDF
+    bytes so renamed files and uploads of the same file by other users hit
+    them:
+
+    - ``pages`` – extracted page texts (key adds the extractor version and
+      OCR settings), so a re-index with new chunking skips OCR;
+    - ``index`` – the chunk index and sections in the binary format (key
+      adds the pipeline version, embedding model and chunk settings).
+
+    Cached chunk and section records are re-tagged with *pdf_path*. When a
+    page timed out during extraction the result is returned but neither
+    entry is written, so a transient timeout does not blank that page for
+    every later upload of the document.
+    """
+    doc_hash = file_sha256(pdf_path)
+    pages_key = cache.key(doc_hash, EXTRACT_VERSION, ocr_lang, ocr_dpi)
+    index_key = cache.key(doc_hash, PIPELINE_VERSION, EXTRACT_VERSION, ocr_lang, ocr_dpi,
+                          DEFAULT_EMBEDDING_MODEL, chunker.CHUNK_TOKENS, chunker.OVERLAP_TOKENS,
+                          chunker.CROSS_PAGE)
+
+    index_dir = cache.lookup("index", index_key)
+    if index_dir is not None:
+        cached = load_chunk_index(os.path.join(index_dir, "chunks"))
+        metadata = [dict(m, file_path=pdf_path) for m in cached.metadata]
+        sections = [dict(sec, file_path=pdf_path) for sec in load_sections(os.path.join(index_dir, "sections"))]
+        chunk_index = ChunkIndex(cached.embeddings, metadata, normalized=True)
+        if cached.lexical is not None:
+            chunk_index.set_lexical(cached.lexical)
+        return sections, chunk_index
+
+    pages_dir = cache.lookup("pages", pages_key)
+    if pages_dir is not None:
+        sections, chunk_index = index_pdf_streaming(pdf_path, batch_size=batch_size,
+                                                    pages=_read_lines(os.path.join(pages_dir, "pages.jsonl")))
+    else:
+        timed_out = []
+        with cache.store("pages", pages_key) as tmp:
+            doc = fitz.open(pdf_path)
+            total_pages = len(doc)
+            doc.close()
+            pages = pdf_extractor.iter_pages_text(pdf_path, total_pages, ocr_lang=ocr_lang, ocr_dpi=ocr_dpi,
+                                                  workers=workers, page_timeout=page_timeout)
+            pages = _track_timeouts(pages, timed_out)
+            sections, chunk_index = index_pdf_streaming(pdf_path, batch_size=batch_size,
+                                                        pages=_tee_lines(pages, os.path.join(tmp, "pages.jsonl")))
+            if timed_out:
+                raise DiscardEntry()
+        if timed_out:
+            print(f"[WARN] {len(timed_out)} page(s) of '{pdf_path}' timed out; result not cached.")
+            return sections, chunk_index
+
+    with cache.store("index", index_key) as tmp:
+        save_chunk_index(chunk_index, os.path.join(tmp, "chunks"))
+        save_lexical_index(chunk_index, os.path.join(tmp, "chunks"))
+        save_sections(sections, os.path.join(tmp, "sections"))
+    return sections, chunk_index
@@ -1,13 +1,26 @@
 # src/chatbot.py
 
+import asyncio
 import json
 import os
 import sys
-
-from src.inference.embedding_model import embedding_model
-from src.inference.llm_model import local_llm  # Example implementation of a local LLM
-from src.search.fine_search import fine_search_chunks
-from src.search.section_coarse_search import coarse_search_sections
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import numpy as np
+
+from src.inference.embedding_model import get_embedding_model
+from src.inference.llm_model import get_llm_tokenizer, get_local_llm  # Example implementation of a local LLM
+from src.inference.reranker import get_reranker
+from src.search.chunk_index import ChunkIndex, MultiChunkIndex
+from src.search.fine_search import fine_search_chunks, fine_search_chunks_batch
+from src.search.hybrid_search import fuse_hits, rerank_hits
+from src.search.index_store import load_chunk_index, load_sections
+from src.search.section_coarse_search import (build_section_matrices, coarse_search_sections,
+                                              coarse_search_sections_batch)
+from src.utils.context_packer import pack_context
+from src.utils.lru_cache import LRUCache
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -17,25 +30,145 @@ DEFAULT_SYSTEM_PROMPT = (
 )
 
 
+# Query rewrites keyed by (normalized query, retrieved chunk ids); shared by all
+# PDFChatBot instances because the web demo builds one bot per question.
+REWRITE_CACHE = LRUCache(max_size=1024, ttl=24 * 3600)
+
+
+def chunk_id(chunk: dict) -> tuple:
+    """Stable identifier of a retrieved chunk, independent of index row order."""
+    meta = chunk.get("metadata", {})
+    return meta.get("file_path"), meta.get("page_idx"), meta.get("chunk_index")
+
+
+@contextmanager
+def _timed(stats, name):
+    """Record the wall time of the block in ``stats["timings"][name]`` (seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.setdefault("timings", {})[name] = time.perf_counter() - start
+
+
+def _generate_until(prompt: str, deadline: float = None, stats: dict = None, max_new_tokens: int = 4096) -> str:
+    """Stream an answer to completion, cancelling generation once *deadline* passes."""
+    parts = []
+    stream = get_local_llm().generate_stream(prompt, max_new_tokens=max_new_tokens, stats=stats)
+    try:
+        for text in stream:
+            parts.append(text)
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("deadline exceeded during generation")
+    finally:
+        stream.close()
+    return "".join(parts)
+
+
 class PDFChatBot:
-    def __init__(self, sections, chunk_index, system_prompt: str = DEFAULT_SYSTEM_PROMPT):
+    def __init__(self, sections, chunk_index, system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+                 index_type: str = None, index_params: dict = None,
+                 rewrite_query: bool = True, rewrite_max_new_tokens: int = 256, rewrite_cache: bool = True,
+                 hybrid: bool = True, fusion: str = "rrf", fusion_weight: float = 0.5, lexical_depth: int = 50,
+                 lexical_prefilter: int = 0, lexical: str = "bm25", late_interaction: bool = False,
+                 rerank_depth: int = 50, cross_encoder: bool = False, cross_encoder_depth: int = 20,
+                 max_prompt_tokens: int = 4096, dedup_threshold: float = 0.8):
         """
         Parameters
         ----------
         sections : list[dict]
             Each element contains keys such as ``"title"``, ``"title_emb"``,
             ``"avg_chunk_emb"``, etc.
-        chunk_index : list[dict]
-            Each chunk is a dictionary like
-            ``{"embedding": [...], "metadata": {...}}``.
+        chunk_index : ChunkIndex | MultiChunkIndex | list[dict]
+            A prebuilt :class:`ChunkIndex` (or several documents opened as one
+            :class:`MultiChunkIndex`), or a list where each chunk is a
+            dictionary like ``{"embedding": [...], "metadata": {...}}``.
+            Lists are converted to a :class:`ChunkIndex` once, here.
         system_prompt : str
             System prompt that is prepended before calling the LLM.
+        index_type : str, optional
+            Search backend for unrestricted chunk searches (``"exact"``,
+            ``"ivf"``, ``"sq8"`` or ``"pq"``). ``None`` keeps whatever backend
+            *chunk_index* already has.
+        index_params : dict, optional
+            Build options for *index_type*, e.g. ``{"n_lists": 1024, "nprobe": 16}``
+            or ``{"m": 128, "rerank": 100}``.
+        rewrite_query : bool, default = True
+            Run the LLM query-rewrite stage and a second retrieval with the
+            expanded query. Disabling it halves the LLM calls per answer.
+        rewrite_max_new_tokens : int, default = 256
+            Token budget of the rewrite generation (the answer keeps its own).
+        rewrite_cache : bool, default = True
+            Serve rewrites from ``REWRITE_CACHE`` when the same query retrieved
+            the same chunks before.
+        hybrid : bool, default = True
+            Fuse the dense chunk ranking with a BM25 ranking over the whole
+            index (``chunk_index.lexical_search``), so exact identifiers and
+            domain terms are found even when the embeddings miss them. The
+            BM25 index is loaded with the chunk index or built on first use.
+        fusion : {"rrf", "weighted"}, default = "rrf"
+            How the two rankings are merged (see ``hybrid_search.fuse_hits``);
+            *fusion_weight* is the BM25 weight of ``"weighted"``.
+        lexical_depth : int, default = 50
+            Candidates taken from each ranking before fusion.
+        lexical_prefilter : int, default = 0
+            When positive, dense scoring is restricted to the chunks among the
+            top *lexical_prefilter* BM25 hits (within the coarse sections),
+            falling back to the full set when none qualify.
+        lexical : {"bm25", "sparse"}, default = "bm25"
+            Lexical ranking for *hybrid*: the BM25 index, or bge-m3's learned
+            lexical weights (needs an index built with ``--multi-vector``).
+        late_interaction : bool, default = False
+            Re-rank the top *rerank_depth* chunks of the dense/hybrid ranking
+            by bge-m3 multi-vector MaxSim (needs an index built with
+            ``--multi-vector``). Queries are then encoded by bge-m3 in one
+            pass that yields the dense, sparse and token vectors.
+        cross_encoder : bool, default = False
+            Score the top *cross_encoder_depth* candidates (after any MaxSim
+            re-rank) with a local cross-encoder (``src/inference/reranker.py``)
+            and keep the best *top_chunks*, so a small ``top_chunks`` still
+            gets the most relevant context into the prompt.
+        max_prompt_tokens : int, optional, default = 4096
+            Token budget of the whole prompt (LLM tokenizer). Retrieved chunks
+            are packed into what the template and question leave: adjacent or
+            overlapping chunks of the same section are merged, near-duplicates
+            (character 5-gram Jaccard above *dedup_threshold*) are dropped and
+            the lowest-ranked context is cut. ``None`` sends every chunk as is.
         """
+        if isinstance(chunk_index, list):
+            chunk_index = ChunkIndex.from_records(chunk_index)
+        if index_type is not None:
+            chunk_index.use_backend(index_type, **(index_params or {}))
         self.sections = sections
         self.chunk_index = chunk_index
         self.system_prompt = system_prompt
-
-    def build_prompt(self, user_query, retrieved_chunks):
+        self._section_matrices = None
+        self.rewrite_query_enabled = rewrite_query
+        self.rewrite_max_new_tokens = rewrite_max_new_tokens
+        self.rewrite_cache = rewrite_cache
+        self.hybrid = hybrid
+        self.fusion = fusion
+        self.fusion_weight = fusion_weight
+        self.lexical_depth = lexical_depth
+        self.lexical_prefilter = lexical_prefilter
+        self.lexical = lexical
+        self.late_interaction = late_interaction
+        self.rerank_depth = rerank_depth
+        self.cross_encoder = cross_encoder
+        self.cross_encoder_depth = cross_encoder_depth
+        self.max_prompt_tokens = max_prompt_tokens
+        self.dedup_threshold = dedup_threshold
+        if lexical not in ("bm25", "sparse"):
+            raise ValueError(f"Unknown lexical ranking {lexical!r}; expected 'bm25' or 'sparse'")
+        if hybrid and lexical == "sparse" and chunk_index.sparse is None:
+            raise ValueError("lexical='sparse' needs a chunk index with a bge-m3 sparse index")
+        if late_interaction and chunk_index.multi_vectors is None:
+            raise ValueError("late_interaction needs a chunk index with bge-m3 token vectors")
+        self.last_stats = {}
+        self.last_prompt = None
+
+    def build_prompt(self, user_query, retrieved_chunks, stats: dict = None):
         """
         Construct the prompt that will be sent to the LLM.
 
@@ -45,26 +178,257 @@ class PDFChatBot:
             The question entered by the user.
         retrieved_chunks : list[dict]
             A list of chunks in the form
-            ``[{"embedding": [...], "metadata": {...}}, ...]``.
+            ``[{"embedding": [...], "metadata": {...}}, ...]``, best first.
+        stats : dict, optional
+            Receives the packing counts under ``"context"`` (see
+            ``context_packer.pack_context``) when a token budget is set.
 
         Returns
         -------
         str
             A fully formatted prompt string.
         """
-        context_parts = []
-        for item in retrieved_chunks:
-            meta = item.get("metadata", {})
-            section_title = meta.get("section_title", "")
-            content = meta.get("content", "")
-            context_parts.append(f"[{section_title}] {content}")
+        head = f"{self.system_prompt}\n\n=== Document Context ===\n"
+        tail = f"\n\n=== User Question ===\n{user_query}\n\n=== Answer ===\n"
+
+        if self.max_prompt_tokens is None:
+            context_parts = []
+            for item in retrieved_chunks:
+                meta = item.get("metadata", {})
+                section_title = meta.get("section_title", "")
+                content = meta.get("content", "")
+                context_parts.append(f"[{section_title}] {content}")
+        else:
+            tokenizer = get_llm_tokenizer()
+            overhead = len(tokenizer(head + tail, add_special_tokens=False)["input_ids"])
+            budget = max(self.max_prompt_tokens - overhead, 0)
+            context_parts, packing = pack_context(retrieved_chunks, tokenizer, budget,
+                                                  dedup_threshold=self.dedup_threshold)
+            if stats is not None:
+                stats["context"] = packing
 
         context_text = "\n\n".join(context_parts)
-        prompt = f"{self.system_prompt}\n\n=== Document Context ===\n{context_text}\n\n=== User Question ===\n{user_query}\n\n=== Answer ===\n"
+        prompt = head + context_text + tail
 
         return prompt.strip()
 
-    def answer(self, query: str, beta: float = 0.3, top_sections: int = 10, top_chunks: int = 5, streaming=False, fine_only=False):
+    def retrieve_batch(self, queries, beta: float = 0.3, top_sections: int = 10, top_chunks: int = 5,
+                       fine_only=False, search_params: dict = None, batch_size: int = 256):
+        """
+        Retrieval for many queries at once, without LLM generation.
+
+        Queries are encoded with one ``get_embeddings`` call per *batch_size*
+        queries, and both coarse (section) and fine (chunk) scoring use one
+        matrix-matrix product per batch instead of a loop per query. Intended
+        for offline evaluation and FAQ pre-warming.
+
+        Parameters
+        ----------
+        queries : list[str]
+            User questions.
+        beta, top_sections, top_chunks, fine_only, search_params
+            Same as for :meth:`answer`.
+        batch_size : int, default = 256
+            Queries encoded and scored together.
+
+        Returns
+        -------
+        list[dict]
+            One ``{"query": str, "sections": [...], "chunks": [...]}`` per query,
+            with sections and chunks ranked by score.
+        """
+        search_params = search_params or {}
+        if not fine_only and self._section_matrices is None:
+            self._section_matrices = build_section_matrices(self.sections)
+
+        results = []
+        for start in range(0, len(queries), batch_size):
+            batch = list(queries[start:start + batch_size])
+            query_embs, m3_queries = self._encode_queries(batch)
+
+            if fine_only:
+                relevant_secs = [self.sections] * len(batch)
+            else:
+                relevant_secs = coarse_search_sections_batch(query_embs, self.sections, beta=beta, top_k=top_sections,
+                                                             section_matrices=self._section_matrices)
+
+            first_k = self._first_stage_k(top_chunks)
+            if not self.hybrid:
+                best_chunks = fine_search_chunks_batch(query_embs, self.chunk_index, relevant_secs,
+                                                       top_k=first_k, fine_only=fine_only, **search_params)
+            else:
+                lexical = [self._lexical_hits(query, first_k, m3) for query, m3 in zip(batch, m3_queries)]
+                dense = fine_search_chunks_batch(query_embs, self.chunk_index, relevant_secs,
+                                                 top_k=max(first_k, self.lexical_depth), fine_only=fine_only,
+                                                 candidate_rows_per_query=[c for _, c in lexical], **search_params)
+                best_chunks = [self._fuse(d, hits, first_k) for d, (hits, _) in zip(dense, lexical)]
+            best_chunks = [self._rerank(query, hits, m3, top_chunks)
+                           for query, hits, m3 in zip(batch, best_chunks, m3_queries)]
+            for query, secs, chunks in zip(batch, relevant_secs, best_chunks):
+                results.append({"query": query, "sections": secs, "chunks": chunks})
+        return results
+
+    def _uses_m3(self) -> bool:
+        return self.late_interaction or (self.hybrid and self.lexical == "sparse")
+
+    def _encode_queries(self, queries):
+        """
+        Dense query embeddings, plus the bge-m3 ``{"sparse", "colbert"}`` outputs
+        of each query when the sparse or late-interaction stages need them.
+        """
+        if not self._uses_m3():
+            return get_embedding_model().get_embeddings(queries), [None] * len(queries)
+        out = get_embedding_model().get_multi_embeddings(list(queries))
+        return out["dense"], [{"sparse": sp, "colbert": cb} for sp, cb in zip(out["sparse"], out["colbert"])]
+
+    def _cross_encoder_k(self, top_chunks: int) -> int:
+        """Chunks handed to the cross-encoder (all of them are scored)."""
+        return max(top_chunks, self.cross_encoder_depth) if self.cross_encoder else top_chunks
+
+    def _first_stage_k(self, top_chunks: int) -> int:
+        """Chunks kept before the re-ranking stages."""
+        k = self._cross_encoder_k(top_chunks)
+        return max(k, self.rerank_depth) if self.late_interaction else k
+
+    def _rerank(self, query: str, hits, m3_query, top_chunks: int, stats: dict = None, stage: str = "retrieve"):
+        """MaxSim and/or cross-encoder re-ranking of first-stage *hits*, as enabled."""
+        if self.late_interaction and hits:
+            with _timed(stats, f"{stage}.rerank"):
+                rows = np.asarray([h["row"] for h in hits], dtype=np.int64)
+                hits = rerank_hits(hits, self.chunk_index.maxsim_scores(m3_query["colbert"], rows),
+                                   self._cross_encoder_k(top_chunks))
+        if self.cross_encoder and hits:
+            with _timed(stats, f"{stage}.cross_encoder"):
+                hits = rerank_hits(hits, get_reranker().score_hits(query, hits), top_chunks)
+        return hits[:top_chunks]
+
+    def _lexical_hits(self, query: str, top_chunks: int, m3_query: dict = None):
+        """Lexical hits to fuse and, with ``lexical_prefilter``, the candidate rows for dense scoring."""
+        depth = max(top_chunks, self.lexical_depth)
+        if self.lexical == "sparse":
+            hits = self.chunk_index.sparse_search(m3_query["sparse"], top_k=max(depth, self.lexical_prefilter))
+        else:
+            hits = self.chunk_index.lexical_search(query, top_k=max(depth, self.lexical_prefilter))
+        candidates = None
+        if self.lexical_prefilter:
+            candidates = np.asarray([h["row"] for h in hits[:self.lexical_prefilter]], dtype=np.int64)
+        return hits[:depth], candidates
+
+    def _fuse(self, dense_hits, lexical_hits, top_chunks: int):
+        return fuse_hits(dense_hits, lexical_hits, top_k=top_chunks, method=self.fusion, weight=self.fusion_weight)
+
+    def retrieve(self, query: str, beta: float = 0.3, top_sections: int = 10, top_chunks: int = 5,
+                 fine_only=False, search_params: dict = None, stats: dict = None, stage: str = "retrieve"):
+        """
+        Coarse-to-fine retrieval for a single query.
+
+        The query is encoded once and the vector is shared between the coarse
+        (section) and fine (chunk) searches. With ``self.hybrid`` the chunk
+        ranking is fused with a lexical (BM25 or bge-m3 sparse) ranking of the
+        query, with ``self.late_interaction`` the top ``rerank_depth``
+        chunks are re-scored by MaxSim over their stored token vectors, and
+        with ``self.cross_encoder`` the top ``cross_encoder_depth`` by a
+        cross-encoder. Stage
+        timings are recorded in *stats* under ``"<stage>.embed"``,
+        ``"<stage>.coarse_search"``, ``"<stage>.lexical_search"`` (hybrid
+        only), ``"<stage>.fine_search"``, ``"<stage>.rerank"`` (late
+        interaction only) and ``"<stage>.cross_encoder"`` (cross-encoder only).
+
+        Returns
+        -------
+        list[dict]
+            The top *top_chunks* chunks.
+        """
+        with _timed(stats, f"{stage}.embed"):
+            if self._uses_m3():
+                query_embs, m3_queries = self._encode_queries([query])
+                query_emb, m3_query = query_embs[0], m3_queries[0]
+            else:
+                query_emb, m3_query = get_embedding_model().get_embedding(query), None
+
+        with _timed(stats, f"{stage}.coarse_search"):
+            if fine_only:
+                relevant_secs = self.sections
+            else:
+                # Coarse Search (섹션 레벨)
+                relevant_secs = coarse_search_sections(query, self.sections, beta=beta, top_k=top_sections,
+                                                       query_emb=query_emb)
+
+        first_k = self._first_stage_k(top_chunks)
+        if not self.hybrid:
+            # Fine Search (청크 레벨)
+            with _timed(stats, f"{stage}.fine_search"):
+                hits = fine_search_chunks(query_emb, self.chunk_index, relevant_secs, top_k=first_k,
+                                          fine_only=fine_only, **(search_params or {}))
+        else:
+            with _timed(stats, f"{stage}.lexical_search"):
+                lexical_hits, candidates = self._lexical_hits(query, first_k, m3_query)
+            # Fine Search (청크 레벨)
+            with _timed(stats, f"{stage}.fine_search"):
+                dense_hits = fine_search_chunks(query_emb, self.chunk_index, relevant_secs,
+                                                top_k=max(first_k, self.lexical_depth), fine_only=fine_only,
+                                                candidate_rows=candidates, **(search_params or {}))
+            hits = self._fuse(dense_hits, lexical_hits, first_k)
+
+        return self._rerank(query, hits, m3_query, top_chunks, stats=stats, stage=stage)
+
+    def rewrite_query(self, query: str, retrieved_chunks, streaming=False, stats: dict = None,
+                      deadline: float = None):
+        """
+        Ask the LLM for supplemental questions based on the retrieved chunks.
+
+        Returns only the generated text (stripped, no prompt or special
+        tokens), or ``None`` when the rewrite stage is disabled. Results are
+        cached on (normalized query, retrieved chunk ids) when
+        ``self.rewrite_cache`` is set; both generation paths (with and
+        without a deadline) produce the same text, so the cache is shared.
+        ``stats["rewrite"]`` records ``"disabled"``, ``"cached"`` or
+        ``"generated"``. With a *deadline* (``time.monotonic()`` timestamp)
+        the generation is cancelled once it passes and :class:`TimeoutError`
+        is raised.
+        """
+        if not self.rewrite_query_enabled:
+            if stats is not None:
+                stats["rewrite"] = "disabled"
+            return None
+
+        cache_key = (" ".join(query.split()), tuple(chunk_id(c) for c in retrieved_chunks))
+        if self.rewrite_cache:
+            cached = REWRITE_CACHE.get(cache_key)
+            if cached is not None:
+                if stats is not None:
+                    stats["rewrite"] = "cached"
+                return cached
+
+        # Build a single string that contains the content of every retrieved chunk
+        combined_answer = "\n\n".join(chunk["metadata"].get("content", "") for chunk in retrieved_chunks)
+
+        # Ask the LLM to improve the user query based on ALL retrieved evidence
+        query_improvement_prompt = (
+                "The user question is: " + query + "\n\n"
+                                                   "The retrieved chunks are:\n" + combined_answer + "\n\n"
+                                                                                                     "Based on the retrieved chunks above, generate supplemental question(s) "
+                                                                                                     "that would help retrieve even more relevant information. "
+                                                                                                     "List the additional question(s) clearly.\n\n"
+                                                                                                     "The improved question is: "
+        )
+
+        with _timed(stats, "rewrite.generate"):
+            if deadline is not None:
+                improved_query = _generate_until(query_improvement_prompt, deadline,
+                                                 max_new_tokens=self.rewrite_max_new_tokens)
+            else:
+                improved_query = get_local_llm().generate(query_improvement_prompt, streaming=streaming,
+                                                          max_new_tokens=self.rewrite_max_new_tokens)
+        improved_query = improved_query.strip()
+        if self.rewrite_cache:
+            REWRITE_CACHE.put(cache_key, improved_query)
+        if stats is not None:
+            stats["rewrite"] = "generated"
+        return improved_query
+
+    def answer(self, query: str, beta: float = 0.3, top_sections: int = 10, top_chunks: int = 5, streaming=False, fine_only=False,
+               search_params: dict = None, stats: dict = None):
         """
         End‑to‑end answer generation pipeline.
 
@@ -72,7 +436,9 @@ class PDFChatBot:
         -----
         1. **Coarse Search** – Find the top *top_sections* sections at the section level.  
         2. **Fine Search** – Within those sections, retrieve the top *top_chunks* chunks.  
-        3. **LLM Generation** – Send a prompt to the LLM and return the generated answer.
+        3. **Query Rewrite** (optional) – Let the LLM expand the query from the
+           retrieved chunks and repeat steps 1–2 with the expanded query.  
+        4. **LLM Generation** – Send a prompt to the LLM and return the generated answer.
 
         Parameters
         ----------
@@ -86,78 +452,195 @@ class PDFChatBot:
             Number of chunks to use in the fine search.
         streaming : bool, default = False
             If ``True``, stream tokens as they are generated.
+        search_params : dict, optional
+            Per-query options for the chunk index backend, e.g. ``{"nprobe": 32}``
+            to trade IVF latency for recall, or ``{"rerank": 200}`` to re-score
+            more SQ8/PQ candidates in float32.
+        stats : dict, optional
+            Filled with per-stage wall times (seconds) under ``"timings"``, the
+            rewrite outcome under ``"rewrite"`` and, when the rewrite ran, the
+            number of final chunks it added under ``"rewrite_new_chunks"``. The
+            same dict is kept as ``self.last_stats``, the prompt as
+            ``self.last_prompt``.
 
         Returns
         -------
         str
-            The LLM’s answer text.
+            The LLM’s answer text (without the prompt).
         """
-        chunk_index = self.chunk_index
-        sections = self.sections
+        stats = {} if stats is None else stats
+        self.last_stats = stats
 
-        if fine_only:
-            relevant_secs = self.sections
-        else:
-            # Coarse Search (섹션 레벨)
-            relevant_secs = coarse_search_sections(query, sections, beta=beta, top_k=top_sections)
-            # Fine Search (청크 레벨)
+        with _timed(stats, "total"):
+            prompt = self._prepare_prompt(query, beta, top_sections, top_chunks, fine_only, search_params,
+                                          streaming=streaming, stats=stats)
+            self.last_prompt = prompt
 
-        query_emb = embedding_model.get_embedding(query)
+            # LLM 답변 생성
+            with _timed(stats, "generate"):
+                answer_text = get_local_llm().generate(prompt, streaming=streaming)
 
-        best_chunks = fine_search_chunks(query_emb, chunk_index, relevant_secs, top_k=top_chunks, fine_only=fine_only)
+        return answer_text
 
-        # Build a single string that contains the content of every retrieved chunk
-        combined_answer = "\n\n".join(chunk["metadata"].get("content", "") for chunk in best_chunks)
+    def answer_stream(self, query: str, beta: float = 0.3, top_sections: int = 10, top_chunks: int = 5,
+                      fine_only=False, search_params: dict = None, stats: dict = None, deadline: float = None):
+        """
+        Streaming variant of :meth:`answer`.
 
-        # Ask the LLM to improve the user query based on ALL retrieved evidence
-        query_improvement_prompt = (
-                "The user question is: " + query + "\n\n"
-                                                   "The retrieved chunks are:\n" + combined_answer + "\n\n"
-                                                                                                     "Based on the retrieved chunks above, generate supplemental question(s) "
-                                                                                                     "that would help retrieve even more relevant information. "
-                                                                                                     "List the additional question(s) clearly.\n\n"
-                                                                                                     "The improved question is: "
-        )
+        Retrieval (and the optional query rewrite) runs first; the answer is
+        then yielded as decoded text deltas while the LLM generates it.
 
-        improved_query = local_llm.generate(query_improvement_prompt, streaming=streaming)
+        Parameters
+        ----------
+        query, beta, top_sections, top_chunks, fine_only, search_params
+            As for :meth:`answer`.
+        stats : dict, optional
+            Filled like in :meth:`answer`; additionally ``"generation"`` holds
+            the LLM streaming stats (``time_to_first_token``,
+            ``inter_token_latencies``, ``num_deltas``, ``total``) and
+            ``"timings"`` gets ``"first_token"``, the time from the call to the
+            first yielded delta.
+        deadline : float, optional
+            ``time.monotonic()`` timestamp. The rewrite and answer generations
+            are cancelled once it passes and :class:`TimeoutError` is raised.
+
+        Yields
+        ------
+        str
+            Pieces of the answer text.
+        """
+        stats = {} if stats is None else stats
+        self.last_stats = stats
+        timings = stats.setdefault("timings", {})
+        start = time.perf_counter()
+        try:
+            prompt = self._prepare_prompt(query, beta, top_sections, top_chunks, fine_only, search_params,
+                                          streaming=False, stats=stats, deadline=deadline)
+
+            generation = stats.setdefault("generation", {})
+            generate_start = time.perf_counter()
+            stream = get_local_llm().generate_stream(prompt, stats=generation)
+            try:
+                for text in stream:
+                    if "first_token" not in timings:
+                        timings["first_token"] = time.perf_counter() - start
+                    yield text
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise TimeoutError("deadline exceeded during generation")
+            finally:
+                stream.close()
+                timings["generate"] = time.perf_counter() - generate_start
+        finally:
+            timings["total"] = time.perf_counter() - start
+
+    async def answer_async(self, query: str, beta: float = 0.3, top_sections: int = 10, top_chunks: int = 5,
+                           fine_only=False, search_params: dict = None, stats: dict = None,
+                           cpu_executor=None, gpu_executor=None, deadline: float = None):
+        """
+        Non-blocking variant of :meth:`answer` for an asyncio server.
 
-        if fine_only:
-            relevant_secs = self.sections
-        else:
-            # Coarse Search (섹션 레벨)
-            relevant_secs = coarse_search_sections(query + ':' + improved_query, sections, beta=beta, top_k=top_sections)
+        Embedding and search run on *cpu_executor*; the rewrite and answer
+        generations run on *gpu_executor*, whose worker count bounds the
+        number of generations handed to the model at once (further calls
+        queue in the executor). The event loop itself never blocks.
 
-        # Fine Search (청크 레벨)
-        query_emb = embedding_model.get_embedding(query + ':' + improved_query)
-        best_chunks = fine_search_chunks(query_emb, chunk_index,
-                                         relevant_secs, top_k=top_chunks,
-                                         fine_only=fine_only)
+        Parameters
+        ----------
+        query, beta, top_sections, top_chunks, fine_only, search_params, stats
+            As for :meth:`answer`.
+        cpu_executor, gpu_executor : concurrent.futures.Executor, optional
+            Executors for the CPU- and GPU-bound stages (the loop's default
+            executor when ``None``).
+        deadline : float, optional
+            ``time.monotonic()`` timestamp. It is checked between stages and
+            while the answer is generated; when it passes, pending generation
+            is cancelled and :class:`TimeoutError` is raised.
 
-        # LLM 답변 생성
-        prompt = self.build_prompt(query, best_chunks)
-        answer_text = local_llm.generate(prompt, streaming=streaming)
+        Returns
+        -------
+        str
+            The generated answer text.
+        """
+        stats = {} if stats is None else stats
+        self.last_stats = stats
+        loop = asyncio.get_running_loop()
+        retrieve_kwargs = dict(beta=beta, top_sections=top_sections, top_chunks=top_chunks,
+                               fine_only=fine_only, search_params=search_params, stats=stats)
+
+        def check_deadline(stage):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"deadline exceeded before {stage}")
+
+        with _timed(stats, "total"):
+            check_deadline("retrieve")
+            best_chunks = await loop.run_in_executor(
+                cpu_executor, partial(self.retrieve, query, stage="retrieve", **retrieve_kwargs))
+
+            check_deadline("rewrite")
+            improved_query = await loop.run_in_executor(
+                gpu_executor, partial(self.rewrite_query, query, best_chunks, stats=stats, deadline=deadline))
+            if improved_query is not None:
+                check_deadline("retrieve_rewritten")
+                first_ids = {chunk_id(c) for c in best_chunks}
+                best_chunks = await loop.run_in_executor(
+                    cpu_executor, partial(self.retrieve, query + ':' + improved_query,
+                                          stage="retrieve_rewritten", **retrieve_kwargs))
+                stats["rewrite_new_chunks"] = sum(chunk_id(c) not in first_ids for c in best_chunks)
+
+            # Tokenizing and packing the context is CPU work too
+            prompt = await loop.run_in_executor(
+                cpu_executor, partial(self.build_prompt, query, best_chunks, stats=stats))
+            check_deadline("generate")
+            generation = stats.setdefault("generation", {})
+            with _timed(stats, "generate"):
+                answer_text = await loop.run_in_executor(
+                    gpu_executor, partial(_generate_until, prompt, deadline, generation))
 
         return answer_text
 
+    def _prepare_prompt(self, query, beta, top_sections, top_chunks, fine_only, search_params, streaming, stats,
+                        deadline=None):
+        """Retrieve (and optionally rewrite-and-retrieve) context for *query* and build the LLM prompt."""
+        retrieve_kwargs = dict(beta=beta, top_sections=top_sections, top_chunks=top_chunks,
+                               fine_only=fine_only, search_params=search_params, stats=stats)
+
+        best_chunks = self.retrieve(query, stage="retrieve", **retrieve_kwargs)
+
+        improved_query = self.rewrite_query(query, best_chunks, streaming=streaming, stats=stats, deadline=deadline)
+        if improved_query is not None:
+            first_ids = {chunk_id(c) for c in best_chunks}
+            best_chunks = self.retrieve(query + ':' + improved_query, stage="retrieve_rewritten",
+                                        **retrieve_kwargs)
+            stats["rewrite_new_chunks"] = sum(chunk_id(c) not in first_ids for c in best_chunks)
+
+        return self.build_prompt(query, best_chunks, stats=stats)
+
 
 if __name__ == "__main__":
     sections_folder = "../data/extracted/"
     chunk_index_folder = "../data/index/"
 
     sections = []
-    chunk_index = []
+    chunk_indexes = []
 
     for fname in os.listdir(sections_folder):
-        if fname.endswith("sections_with_emb.json"):
-            path = os.path.join(sections_folder, fname)
+        path = os.path.join(sections_folder, fname)
+        if fname.endswith("sections_with_emb.meta.json"):
+            sections.extend(load_sections(path[:-len(".meta.json")]))
+        elif fname.endswith("sections_with_emb.json") and not os.path.exists(path[:-len(".json")] + ".meta.json"):
             with (open(path, 'r', encoding='utf-8') as f):
                 sections.extend(json.load(f))
 
     for fname in os.listdir(chunk_index_folder):
-        if fname.endswith("_chunks_vectors.json"):
-            path = os.path.join(chunk_index_folder, fname)
+        path = os.path.join(chunk_index_folder, fname)
+        if fname.endswith("_chunks_vectors.meta.json"):
+            chunk_indexes.append(load_chunk_index(path[:-len(".meta.json")]))
+        elif fname.endswith("_chunks_vectors.json") and not os.path.exists(path[:-len(".json")] + ".meta.json"):
             with open(path, 'r', encoding='utf-8') as f:
-                chunk_index.extend(json.load(f))
+                chunk_indexes.append(ChunkIndex.from_records(json.load(f)))
+
+    # Each document keeps its own memory-mapped matrix
+    chunk_index = MultiChunkIndex(chunk_indexes)
 
     chatbot = PDFChatBot(sections, chunk_index)
     print("Chatbot is ready. Enter your question below:")
@@ -168,4 +651,6 @@ if __name__ == "__main__":
         if query.lower() == "exit":
             break
 
-        answer = chatbot.answer(query, streaming=True)
+        for delta in chatbot.answer_stream(query):
+            print(delta, end="", flush=True)
+        print()
@@ -0,0 +1,17 @@
+# src/inference/device.py
+
+
+def detect_device() -> str:
+    """
+    Return the best available torch device: ``"cuda"``, ``"mps"`` or ``"cpu"``.
+
+    ``torch`` is imported here rather than at module level so that importing
+    the inference modules stays cheap until a model is actually needed.
+    """
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
@@ -1,27 +1,73 @@
 # src/inference/embedding_model.py
 
-from sentence_transformers import SentenceTransformer
-import torch
+import os
+import threading
+
+import numpy as np
+
+from src.inference.device import detect_device
+from src.utils.lru_cache import LRUCache
+
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-m3"
+
+
+class EmbeddingCache(LRUCache):
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        """
+        LRU memo of query embeddings keyed by whitespace-normalized text,
+        with size/TTL limits and hit/miss counters (see :class:`LRUCache`).
+        """
+        super().__init__(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def get(self, text: str):
+        return super().get(self.normalize(text))
+
+    def put(self, text: str, emb):
+        super().put(self.normalize(text), emb)
 
 
 class EmbeddingModel:
-    def __init__(self, model_name="BAAI/bge-m3", device="cpu"):
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, device="cpu", cache_size: int = 1024,
+                 cache_ttl: float = 3600.0):
         """
         Load the model and move it to the specified device.
+
+        ``get_embedding`` results are memoized in an :class:`EmbeddingCache`
+        of *cache_size* entries (``0`` disables it) expiring after
+        *cache_ttl* seconds.
         """
+        from sentence_transformers import SentenceTransformer
+
         self.model = SentenceTransformer(model_name,
                                          cache_folder="data/hub",
                                          trust_remote_code=True)
         self.device = device
         if device in ["cuda", "mps"]:
             self.model.to(self.device)
+        self.cache = EmbeddingCache(max_size=cache_size, ttl=cache_ttl) if cache_size else None
+        self.model_name = model_name
+        self._m3 = None
+        self._m3_lock = threading.Lock()
 
     def get_embedding(self, text: str):
         """
         Return the embedding (1‑D list[float]) for a single sentence.
+
+        Repeated texts are served from ``self.cache`` without running the model.
         """
+        if self.cache is not None:
+            cached = self.cache.get(text)
+            if cached is not None:
+                return list(cached)
         emb = self.model.encode([text], convert_to_numpy=True, device=self.device)[0]
-        return emb.tolist()
+        emb = emb.tolist()
+        if self.cache is not None:
+            self.cache.put(text, tuple(emb))
+        return emb
 
     def get_embeddings(self, texts: list):
         """
@@ -30,13 +76,117 @@ class EmbeddingModel:
         embs = self.model.encode(texts, convert_to_numpy=True, device=self.device)
         return embs
 
+    def _m3_heads(self):
+        """
+        bge-m3's sparse (``sparse_linear.pt``) and multi-vector
+        (``colbert_linear.pt``) output layers, loaded on first use onto the
+        device and dtype of the already loaded encoder. They are two small
+        linear layers over its last hidden states, so the three bge-m3
+        outputs come from one copy of the model.
+        """
+        if self._m3 is None:
+            with self._m3_lock:
+                if self._m3 is None:
+                    import torch
+
+                    encoder = self.model[0].auto_model
+                    param = next(encoder.parameters())
+                    hidden = encoder.config.hidden_size
+                    heads = []
+                    for filename, out_features in (("sparse_linear.pt", 1), ("colbert_linear.pt", hidden)):
+                        if os.path.isdir(self.model_name):
+                            path = os.path.join(self.model_name, filename)
+                        else:
+                            from huggingface_hub import hf_hub_download
+
+                            path = hf_hub_download(self.model_name, filename, cache_dir="data/hub")
+                        layer = torch.nn.Linear(hidden, out_features)
+                        layer.load_state_dict(torch.load(path, map_location="cpu", weights_only=True))
+                        heads.append(layer.to(device=param.device, dtype=param.dtype).eval())
+                    self._m3 = tuple(heads)
+        return self._m3
+
+    def get_multi_embeddings(self, texts: list, batch_size: int = 32, max_length: int = 8192):
+        """
+        Return all three bge-m3 outputs for multiple texts in one forward pass.
+
+        The encoder of ``self.model`` runs once per batch; the dense vector is
+        its normalized ``[CLS]`` state, as ``get_embeddings`` returns, and the
+        sparse and multi-vector outputs are computed from the same hidden
+        states the way ``FlagEmbedding.BGEM3FlagModel`` does.
+
+        Returns
+        -------
+        dict
+            ``"dense"`` – ``(n, dim)`` float32 array;
+            ``"sparse"`` – one ``{token_id: weight}`` dict per text;
+            ``"colbert"`` – one ``(num_tokens, dim)`` float32 array per text.
+        """
+        import torch
+
+        sparse_linear, colbert_linear = self._m3_heads()
+        encoder = self.model[0].auto_model
+        tokenizer = self.model.tokenizer
+        device = next(encoder.parameters()).device
+        skip = {tokenizer.cls_token_id, tokenizer.eos_token_id, tokenizer.pad_token_id, tokenizer.unk_token_id}
+
+        dense, sparse, colbert = [], [], []
+        for start in range(0, len(texts), batch_size):
+            enc = tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                            max_length=max_length, return_tensors="pt").to(device)
+            with torch.inference_mode():
+                states = encoder(**enc).last_hidden_state
+                dense.append(torch.nn.functional.normalize(states[:, 0], dim=-1).float().cpu().numpy())
+                weights = torch.relu(sparse_linear(states)).squeeze(-1).float().cpu().numpy()
+                vecs = colbert_linear(states[:, 1:]) * enc["attention_mask"][:, 1:, None]
+                vecs = torch.nn.functional.normalize(vecs, dim=-1).float().cpu().numpy()
+
+            ids = enc["input_ids"].cpu().numpy()
+            lengths = enc["attention_mask"].sum(dim=1).cpu().numpy()
+            for i, n in enumerate(lengths):
+                lexical = {}
+                for token, w in zip(ids[i, :n].tolist(), weights[i, :n].tolist()):
+                    if token not in skip and w > lexical.get(token, 0.0):
+                        lexical[token] = w
+                sparse.append(lexical)
+                colbert.append(vecs[i, :n - 1])
+
+        dim = self.model.get_sentence_embedding_dimension()
+        return {
+            "dense": np.concatenate(dense) if dense else np.empty((0, dim), dtype=np.float32),
+            "sparse": sparse,
+            "colbert": colbert,
+        }
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_embedding_model() -> EmbeddingModel:
+    """
+    Return the process-wide :class:`EmbeddingModel`, loading it on first use.
+
+    Loading is guarded by a lock, so concurrent first callers wait for a
+    single load instead of each loading the model.
+    """
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = EmbeddingModel(model_name=DEFAULT_EMBEDDING_MODEL, device=detect_device())
+    return _instance
+
+
+def warm_up() -> EmbeddingModel:
+    """Load the shared model and run one encode so the first query does not pay for it."""
+    model = get_embedding_model()
+    model.get_embeddings(["warm-up"])
+    return model
 
-# Example of a global instance
 
-if torch.cuda.is_available():
-    device = "cuda"
-elif torch.backends.mps.is_available():
-    device = "mps"
-else:
-    device = "cpu"
-embedding_model = EmbeddingModel(model_name="BAAI/bge-m3", device=device)
+def __getattr__(name):
+    # Backwards compatibility: ``from ... import embedding_model`` loads lazily
+    if name == "embedding_model":
+        return get_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,321 @@
+# src/inference/generation_scheduler.py
+
+import queue
+import threading
+from typing import List, Optional
+
+import torch
+from transformers import DynamicCache
+
+_DONE = object()
+
+
+class GenerationRequest:
+    def __init__(self, input_ids: List[int], max_new_tokens: int, temperature: float, top_p: float):
+        """
+        One prompt submitted to a :class:`GenerationScheduler`.
+
+        Iterating over the request yields generated token ids as soon as the
+        scheduler produces them; iteration ends at EOS or *max_new_tokens*.
+        """
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.generated: List[int] = []
+        self.prefix_tokens = 0  # prompt tokens served from the prefix cache
+        self.error: Optional[BaseException] = None
+        self.cancelled = False
+        self._tokens = queue.Queue()
+
+    def cancel(self):
+        """Ask the scheduler to drop this request at the next decode step."""
+        self.cancelled = True
+
+    def _push(self, token_id: int):
+        self.generated.append(token_id)
+        self._tokens.put(token_id)
+
+    def _finish(self, error: Optional[BaseException] = None):
+        self.error = error
+        self._tokens.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            item = self._tokens.get()
+            if item is _DONE:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
+
+    def result(self) -> List[int]:
+        """Block until generation finishes and return all generated token ids."""
+        for _ in self:
+            pass
+        return self.generated
+
+
+def _legacy_cache(cache):
+    """Per-layer ``(key, value)`` tensors of shape ``(batch, heads, time, head_dim)``."""
+    if hasattr(cache, "to_legacy_cache"):
+        return list(cache.to_legacy_cache())
+    return list(cache)
+
+
+def _left_pad_time(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    """Left-pad *tensor* with zeros along *dim* up to *length*."""
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+def _sample(logits: torch.Tensor, temperature: torch.Tensor, top_p: torch.Tensor) -> torch.Tensor:
+    """
+    Sample one token per row with per-row temperature / nucleus (top-p) settings.
+    Rows with ``temperature == 0`` decode greedily.
+    """
+    logits = logits.float()
+    greedy = logits.argmax(dim=-1)
+    scaled = logits / temperature.clamp(min=1e-5).unsqueeze(-1)
+    probs = torch.softmax(scaled, dim=-1)
+
+    sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+    cumulative = sorted_probs.cumsum(dim=-1)
+    # Drop tokens outside the nucleus, always keeping the most likely one
+    drop = (cumulative - sorted_probs) > top_p.unsqueeze(-1)
+    sorted_probs = sorted_probs.masked_fill(drop, 0.0)
+    choice = torch.multinomial(sorted_probs / sorted_probs.sum(dim=-1, keepdim=True), 1).squeeze(-1)
+    sampled = sorted_idx.gather(-1, choice.unsqueeze(-1)).squeeze(-1)
+    return torch.where(temperature > 0, sampled, greedy)
+
+
+class GenerationScheduler:
+    def __init__(self, model, tokenizer, device, max_batch_size: int = 8, eos_token_ids=None, prefix_cache=None):
+        """
+        Continuous-batching generation loop for a causal LM.
+
+        Submitted prompts are left-padded (the tokenizer is configured with
+        ``padding_side='left'``) and prefilled together. Between decode steps
+        the loop admits waiting requests into the running batch, so a new
+        request does not wait for the whole batch to finish, and drops
+        finished ones. Every request receives its own tokens as they are
+        sampled.
+
+        Parameters
+        ----------
+        model, tokenizer
+            A loaded ``AutoModelForCausalLM`` and its tokenizer.
+        device : str
+            Device the model lives on.
+        max_batch_size : int, default = 8
+            Maximum number of sequences decoded together.
+        eos_token_ids : set[int], optional
+            Token ids that end a sequence (defaults to the tokenizer's EOS).
+        prefix_cache : PrefixKVCache, optional
+            Prompts whose leading tokens are cached are prefilled on their
+            own from the cached key/values (only the new tokens are
+            computed); every prefilled prompt is added to the cache.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.eos_token_ids = set(eos_token_ids or [tokenizer.eos_token_id])
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self.prefix_cache = prefix_cache
+
+        self._pending = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+
+        # Running batch state
+        self._requests: List[GenerationRequest] = []
+        self._cache = None  # list of (key, value) per layer
+        self._attention_mask = None  # (B, T)
+        self._next_tokens = None  # (B,)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._pending.put(None)
+        self._thread.join()
+
+    def submit(self, input_ids: List[int], max_new_tokens: int = 4096,
+               temperature: float = 0.6, top_p: float = 0.95) -> GenerationRequest:
+        """Queue a tokenized prompt and return its :class:`GenerationRequest`."""
+        request = GenerationRequest(list(input_ids), max_new_tokens, temperature, top_p)
+        self._pending.put(request)
+        return request
+
+    @property
+    def active(self) -> int:
+        return len(self._requests)
+
+    # ------------------------------------------------------------------
+    # Scheduler loop
+    # ------------------------------------------------------------------
+    def _loop(self):
+        while not self._stop.is_set():
+            admitted = self._collect_pending(block=not self._requests)
+            try:
+                with torch.inference_mode():
+                    if admitted:
+                        self._prefill(admitted)
+                    elif self._requests:
+                        self._decode_step()
+            except Exception as e:  # noqa: BLE001 - propagate to every waiting caller
+                for request in self._requests + admitted:
+                    request._finish(e)
+                self._reset()
+
+    def _collect_pending(self, block: bool) -> List[GenerationRequest]:
+        admitted = []
+        free = self.max_batch_size - len(self._requests)
+        while len(admitted) < free:
+            try:
+                request = self._pending.get(block=block and not admitted, timeout=0.1)
+            except queue.Empty:
+                break
+            if request is None:  # stop() sentinel
+                break
+            admitted.append(request)
+        return admitted
+
+    def _reset(self):
+        self._requests = []
+        self._cache = None
+        self._attention_mask = None
+        self._next_tokens = None
+
+    def _forward(self, input_ids, attention_mask, position_ids, cache):
+        past = DynamicCache.from_legacy_cache(tuple(cache)) if cache is not None else None
+        cache_len = cache[0][0].shape[2] if cache is not None else 0
+        cache_position = torch.arange(cache_len, cache_len + input_ids.shape[1], device=self.device)
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past,
+            cache_position=cache_position,
+            use_cache=True,
+        )
+        return out.logits[:, -1, :], _legacy_cache(out.past_key_values)
+
+    def _prefill(self, requests: List[GenerationRequest]):
+        """Prefill newly admitted prompts and merge them into the running batch."""
+        fresh = []
+        for request in requests:
+            n, past = self.prefix_cache.lookup(request.input_ids) if self.prefix_cache is not None else (0, None)
+            if past is None:
+                fresh.append(request)
+            else:
+                self._admit([request], *self._prefill_cached(request, n, past))
+        if fresh:
+            self._admit(fresh, *self._prefill_batch(fresh))
+
+    def _prefill_batch(self, requests: List[GenerationRequest]):
+        """Prefill prompts as one left-padded batch."""
+        length = max(len(r.input_ids) for r in requests)
+        input_ids = torch.full((len(requests), length), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(requests), length), dtype=torch.long)
+        for i, r in enumerate(requests):
+            input_ids[i, length - len(r.input_ids):] = torch.tensor(r.input_ids)
+            attention_mask[i, length - len(r.input_ids):] = 1
+        input_ids = input_ids.to(self.device)
+        attention_mask = attention_mask.to(self.device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        logits, cache = self._forward(input_ids, attention_mask, position_ids, None)
+        if self.prefix_cache is not None:
+            for i, r in enumerate(requests):
+                start = length - len(r.input_ids)
+                self.prefix_cache.store(r.input_ids, [(k[i:i + 1, :, start:], v[i:i + 1, :, start:]) for k, v in cache])
+        return self._sample_for(requests, logits), cache, attention_mask
+
+    def _prefill_cached(self, request: GenerationRequest, n: int, past):
+        """Prefill one prompt whose first *n* tokens have cached key/values *past*."""
+        length = len(request.input_ids)
+        input_ids = torch.tensor([request.input_ids[n:]], dtype=torch.long, device=self.device)
+        attention_mask = torch.ones((1, length), dtype=torch.long, device=self.device)
+        position_ids = torch.arange(n, length, device=self.device).unsqueeze(0)
+
+        logits, cache = self._forward(input_ids, attention_mask, position_ids, past)
+        request.prefix_tokens = n
+        self.prefix_cache.store(request.input_ids, cache)
+        return self._sample_for([request], logits), cache, attention_mask
+
+    def _admit(self, requests: List[GenerationRequest], tokens, cache, attention_mask):
+        """Merge prefilled *requests* into the running batch and emit their first tokens."""
+        if self._requests:
+            # Align both batches on the time axis (left padding) and concatenate
+            total = max(self._attention_mask.shape[1], attention_mask.shape[1])
+            cache = [
+                (torch.cat([_left_pad_time(k_old, total, 2), _left_pad_time(k_new, total, 2)]),
+                 torch.cat([_left_pad_time(v_old, total, 2), _left_pad_time(v_new, total, 2)]))
+                for (k_old, v_old), (k_new, v_new) in zip(self._cache, cache)
+            ]
+            attention_mask = torch.cat([_left_pad_time(self._attention_mask, total, 1),
+                                        _left_pad_time(attention_mask, total, 1)])
+            tokens = torch.cat([self._next_tokens, tokens])
+
+        self._requests = self._requests + requests
+        self._cache = cache
+        self._attention_mask = attention_mask
+        self._next_tokens = tokens
+        self._emit(tokens[-len(requests):], requests)
+        self._retire()
+
+    def _decode_step(self):
+        """Feed the last sampled token of every running sequence and sample the next one."""
+        self._attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((self._attention_mask.shape[0], 1))], dim=1
+        )
+        position_ids = (self._attention_mask.sum(-1, keepdim=True) - 1)
+        logits, self._cache = self._forward(self._next_tokens.unsqueeze(-1), self._attention_mask,
+                                            position_ids, self._cache)
+        self._next_tokens = self._sample_for(self._requests, logits)
+        self._emit(self._next_tokens, self._requests)
+        self._retire()
+
+    def _sample_for(self, requests, logits):
+        temperature = torch.tensor([r.temperature for r in requests], device=logits.device)
+        top_p = torch.tensor([r.top_p for r in requests], device=logits.device)
+        return _sample(logits, temperature, top_p)
+
+    def _emit(self, tokens: torch.Tensor, requests: List[GenerationRequest]):
+        for request, token in zip(requests, tokens.tolist()):
+            request._push(token)
+
+    def _retire(self):
+        """Finish sequences that hit EOS or their token budget and drop them from the batch."""
+        keep = []
+        for i, request in enumerate(self._requests):
+            if (request.cancelled or request.generated[-1] in self.eos_token_ids
+                    or len(request.generated) >= request.max_new_tokens):
+                request._finish()
+            else:
+                keep.append(i)
+        if len(keep) == len(self._requests):
+            return
+        if not keep:
+            self._reset()
+            return
+
+        index = torch.tensor(keep, device=self._attention_mask.device)
+        self._requests = [self._requests[i] for i in keep]
+        self._attention_mask = self._attention_mask.index_select(0, index)
+        self._next_tokens = self._next_tokens.index_select(0, index)
+        self._cache = [(k.index_select(0, index), v.index_select(0, index)) for k, v in self._cache]
+
+        # Trim time steps that are padding for every remaining sequence
+        first = int(self._attention_mask.any(dim=0).nonzero()[0])
+        if first > 0:
+            self._attention_mask = self._attention_mask[:, first:]
+            self._cache = [(k[:, :, first:], v[:, :, first:]) for k, v in self._cache]
@@ -1,13 +1,63 @@
 # src/inference/llm_model.py
 
-from threading import Thread
+import os
+import threading
+import time
+from threading import Event, Thread
 
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+from src.inference.device import detect_device
+from src.inference.prefix_cache import PrefixKVCache
+
+DEFAULT_LLM_MODEL = "google/gemma-3-1b-it"
+
+
+def iter_text_deltas(tokenizer, token_ids):
+    """
+    Turn a stream of token ids into decoded text deltas.
+
+    Only a short window is decoded per token: the tokens since the last
+    delta plus the ones before it (so the tokenizer sees the same context
+    and spacing as in a full decode), and the text past that context is
+    yielded. This keeps streaming linear in the output length. A delta
+    ending in an incomplete multi-byte character (e.g. Korean split across
+    tokens) is held back until the next token completes it.
+    """
+    ids = []
+    prefix_offset = read_offset = 0
+    for token_id in token_ids:
+        ids.append(token_id)
+        prefix_text = tokenizer.decode(ids[prefix_offset:read_offset], skip_special_tokens=True)
+        text = tokenizer.decode(ids[prefix_offset:], skip_special_tokens=True)
+        if len(text) > len(prefix_text) and not text.endswith("\ufffd"):
+            yield text[len(prefix_text):]
+            prefix_offset, read_offset = read_offset, len(ids)
+
+
+def _cancel_criteria(event: Event):
+    """``StoppingCriteriaList`` that stops ``model.generate`` once *event* is set."""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return event.is_set()
+
+    return StoppingCriteriaList([_CancelCriteria()])
 
 
 class LocalLLM:
-    def __init__(self, model_name, attn_implementation="flash_attention_2", device="gpu"):
+    def __init__(self, model_name, attn_implementation="flash_attention_2", device="gpu",
+                 prefix_cache_bytes: int = 512 * 1024 ** 2):
+        """
+        Local chat LLM.
+
+        Key/values of recent prompts are kept in a :class:`PrefixKVCache` of
+        *prefix_cache_bytes* (``0`` disables it), so a prompt that starts like
+        an earlier one (chat template, system prompt, the same retrieved
+        context in a follow-up question) only prefills its new tokens.
+        """
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
         self.device = device
         self.tokenizer = AutoTokenizer.from_pretrained(
             model_name,
@@ -24,54 +74,227 @@ class LocalLLM:
         ).to(self.device)
 
         self.model.eval()
+        self.scheduler = None
+        self.prefix_cache = PrefixKVCache(max_bytes=prefix_cache_bytes) if prefix_cache_bytes else None
+
+    def enable_batching(self, max_batch_size: int = 8):
+        """
+        Route all subsequent ``generate`` calls through a continuous-batching
+        :class:`GenerationScheduler`, so concurrent callers share decode steps
+        instead of queueing behind each other.
+        """
+        from src.inference.generation_scheduler import GenerationScheduler
+
+        if self.scheduler is None:
+            self.scheduler = GenerationScheduler(self.model, self.tokenizer, self.device,
+                                                 max_batch_size=max_batch_size,
+                                                 prefix_cache=self.prefix_cache).start()
+        return self.scheduler
 
-    def generate(self, prompt, streaming=False):
+    def _encode_prompt(self, prompt):
         messages = [{"role": "user", "content": prompt}]
-        input_ids = self.tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=True,
             add_generation_prompt=True,
             return_tensors="pt"
         )
-        if streaming:
-            streamer = TextIteratorStreamer(self.tokenizer)
+
+    def _prompt_cache(self, input_ids):
+        """
+        ``(past_key_values, n)`` for ``model.generate``: a ``DynamicCache``
+        holding the cached key/values of the first *n* prompt tokens (empty
+        on a miss), or ``(None, 0)`` without a prefix cache. Generation
+        appends to it, so afterwards it holds the whole prompt for
+        :meth:`_store_prompt_cache`.
+        """
+        if self.prefix_cache is None:
+            return None, 0
+        from transformers import DynamicCache
+
+        n, past = self.prefix_cache.lookup(input_ids[0].tolist())
+        return (DynamicCache.from_legacy_cache(tuple(past)) if past is not None else DynamicCache()), n
+
+    def _store_prompt_cache(self, input_ids, past_key_values):
+        if past_key_values is None:
+            return
+        from src.inference.generation_scheduler import _legacy_cache
+
+        self.prefix_cache.store(input_ids[0].tolist(), _legacy_cache(past_key_values))
+
+    def generate_stream(self, prompt, max_new_tokens=4096, stats: dict = None):
+        """
+        Yield the answer as decoded text deltas while it is being generated.
+
+        Parameters
+        ----------
+        prompt : str
+            User prompt (wrapped in the chat template).
+        max_new_tokens : int, default = 4096
+            Generation budget.
+        stats : dict, optional
+            Filled with ``"time_to_first_token"`` and ``"total"`` (seconds),
+            ``"inter_token_latencies"`` (seconds between consecutive deltas),
+            ``"num_deltas"`` and ``"prefix_tokens"`` (prompt tokens whose
+            key/values came from the prefix cache).
+
+        Notes
+        -----
+        Closing the generator early (e.g. a disconnected client) stops the
+        underlying generation instead of letting it run to *max_new_tokens*.
+        """
+        start = time.perf_counter()
+        input_ids = self._encode_prompt(prompt)
+        thread = None
+        cancel = Event()
+        past_key_values, prefix_tokens = None, 0
+
+        if self.scheduler is not None:
+            request = self.scheduler.submit(input_ids[0].tolist(), max_new_tokens=max_new_tokens,
+                                            temperature=0.6, top_p=0.95)
+            deltas = iter_text_deltas(self.tokenizer, request)
+            cancel_fn = request.cancel
+        else:
+            from transformers import TextIteratorStreamer
+
+            past_key_values, prefix_tokens = self._prompt_cache(input_ids)
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
             thread = Thread(target=self.model.generate, kwargs=dict(
                 input_ids=input_ids.to(self.device),
                 eos_token_id=self.tokenizer.eos_token_id,
-                max_new_tokens=4096,
+                max_new_tokens=max_new_tokens,
                 do_sample=True,
                 temperature=0.6,
                 top_p=0.95,
-                streamer=streamer
+                streamer=streamer,
+                stopping_criteria=_cancel_criteria(cancel),
+                past_key_values=past_key_values,
             ))
             thread.start()
+            deltas = streamer
+            cancel_fn = cancel.set
+
+        gaps = []
+        last = None
+        finished = False
+        try:
+            for text in deltas:
+                if not text:
+                    continue
+                now = time.perf_counter()
+                if last is None:
+                    if stats is not None:
+                        stats["time_to_first_token"] = now - start
+                else:
+                    gaps.append(now - last)
+                last = now
+                yield text
+            finished = True
+        finally:
+            if not finished:
+                cancel_fn()
+            if thread is not None:
+                thread.join()
+                self._store_prompt_cache(input_ids, past_key_values)
+            if stats is not None:
+                stats["prefix_tokens"] = request.prefix_tokens if thread is None else prefix_tokens
+                stats["inter_token_latencies"] = gaps
+                stats["num_deltas"] = len(gaps) + (last is not None)
+                stats["total"] = time.perf_counter() - start
 
-            for text in streamer:
+    def generate(self, prompt, streaming=False, max_new_tokens=4096):
+        """
+        Generate a completion for *prompt*.
+
+        With ``streaming=True`` the text is also printed as it is generated.
+        Either way only the generated text is returned (no prompt echo, no
+        special tokens), the same text :meth:`generate_stream` yields.
+        """
+        if streaming:
+            parts = []
+            for text in self.generate_stream(prompt, max_new_tokens=max_new_tokens):
                 print(text, end="", flush=True)
-            return text
+                parts.append(text)
+            return "".join(parts)
 
-        else:
-            output = self.model.generate(
-                input_ids.to(self.device),
-                eos_token_id=self.tokenizer.eos_token_id,
-                max_new_tokens=4096,
-                do_sample=True,
-                temperature=0.6,
-                top_p=0.95,
-            )
-            return self.tokenizer.decode(output[0])
-
-
-if torch.cuda.is_available():
-    device = "cuda"
-    attn_implementation = "flash_attention_2"
-elif torch.backends.mps.is_available():
-    device = "mps"
-    attn_implementation = "sdpa"
-else:
-    device = "cpu"
-    attn_implementation = "sdpa"
-
-local_llm = LocalLLM(model_name="google/gemma-3-1b-it",
-                     attn_implementation=attn_implementation,
-                     device=device)
+        input_ids = self._encode_prompt(prompt)
+        if self.scheduler is not None:
+            prompt_ids = input_ids[0].tolist()
+            request = self.scheduler.submit(prompt_ids, max_new_tokens=max_new_tokens, temperature=0.6, top_p=0.95)
+            return self.tokenizer.decode(request.result(), skip_special_tokens=True)
+
+        past_key_values, _ = self._prompt_cache(input_ids)
+        output = self.model.generate(
+            input_ids.to(self.device),
+            eos_token_id=self.tokenizer.eos_token_id,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=0.6,
+            top_p=0.95,
+            past_key_values=past_key_values,
+        )
+        self._store_prompt_cache(input_ids, past_key_values)
+        return self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_local_llm() -> LocalLLM:
+    """
+    Return the process-wide :class:`LocalLLM`, loading it on first use.
+
+    Loading is guarded by a lock, so concurrent first callers wait for a
+    single load instead of each loading the model. ``QUERYDOC_PREFIX_CACHE_MB``
+    (default 512, ``0`` disables) sizes its prompt prefix cache.
+    """
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                device = detect_device()
+                attn_implementation = "flash_attention_2" if device == "cuda" else "sdpa"
+                prefix_cache_mb = int(os.environ.get("QUERYDOC_PREFIX_CACHE_MB", "512"))
+                _instance = LocalLLM(model_name=DEFAULT_LLM_MODEL,
+                                     attn_implementation=attn_implementation,
+                                     device=device,
+                                     prefix_cache_bytes=prefix_cache_mb * 1024 ** 2)
+    return _instance
+
+
+_tokenizer = None
+
+
+def get_llm_tokenizer():
+    """
+    Return the tokenizer of the local LLM without loading the model.
+
+    Prompt-side work (e.g. counting context tokens) can run before or
+    without the model; once the model is loaded its own tokenizer is used.
+    """
+    global _tokenizer
+    if _instance is not None:
+        return _instance.tokenizer
+    if _tokenizer is None:
+        with _instance_lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(DEFAULT_LLM_MODEL, trust_remote_code=True,
+                                                           cache_dir="data/hub")
+    return _tokenizer
+
+
+def warm_up() -> LocalLLM:
+    """Load the shared LLM and generate a few tokens so the first request does not pay for it."""
+    llm = get_local_llm()
+    llm.generate("Hello", max_new_tokens=4)
+    return llm
+
+
+def __getattr__(name):
+    # Backwards compatibility: ``from ... import local_llm`` loads lazily
+    if name == "local_llm":
+        return get_local_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
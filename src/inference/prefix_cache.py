@@ -0,0 +1,129 @@
+# src/inference/prefix_cache.py
+
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def common_prefix_length(a: np.ndarray, b: np.ndarray) -> int:
+    """Number of leading token ids *a* and *b* have in common."""
+    n = min(len(a), len(b))
+    mismatch = np.flatnonzero(a[:n] != b[:n])
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+def kv_nbytes(past_key_values) -> int:
+    """Memory held by per-layer ``(key, value)`` tensors."""
+    return sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in past_key_values)
+
+
+class PrefixKVCache:
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2, min_prefix_tokens: int = 16):
+        """
+        Past key/values of recent prompts, reused by later prompts that start
+        with the same tokens.
+
+        Every prompt's key/values (per layer ``(key, value)`` of shape
+        ``(1, heads, prompt_len, head_dim)``, as the ``GenerationScheduler``
+        keeps them) are stored under its token ids. A new prompt is matched
+        against all entries and the longest common token prefix is reused, so
+        the chat template and system prompt are shared by every request and
+        the retrieved context by follow-up questions over the same chunks;
+        only the remaining tokens need a prefill. Entries are evicted least
+        recently used first once they hold more than *max_bytes*.
+
+        Parameters
+        ----------
+        max_bytes : int, default = 512 MiB
+            Memory budget of the stored tensors.
+        min_prefix_tokens : int, default = 16
+            Shorter matches are not worth a lookup hit and are ignored.
+        """
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries: "OrderedDict[tuple, Tuple[np.ndarray, list, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def lookup(self, input_ids: Sequence[int]) -> Tuple[int, Optional[List[tuple]]]:
+        """
+        Longest cached prefix of *input_ids*.
+
+        Returns
+        -------
+        tuple
+            ``(n, past_key_values)``: the key/values of ``input_ids[:n]``
+            (views, not copies) with ``n < len(input_ids)`` so at least one
+            token is left to compute logits from, or ``(0, None)``.
+        """
+        ids = np.asarray(input_ids, dtype=np.int64)
+        with self._lock:
+            best_len, best_key = 0, None
+            for key, (prefix, _, _) in self._entries.items():
+                n = common_prefix_length(prefix, ids)
+                if n > best_len:
+                    best_len, best_key = n, key
+            n = min(best_len, len(ids) - 1)
+            if n < self.min_prefix_tokens:
+                self.misses += 1
+                return 0, None
+            self._entries.move_to_end(best_key)
+            past = self._entries[best_key][1]
+            self.hits += 1
+            self.reused_tokens += n
+        return n, [(k[:, :, :n], v[:, :, :n]) for k, v in past]
+
+    def store(self, input_ids: Sequence[int], past_key_values: Sequence[tuple]):
+        """
+        Remember the key/values of a prompt.
+
+        *past_key_values* must start with the prompt's tokens (it may hold
+        generated tokens after them); the first ``len(input_ids)`` time steps
+        are copied. Caches that keep fewer time steps (sliding-window layers)
+        cannot serve as a prefix and are skipped.
+        """
+        key = tuple(int(t) for t in input_ids)
+        length = len(key)
+        if length < self.min_prefix_tokens or any(k.shape[2] < length for k, _ in past_key_values):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+        past = [(k[:, :, :length].clone(), v[:, :, :length].clone()) for k, v in past_key_values]
+        nbytes = kv_nbytes(past)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+            # Entries that are a prefix of this prompt are covered by it
+            for old in [k for k in self._entries if len(k) < length and key[:len(k)] == k]:
+                self._bytes -= self._entries.pop(old)[2]
+            self._entries[key] = (np.asarray(key, dtype=np.int64), past, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+                "reused_tokens": self.reused_tokens}
@@ -0,0 +1,104 @@
+# src/inference/reranker.py
+
+import hashlib
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+from src.inference.device import detect_device
+from src.utils.lru_cache import LRUCache
+
+DEFAULT_RERANKER_MODEL = "BAAI/bge-reranker-v2-m3"
+
+
+class PairScoreCache(LRUCache):
+    def __init__(self, max_size: int = 4096, ttl: float = 3600.0):
+        """
+        LRU memo of cross-encoder scores keyed by (whitespace-normalized
+        query, digest of the passage), see :class:`LRUCache`.
+        """
+        super().__init__(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def pair_key(query: str, passage: str) -> tuple:
+        return " ".join(query.split()), hashlib.blake2b(passage.encode("utf-8"), digest_size=16).digest()
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = DEFAULT_RERANKER_MODEL, device: str = "cpu", batch_size: int = 16,
+                 max_length: int = 512, cache_size: int = 4096, cache_ttl: float = 3600.0):
+        """
+        Local cross-encoder that scores (query, passage) pairs.
+
+        Pairs are scored in batches of *batch_size*, grouped by token length
+        so each batch is padded only to its own longest pair. Scores are
+        memoized in a :class:`PairScoreCache` of *cache_size* entries
+        (``0`` disables it) expiring after *cache_ttl* seconds, so passages
+        retrieved again for the same question are not re-scored.
+        """
+        import torch
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir="data/hub")
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            model_name, cache_dir="data/hub",
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+        ).to(device).eval()
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.cache = PairScoreCache(max_size=cache_size, ttl=cache_ttl) if cache_size else None
+
+    def _forward(self, query: str, passages: List[str]) -> np.ndarray:
+        """Score uncached pairs, in length-bucketed batches."""
+        import torch
+
+        lengths = [len(ids) for ids in self.tokenizer([query] * len(passages), passages, truncation=True,
+                                                      max_length=self.max_length)["input_ids"]]
+        order = np.argsort(lengths, kind="stable")
+        scores = np.empty(len(passages), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            enc = self.tokenizer([query] * len(batch), [passages[i] for i in batch], padding=True,
+                                 truncation=True, max_length=self.max_length, return_tensors="pt")
+            with torch.inference_mode():
+                logits = self.model(**enc.to(self.device)).logits
+            scores[batch] = logits.view(-1).float().cpu().numpy()
+        return scores
+
+    def score(self, query: str, passages: List[str]) -> np.ndarray:
+        """Relevance score of each passage for *query* (higher is better)."""
+        scores = np.empty(len(passages), dtype=np.float32)
+        missing = []
+        for i, passage in enumerate(passages):
+            cached = self.cache.get(PairScoreCache.pair_key(query, passage)) if self.cache is not None else None
+            if cached is None:
+                missing.append(i)
+            else:
+                scores[i] = cached
+        if missing:
+            fresh = self._forward(query, [passages[i] for i in missing])
+            scores[missing] = fresh
+            if self.cache is not None:
+                for i, s in zip(missing, fresh):
+                    self.cache.put(PairScoreCache.pair_key(query, passages[i]), float(s))
+        return scores
+
+    def score_hits(self, query: str, hits: List[Dict]) -> np.ndarray:
+        """:meth:`score` for retrieved chunks (their ``metadata["content"]``)."""
+        return self.score(query, [h.get("metadata", {}).get("content", "") for h in hits])
+
+
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """Return the process-wide :class:`CrossEncoderReranker`, loading it on first use."""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = CrossEncoderReranker(DEFAULT_RERANKER_MODEL, device=detect_device())
+    return _instance
@@ -0,0 +1,134 @@
+# src/search/bm25.py
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_index import top_k_indices
+
+# Latin/digit runs (identifiers and part numbers such as "ab-1234" or "v2.1"
+# stay whole) and Hangul runs; everything else separates tokens.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*|[가-힣]+")
+_ID_SEPARATOR = re.compile(r"[._\-/]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split *text* into BM25 terms.
+
+    - Latin letters and digits are lowercased and kept as whole tokens;
+      compound identifiers (``"ab-1234"``, ``"config.yaml"``) are emitted
+      whole and as their parts, so both exact and partial matches score.
+    - Korean words are split into character bigrams (a single-syllable word
+      is kept as is), which matches across particles and compounds without
+      a morphological analyzer (``"설치방법을"`` → ``설치, 치방, 방법, 법을``).
+    """
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        tok = match.group()
+        if tok[0] >= "가":
+            if len(tok) == 1:
+                tokens.append(tok)
+            else:
+                tokens.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+        else:
+            tokens.append(tok)
+            if _ID_SEPARATOR.search(tok):
+                tokens.extend(part for part in _ID_SEPARATOR.split(tok) if part)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, terms: Iterable[str], indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 doc_len: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        """
+        BM25 inverted index over the rows of a chunk index.
+
+        Posting lists are stored CSR-style: the postings of term ``t`` are
+        ``doc_ids[indptr[t]:indptr[t + 1]]`` (``int32`` rows) with their
+        precomputed BM25 term weights in ``weights`` (``float32``), so scoring
+        a query is one gather plus one ``bincount`` over its postings. Use
+        :meth:`build` to create an index from texts.
+        """
+        self.terms = list(terms)
+        self.vocab: Dict[str, int] = {t: i for i, t in enumerate(self.terms)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.doc_len = np.asarray(doc_len, dtype=np.int32)
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Tokenize *texts* (one per row) and build the posting lists."""
+        vocab: Dict[str, int] = {}
+        flat: List[int] = []
+        lengths: List[int] = []
+        for text in texts:
+            tokens = tokenize(text or "")
+            flat.extend(vocab.setdefault(t, len(vocab)) for t in tokens)
+            lengths.append(len(tokens))
+
+        n_docs = len(lengths)
+        doc_len = np.asarray(lengths, dtype=np.int64)
+        term_ids = np.asarray(flat, dtype=np.int64)
+        docs = np.repeat(np.arange(n_docs, dtype=np.int64), doc_len)
+
+        # One key per (term, doc) pair; unique() sorts by term, then row, and
+        # yields the term frequencies as counts.
+        keys, tf = np.unique(term_ids * max(n_docs, 1) + docs, return_counts=True)
+        post_terms = keys // max(n_docs, 1)
+        post_docs = keys % max(n_docs, 1)
+        df = np.bincount(post_terms, minlength=len(vocab))
+        indptr = np.concatenate(([0], np.cumsum(df)))
+
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        avgdl = doc_len.mean() if n_docs and doc_len.sum() else 1.0
+        norm = k1 * (1 - b + b * doc_len[post_docs] / avgdl)
+        weights = idf[post_terms] * tf * (k1 + 1) / (tf + norm)
+        return cls(vocab, indptr, post_docs, weights, doc_len, k1=k1, b=b)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def score(self, query: str) -> np.ndarray:
+        """BM25 score of every row for *query* (``float32``, zeros for rows without a match)."""
+        ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not ids:
+            return np.zeros(len(self), dtype=np.float32)
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in ids]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return np.bincount(docs, weights=weights, minlength=len(self)).astype(np.float32)
+
+    def search(self, query: str, top_k: int = 10, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top *top_k* rows by BM25 score, optionally restricted to *rows*.
+
+        Returns
+        -------
+        tuple
+            ``(rows, scores)`` sorted by descending score; rows without any
+            query term are never returned.
+        """
+        scores = self.score(query)
+        if rows is not None:
+            rows = np.asarray(rows)
+            scores = scores[rows]
+        top = top_k_indices(scores, top_k)
+        top = top[scores[top] > 0]
+        ids = top if rows is None else rows[top]
+        return ids.astype(np.int64), scores[top]
+
+    def save(self, path: str):
+        np.savez(path, terms=np.asarray(self.terms, dtype=str), indptr=self.indptr, doc_ids=self.doc_ids,
+                 weights=self.weights, doc_len=self.doc_len, params=np.asarray([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        data = np.load(path, allow_pickle=False)
+        k1, b = data["params"].tolist()
+        return cls(data["terms"].tolist(), data["indptr"], data["doc_ids"], data["weights"], data["doc_len"],
+                   k1=k1, b=b)
@@ -0,0 +1,454 @@
+# src/search/chunk_index.py
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .bm25 import BM25Index
+from .multi_vector import MultiVectorStore, SparseIndex
+from .vector_index import ExactIndex, VectorIndex, build_vector_index, dot_scores, normalize_queries, top_k_indices
+
+
+class ChunkIndex:
+    def __init__(self, embeddings, metadata: List[Dict], normalized: bool = False):
+        """
+        Matrix-backed chunk index.
+
+        All chunk embeddings live in one contiguous ``float32`` matrix whose rows
+        are L2-normalized, so cosine similarity against every chunk is a single
+        matrix-vector product. A pre-normalized ``float16`` matrix (or a
+        read-only ``np.memmap`` of either dtype) is kept as-is and scored in
+        ``float32`` blocks.
+
+        Parameters
+        ----------
+        embeddings : array-like
+            Matrix of shape ``(num_chunks, emb_dim)``.
+        metadata : list[dict]
+            Chunk metadata, parallel to the rows of *embeddings*
+            (``{"section_title": "...", "content": "...", ...}``).
+        normalized : bool, default = False
+            If ``True``, the rows are assumed to be unit length already and are
+            used without copying, which keeps memory-mapped matrices shared.
+        """
+        embeddings = np.asarray(embeddings)
+        if embeddings.dtype not in (np.float32, np.float16) or not normalized:
+            embeddings = embeddings.astype(np.float32, copy=False)
+        if embeddings.size == 0:
+            embeddings = embeddings.reshape(0, embeddings.shape[-1] if embeddings.ndim == 2 else 0)
+        if embeddings.shape[0] != len(metadata):
+            raise ValueError(
+                f"embeddings has {embeddings.shape[0]} rows but metadata has {len(metadata)} entries"
+            )
+        if not normalized:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / (norms + 1e-8)
+
+        self.embeddings = np.ascontiguousarray(embeddings)
+        self.metadata = list(metadata)
+
+        # Section-id column: one small integer per row. A section is identified
+        # by (file_path, section_title) so equal titles in different PDFs stay
+        # apart.
+        self.section_keys: List[Tuple[Optional[str], str]] = []
+        self._section_lookup: Dict[Tuple[Optional[str], str], int] = {}
+        self._title_lookup: Dict[str, List[int]] = {}
+        section_ids = np.empty(len(self.metadata), dtype=np.int32)
+        for row, meta in enumerate(self.metadata):
+            key = (meta.get("file_path"), meta.get("section_title", ""))
+            sid = self._section_lookup.get(key)
+            if sid is None:
+                sid = len(self.section_keys)
+                self._section_lookup[key] = sid
+                self._title_lookup.setdefault(key[1], []).append(sid)
+                self.section_keys.append(key)
+            section_ids[row] = sid
+        self.section_ids = section_ids
+
+        # Backend used for unrestricted searches (see src/search/vector_index.py)
+        self.backend: VectorIndex = ExactIndex(self.embeddings)
+        # BM25 index over the chunk texts, built on first lexical search
+        self.lexical: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
+        # Optional bge-m3 lexical-weight index and token vectors (see src/search/multi_vector.py)
+        self.sparse: Optional[SparseIndex] = None
+        self.multi_vectors: Optional[MultiVectorStore] = None
+
+        # Inverted mapping section-id -> rows, stored CSR-style: the rows of
+        # section ``sid`` are ``_section_rows[_section_offsets[sid]:_section_offsets[sid + 1]]``.
+        self._section_rows = np.argsort(section_ids, kind="stable")
+        counts = np.bincount(section_ids, minlength=len(self.section_keys))
+        self._section_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    @classmethod
+    def from_records(cls, records: List[Dict]) -> "ChunkIndex":
+        """
+        Build an index from the legacy list format
+        ``[{"embedding": [...], "metadata": {...}}, ...]``.
+        """
+        embeddings = np.asarray([r["embedding"] for r in records], dtype=np.float32)
+        metadata = [r["metadata"] for r in records]
+        return cls(embeddings, metadata)
+
+    def __len__(self):
+        return len(self.metadata)
+
+    @property
+    def dim(self) -> int:
+        return self.embeddings.shape[1]
+
+    def section_ids_for(self, sections: List[Dict]) -> List[int]:
+        """
+        Resolve section dictionaries to section ids.
+
+        A section carrying a ``"file_path"`` matches only chunks from that
+        document; without one, every document's section of that title matches.
+        """
+        ids = []
+        seen = set()
+        for sec in sections:
+            title = sec.get("title")
+            file_path = sec.get("file_path")
+            sid = self._section_lookup.get((file_path, title)) if file_path is not None else None
+            candidates = [sid] if sid is not None else self._title_lookup.get(title, [])
+            for c in candidates:
+                if c not in seen:
+                    seen.add(c)
+                    ids.append(c)
+        return ids
+
+    def rows_for_sections(self, sections: List[Dict]) -> np.ndarray:
+        """
+        Return the row ids of every chunk that belongs to one of *sections*,
+        gathered from the precomputed section-to-rows mapping.
+        """
+        ids = self.section_ids_for(sections)
+        if not ids:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate([
+            self._section_rows[self._section_offsets[sid]:self._section_offsets[sid + 1]]
+            for sid in ids
+        ])
+        # Ascending row order keeps the embedding gather sequential in memory
+        rows.sort()
+        return rows
+
+    def record(self, row: int, score: Optional[float] = None) -> Dict:
+        """Return the chunk at *row* in the ``{"embedding", "metadata"}`` format."""
+        item = {
+            "embedding": self.embeddings[row],
+            "metadata": self.metadata[row],
+            "row": int(row),
+        }
+        if score is not None:
+            item["score"] = float(score)
+        return item
+
+    def score(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Dot products between the normalized query *q* and every row (or *rows*).
+        A 2-D *q* of shape ``(num_queries, dim)`` yields ``(num_rows, num_queries)``.
+        """
+        mat = self.embeddings if rows is None else self.embeddings[rows]
+        return dot_scores(mat, q)
+
+    def set_backend(self, backend: VectorIndex):
+        """Use *backend* (built over ``self.embeddings``) for unrestricted searches."""
+        self.backend = backend
+
+    def use_backend(self, kind: str, **params):
+        """Build and use a *kind* backend (see ``VECTOR_INDEX_TYPES``) unless it is already in use."""
+        if self.backend.kind != kind:
+            self.set_backend(build_vector_index(kind, self.embeddings, **params))
+
+    def set_lexical(self, lexical: BM25Index):
+        """Use *lexical* (built over the rows of this index, in order) for lexical searches."""
+        if len(lexical) != len(self):
+            raise ValueError(f"lexical index has {len(lexical)} rows but the chunk index has {len(self)}")
+        self.lexical = lexical
+
+    def lexical_index(self) -> BM25Index:
+        """Return the BM25 index, building it from the chunk contents if none was set."""
+        if self.lexical is None:
+            # Concurrent first queries must not each build (and race to assign) their own index
+            with self._lexical_lock:
+                if self.lexical is None:
+                    self.lexical = BM25Index.build(m.get("content", "") for m in self.metadata)
+        return self.lexical
+
+    def lexical_search(self, query: str, top_k: int = 10, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        BM25 search over the whole index or a subset of rows.
+
+        Returns chunks like :meth:`search`, with the BM25 score as ``"score"``.
+        """
+        ids, scores = self.lexical_index().search(query, top_k=top_k, rows=rows)
+        return [self.record(r, s) for r, s in zip(ids, scores)]
+
+    def set_sparse(self, sparse: SparseIndex):
+        """Use *sparse* (bge-m3 lexical weights of the rows of this index) for :meth:`sparse_search`."""
+        if len(sparse) != len(self):
+            raise ValueError(f"sparse index has {len(sparse)} rows but the chunk index has {len(self)}")
+        self.sparse = sparse
+
+    def set_multi_vectors(self, store: MultiVectorStore):
+        """Use *store* (token vectors of the rows of this index) for :meth:`maxsim_scores`."""
+        if len(store) != len(self):
+            raise ValueError(f"multi-vector store has {len(store)} rows but the chunk index has {len(self)}")
+        self.multi_vectors = store
+
+    def sparse_search(self, query_weights: Dict, top_k: int = 10, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """Search the bge-m3 lexical-weight index; chunks are returned like :meth:`lexical_search`."""
+        ids, scores = self.sparse.search(query_weights, top_k=top_k, rows=rows)
+        return [self.record(r, s) for r, s in zip(ids, scores)]
+
+    def maxsim_scores(self, query_vectors: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Late-interaction scores of *rows* (see :meth:`MultiVectorStore.maxsim`)."""
+        return self.multi_vectors.maxsim(query_vectors, rows)
+
+    def search(self, query_emb, top_k: int = 10, rows: Optional[np.ndarray] = None,
+               **search_params) -> List[Dict]:
+        """
+        Cosine-similarity search over the whole index or a subset of rows.
+
+        Parameters
+        ----------
+        query_emb : list[float] | np.ndarray
+            Embedding vector of the query.
+        top_k : int, default = 10
+            Number of chunks to return.
+        rows : np.ndarray, optional
+            Restrict scoring to these row ids. Restricted searches are always
+            exact; only unrestricted ones go through ``self.backend``.
+        **search_params
+            Per-query backend options, e.g. ``nprobe`` for an IVF backend.
+
+        Returns
+        -------
+        list[dict]
+            Chunks sorted by descending similarity, each with ``"score"`` and
+            ``"row"`` keys in addition to ``"embedding"`` and ``"metadata"``.
+        """
+        if len(self) == 0:
+            return []
+        q = normalize_queries(query_emb)
+
+        if rows is None:
+            scores, ids = self.backend.search(q, top_k, **search_params)
+            return [self.record(r, s) for r, s in zip(ids[0], scores[0]) if r >= 0]
+
+        scores = self.score(q[0], rows)
+        top = top_k_indices(scores, top_k)
+        return [self.record(r, s) for r, s in zip(rows[top], scores[top])]
+
+    def search_batch(self, query_embs, top_k: int = 10, rows_per_query: Optional[List[Optional[np.ndarray]]] = None,
+                     **search_params) -> List[List[Dict]]:
+        """
+        Search many queries at once.
+
+        Unrestricted queries go to the backend as one ``(num_queries, dim)``
+        batch (a single matrix-matrix product for the exact backend). Queries
+        restricted to row subsets are scored together against the union of
+        their rows, again with one matrix-matrix product.
+
+        Parameters
+        ----------
+        query_embs : np.ndarray
+            ``(num_queries, dim)`` query embeddings.
+        top_k : int, default = 10
+            Number of chunks to return per query.
+        rows_per_query : list[np.ndarray | None], optional
+            Row subset for each query; ``None`` searches the whole index.
+
+        Returns
+        -------
+        list[list[dict]]
+            Ranked chunks for each query, as returned by :meth:`search`.
+        """
+        q = normalize_queries(query_embs)
+        results: List[List[Dict]] = [[] for _ in range(q.shape[0])]
+        if len(self) == 0:
+            return results
+        if rows_per_query is None:
+            rows_per_query = [None] * q.shape[0]
+
+        full = [b for b, rows in enumerate(rows_per_query) if rows is None]
+        if full:
+            scores, ids = self.backend.search(q[full], top_k, **search_params)
+            for j, b in enumerate(full):
+                results[b] = [self.record(r, s) for r, s in zip(ids[j], scores[j]) if r >= 0]
+
+        restricted = [b for b, rows in enumerate(rows_per_query) if rows is not None]
+        if restricted:
+            union = np.unique(np.concatenate([rows_per_query[b] for b in restricted]))
+            scores = self.score(q[restricted], union)  # (len(union), len(restricted))
+            for j, b in enumerate(restricted):
+                rows = rows_per_query[b]
+                col = scores[np.searchsorted(union, rows), j]
+                top = top_k_indices(col, top_k)
+                results[b] = [self.record(r, s) for r, s in zip(rows[top], col[top])]
+        return results
+
+
+def _merge_top_k(hits: List[Dict], top_k: int) -> List[Dict]:
+    return sorted(hits, key=lambda h: -h["score"])[:top_k]
+
+
+class MultiChunkIndex:
+    def __init__(self, indexes: List[ChunkIndex]):
+        """
+        Several :class:`ChunkIndex` objects searched as one virtual index.
+
+        Nothing is concatenated: every part keeps its own (memory-mapped)
+        matrix, each part is searched for its own top-k and the results are
+        merged. Rows are numbered globally, part after part, so row ids from
+        :meth:`rows_for_sections` can be passed back to :meth:`search` just
+        like with a single index.
+        """
+        self.parts = [p for p in indexes if len(p)]
+        self._offsets = np.concatenate(([0], np.cumsum([len(p) for p in self.parts]))).astype(np.int64)
+        # BM25 index over the chunk texts of all parts, built on first lexical search
+        self.lexical: Optional[BM25Index] = None
+        self._lexical_lock = threading.Lock()
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    @property
+    def dim(self) -> int:
+        return self.parts[0].dim if self.parts else 0
+
+    @property
+    def metadata(self) -> List[Dict]:
+        return [m for p in self.parts for m in p.metadata]
+
+    def _split_rows(self, rows: np.ndarray) -> List[np.ndarray]:
+        """Split ascending global *rows* into local row arrays, one per part."""
+        bounds = np.searchsorted(rows, self._offsets)
+        return [rows[bounds[i]:bounds[i + 1]] - self._offsets[i] for i in range(len(self.parts))]
+
+    def _globalize(self, part: int, hits: List[Dict]) -> List[Dict]:
+        for hit in hits:
+            hit["row"] += int(self._offsets[part])
+        return hits
+
+    def rows_for_sections(self, sections: List[Dict]) -> np.ndarray:
+        """
+        Global row ids of every chunk that belongs to one of *sections*.
+
+        The title-only fallback of :meth:`ChunkIndex.section_ids_for` is
+        decided across all parts: a section whose ``(file_path, title)``
+        exists in any part matches only there.
+        """
+        per_part: List[List[Dict]] = [[] for _ in self.parts]
+        for sec in sections:
+            key = (sec.get("file_path"), sec.get("title"))
+            owners = [i for i, p in enumerate(self.parts) if key in p._section_lookup] \
+                if key[0] is not None else []
+            if owners:
+                for i in owners:
+                    per_part[i].append(sec)
+            else:
+                title_only = {k: v for k, v in sec.items() if k != "file_path"}
+                for secs in per_part:
+                    secs.append(title_only)
+        rows = [p.rows_for_sections(per_part[i]) + self._offsets[i] for i, p in enumerate(self.parts)]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def record(self, row: int, score: Optional[float] = None) -> Dict:
+        part = int(np.searchsorted(self._offsets, row, side="right")) - 1
+        item = self.parts[part].record(row - self._offsets[part], score)
+        item["row"] = int(row)
+        return item
+
+    def use_backend(self, kind: str, **params):
+        """Use a *kind* backend in every part."""
+        for p in self.parts:
+            p.use_backend(kind, **params)
+
+    @property
+    def sparse(self) -> Optional[List[SparseIndex]]:
+        """The sparse index of every part, or ``None`` unless all parts have one."""
+        if self.parts and all(p.sparse is not None for p in self.parts):
+            return [p.sparse for p in self.parts]
+        return None
+
+    @property
+    def multi_vectors(self) -> Optional[List[MultiVectorStore]]:
+        """The token-vector store of every part, or ``None`` unless all parts have one."""
+        if self.parts and all(p.multi_vectors is not None for p in self.parts):
+            return [p.multi_vectors for p in self.parts]
+        return None
+
+    def sparse_search(self, query_weights: Dict, top_k: int = 10, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """Same as :meth:`ChunkIndex.sparse_search`; *rows* are global row ids."""
+        local = self._split_rows(np.asarray(rows)) if rows is not None else [None] * len(self.parts)
+        hits = []
+        for i, p in enumerate(self.parts):
+            if local[i] is not None and len(local[i]) == 0:
+                continue
+            hits.extend(self._globalize(i, p.sparse_search(query_weights, top_k=top_k, rows=local[i])))
+        return _merge_top_k(hits, top_k)
+
+    def maxsim_scores(self, query_vectors: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Same as :meth:`ChunkIndex.maxsim_scores`; *rows* are global row ids in any order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        part_of = np.searchsorted(self._offsets, rows, side="right") - 1
+        scores = np.zeros(len(rows), dtype=np.float32)
+        for i in np.unique(part_of):
+            mask = part_of == i
+            scores[mask] = self.parts[i].maxsim_scores(query_vectors, rows[mask] - self._offsets[i])
+        return scores
+
+    def lexical_index(self) -> BM25Index:
+        """
+        Return one BM25 index over the chunks of every part, in global row
+        order, building it on first use.
+
+        The per-part indexes are not reused: their IDF and average length
+        come from a single document each, so their scores are not comparable
+        across parts.
+        """
+        if self.lexical is None:
+            with self._lexical_lock:
+                if self.lexical is None:
+                    self.lexical = BM25Index.build(m.get("content", "") for p in self.parts for m in p.metadata)
+        return self.lexical
+
+    def lexical_search(self, query: str, top_k: int = 10, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        """Same as :meth:`ChunkIndex.lexical_search`; *rows* are global row ids."""
+        ids, scores = self.lexical_index().search(query, top_k=top_k, rows=rows)
+        return [self.record(r, s) for r, s in zip(ids, scores)]
+
+    def search(self, query_emb, top_k: int = 10, rows: Optional[np.ndarray] = None,
+               **search_params) -> List[Dict]:
+        """Same as :meth:`ChunkIndex.search`; *rows* are global row ids."""
+        local = self._split_rows(np.asarray(rows)) if rows is not None else [None] * len(self.parts)
+        hits = []
+        for i, p in enumerate(self.parts):
+            if local[i] is not None and len(local[i]) == 0:
+                continue
+            hits.extend(self._globalize(i, p.search(query_emb, top_k=top_k, rows=local[i], **search_params)))
+        return _merge_top_k(hits, top_k)
+
+    def search_batch(self, query_embs, top_k: int = 10, rows_per_query: Optional[List[Optional[np.ndarray]]] = None,
+                     **search_params) -> List[List[Dict]]:
+        """Same as :meth:`ChunkIndex.search_batch`; each part is searched with the whole batch."""
+        q = normalize_queries(query_embs)
+        if rows_per_query is None:
+            rows_per_query = [None] * q.shape[0]
+        split = [self._split_rows(np.asarray(rows)) if rows is not None else None for rows in rows_per_query]
+
+        merged: List[List[Dict]] = [[] for _ in range(q.shape[0])]
+        for i, p in enumerate(self.parts):
+            # Queries restricted to rows outside this part skip it
+            batch = [b for b in range(q.shape[0]) if split[b] is None or len(split[b][i])]
+            if not batch:
+                continue
+            results = p.search_batch(q[batch], top_k=top_k,
+                                     rows_per_query=[None if split[b] is None else split[b][i] for b in batch],
+                                     **search_params)
+            for b, hits in zip(batch, results):
+                merged[b].extend(self._globalize(i, hits))
+        return [_merge_top_k(hits, top_k) for hits in merged]
@@ -2,8 +2,21 @@
 
 import numpy as np
 
+from .chunk_index import ChunkIndex
 
-def fine_search_chunks(query_emb, chunk_index, target_sections, top_k=10, fine_only=False):
+
+def _apply_candidates(rows, candidate_rows):
+    """Narrow *rows* (``None`` = all rows) to *candidate_rows*, unless that leaves nothing."""
+    if candidate_rows is None or len(candidate_rows) == 0:
+        return rows
+    candidates = np.unique(np.asarray(candidate_rows, dtype=np.int64))
+    if rows is not None:
+        candidates = np.intersect1d(rows, candidates, assume_unique=True)
+    return candidates if len(candidates) else rows
+
+
+def fine_search_chunks(query_emb, chunk_index, target_sections, top_k=10, fine_only=False, candidate_rows=None,
+                       **search_params):
     """
     Find the most relevant text chunks within the specified sections.
 
@@ -11,8 +24,9 @@ def fine_search_chunks(query_emb, chunk_index, target_sections, top_k=10, fine_o
     ----------
     query_emb : list[float] | np.ndarray
         Embedding vector of the user query.
-    chunk_index : list[dict]
-        Each element is a dictionary like:
+    chunk_index : ChunkIndex | list[dict]
+        A prebuilt :class:`ChunkIndex`, or the legacy list where each element
+        is a dictionary like:
         {
             "embedding": [...],
             "metadata": {"section_title": "...", ...}
@@ -25,35 +39,72 @@ def fine_search_chunks(query_emb, chunk_index, target_sections, top_k=10, fine_o
         ]
     top_k : int, default = 10
         Number of top‑scoring chunks to return.
+    candidate_rows : np.ndarray, optional
+        Pre-filter (e.g. BM25 candidates): only these rows are scored. When
+        none of them lies in *target_sections*, the filter is ignored.
 
     Notes
     -----
-    - Only chunks whose ``section_title`` appears in *target_sections* are considered.
-    - Cosine similarity is computed between the query embedding and each candidate
-      chunk. The chunks are then sorted in descending order of similarity and the
-      top *k* results are returned.
+    - Only chunks of the sections in *target_sections* are considered. Their
+      rows come from the index's precomputed section-to-rows mapping; a section
+      with a ``"file_path"`` key only matches chunks of that document.
+    - Cosine similarity against all candidates is a single matrix-vector product
+      over the index's normalized embedding matrix; the top *k* rows are then
+      selected with ``argpartition``.
+    - A legacy list is converted to a :class:`ChunkIndex` on every call, so
+      callers that search repeatedly should build the index once.
     """
+    if isinstance(chunk_index, list):
+        chunk_index = ChunkIndex.from_records(chunk_index)
 
-    section_titles = [sec["title"] for sec in target_sections]
-    candidates = chunk_index
+    rows = None
     if not fine_only:
-        candidates = [
-            item for item in candidates
-            if item["metadata"]["section_title"] in section_titles
-        ]
-        if len(candidates) == 0:
-            candidates = chunk_index
-    results = []
-    qv = np.array(query_emb)
-    q_norm = np.linalg.norm(qv)
-    for c in candidates:
-        emb = np.array(c["embedding"])
-        dot = np.dot(qv, emb)
-        denom = np.linalg.norm(emb) * q_norm + 1e-8
-        cos_val = dot / denom
-        results.append((cos_val, c))
-
-    results.sort(key=lambda x: x[0], reverse=True)
-
-    top_results = [r[1] for r in results[:top_k]]
-    return top_results
+        rows = chunk_index.rows_for_sections(target_sections)
+        if len(rows) == 0:
+            rows = None
+
+    rows = _apply_candidates(rows, candidate_rows)
+    return chunk_index.search(query_emb, top_k=top_k, rows=rows, **search_params)
+
+
+def fine_search_chunks_batch(query_embs, chunk_index, target_sections_per_query, top_k=10, fine_only=False,
+                             candidate_rows_per_query=None, **search_params):
+    """
+    Batched :func:`fine_search_chunks`.
+
+    Parameters
+    ----------
+    query_embs : np.ndarray
+        ``(num_queries, dim)`` query embeddings.
+    chunk_index : ChunkIndex | list[dict]
+        Same as for :func:`fine_search_chunks`.
+    target_sections_per_query : list[list[dict]]
+        Sections to search within, one list per query (ignored when
+        *fine_only* is set).
+    top_k : int, default = 10
+        Number of top‑scoring chunks to return per query.
+    candidate_rows_per_query : list[np.ndarray | None], optional
+        Per-query pre-filter, as *candidate_rows* of :func:`fine_search_chunks`.
+
+    Returns
+    -------
+    list[list[dict]]
+        Ranked chunks for each query.
+    """
+    if isinstance(chunk_index, list):
+        chunk_index = ChunkIndex.from_records(chunk_index)
+
+    rows_per_query = None
+    if not fine_only:
+        rows_per_query = []
+        for target_sections in target_sections_per_query:
+            rows = chunk_index.rows_for_sections(target_sections)
+            rows_per_query.append(rows if len(rows) else None)
+
+    if candidate_rows_per_query is not None:
+        if rows_per_query is None:
+            rows_per_query = [None] * len(candidate_rows_per_query)
+        rows_per_query = [_apply_candidates(rows, candidates)
+                          for rows, candidates in zip(rows_per_query, candidate_rows_per_query)]
+
+    return chunk_index.search_batch(query_embs, top_k=top_k, rows_per_query=rows_per_query, **search_params)
@@ -0,0 +1,88 @@
+# src/search/hybrid_search.py
+
+from typing import Dict, List
+
+import numpy as np
+
+FUSION_METHODS = ("rrf", "weighted")
+
+
+def _min_max(scores: Dict[int, float]) -> Dict[int, float]:
+    if not scores:
+        return {}
+    lo, hi = min(scores.values()), max(scores.values())
+    span = hi - lo
+    return {row: (s - lo) / span if span > 0 else 1.0 for row, s in scores.items()}
+
+
+def fuse_hits(dense_hits: List[Dict], lexical_hits: List[Dict], top_k: int = 10, method: str = "rrf",
+              rrf_k: int = 60, weight: float = 0.5) -> List[Dict]:
+    """
+    Merge a dense and a lexical (BM25) ranking of the same chunk index.
+
+    Parameters
+    ----------
+    dense_hits, lexical_hits : list[dict]
+        Ranked chunks with ``"row"`` and ``"score"`` keys, as returned by
+        ``ChunkIndex.search`` and ``ChunkIndex.lexical_search``.
+    top_k : int, default = 10
+        Number of chunks to return.
+    method : {"rrf", "weighted"}, default = "rrf"
+        ``"rrf"`` – reciprocal rank fusion, ``sum(1 / (rrf_k + rank))`` over
+        both lists; needs no score calibration.
+        ``"weighted"`` – ``weight * bm25 + (1 - weight) * cosine`` after
+        min-max scaling each list's scores to ``[0, 1]``.
+
+    Returns
+    -------
+    list[dict]
+        Chunks sorted by fused score. ``"score"`` holds the fused score and
+        ``"dense_score"`` / ``"lexical_score"`` the original ones (when the
+        chunk was in that list).
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method {method!r}; expected one of {FUSION_METHODS}")
+
+    items: Dict[int, Dict] = {}
+    for key, hits in (("dense_score", dense_hits), ("lexical_score", lexical_hits)):
+        for hit in hits:
+            item = items.setdefault(hit["row"], {k: v for k, v in hit.items() if k != "score"})
+            item[key] = hit["score"]
+
+    fused: Dict[int, float] = {row: 0.0 for row in items}
+    if method == "rrf":
+        for hits in (dense_hits, lexical_hits):
+            for rank, hit in enumerate(hits):
+                fused[hit["row"]] += 1.0 / (rrf_k + rank + 1)
+    else:
+        dense = _min_max({h["row"]: h["score"] for h in dense_hits})
+        lexical = _min_max({h["row"]: h["score"] for h in lexical_hits})
+        for row in fused:
+            fused[row] = (1 - weight) * dense.get(row, 0.0) + weight * lexical.get(row, 0.0)
+
+    ranked = sorted(fused, key=lambda row: -fused[row])[:top_k]
+    result = []
+    for row in ranked:
+        item = items[row]
+        item["score"] = fused[row]
+        result.append(item)
+    return result
+
+
+def rerank_hits(hits: List[Dict], scores, top_k: int) -> List[Dict]:
+    """
+    Re-order *hits* by a re-ranker's *scores* (one per hit) and keep *top_k*.
+
+    The new score replaces ``"score"``; the previous one is kept as
+    ``"first_stage_score"``.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    result = []
+    for i in order:
+        hit = dict(hits[i])
+        if "score" in hit:
+            hit.setdefault("first_stage_score", hit["score"])
+        hit["score"] = float(scores[i])
+        result.append(hit)
+    return result
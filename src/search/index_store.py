@@ -0,0 +1,443 @@
+# src/search/index_store.py
+
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from .bm25 import BM25Index
+from .chunk_index import ChunkIndex
+from .multi_vector import MultiVectorStore, SparseIndex
+from .vector_index import VECTOR_INDEX_TYPES, build_vector_index, load_vector_index
+
+CHUNK_FORMAT = "querydoc-chunks-v1"
+SECTION_FORMAT = "querydoc-sections-v1"
+
+# Section keys that hold embedding vectors; they are stored as matrices
+SECTION_EMB_KEYS = ("title_emb", "avg_chunk_emb")
+
+
+def _write_matrix(path: str, matrix: np.ndarray):
+    """
+    Write *matrix* as raw C-ordered bytes (no header).
+
+    The file is written next to *path* and renamed over it, so processes that
+    still memory-map the old file keep reading consistent data.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(np.ascontiguousarray(matrix).tobytes())
+    os.replace(tmp_path, path)
+
+
+def _open_matrix(path: str, dtype: str, shape, mmap: bool = True) -> np.ndarray:
+    """Open a raw matrix written by :func:`_write_matrix`."""
+    shape = tuple(shape)
+    if shape[0] == 0:
+        return np.empty(shape, dtype=dtype)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+    return np.fromfile(path, dtype=dtype).reshape(shape)
+
+
+def content_hash(text: str) -> str:
+    """Hex SHA-256 of a chunk's text; equal hashes mean the embedding can be reused."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _to_columns(records: List[Dict]) -> Dict:
+    """
+    Columnar form of a list of flat dicts: ``{"keys": {key: [values]}, "extra": {row: {...}}}``.
+
+    Keys present in every record become columns (names are stored once, not
+    per record); keys missing from some records go to ``extra``.
+    """
+    if not records:
+        return {"n": 0, "keys": {}, "extra": {}}
+    common = [k for k in records[0] if all(k in r for r in records)]
+    common_set = set(common)
+    extra = {}
+    for row, r in enumerate(records):
+        rest = {k: v for k, v in r.items() if k not in common_set}
+        if rest:
+            extra[str(row)] = rest
+    return {"n": len(records), "keys": {k: [r[k] for r in records] for k in common}, "extra": extra}
+
+
+def _from_columns(columns: Dict) -> List[Dict]:
+    """Inverse of :func:`_to_columns`."""
+    keys = list(columns["keys"])
+    values = [columns["keys"][k] for k in keys]
+    records = [dict(zip(keys, row)) for row in zip(*values)] if keys else [{} for _ in range(columns["n"])]
+    for row, rest in columns.get("extra", {}).items():
+        records[int(row)].update(rest)
+    return records
+
+
+def _read_header(meta_path: str, fmt: str) -> Dict:
+    with open(meta_path, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("format") != fmt:
+        raise ValueError(f"{meta_path} is not a {fmt} file")
+    if "columns" in header:
+        header["metadata"] = _from_columns(header.pop("columns"))
+    return header
+
+
+def _write_header(meta_path: str, header: Dict):
+    """
+    Write a metadata header atomically (readers see the old or the new one).
+    A ``"metadata"`` record list is stored in columnar form.
+    """
+    if "metadata" in header:
+        header = dict(header)
+        header["columns"] = _to_columns(header.pop("metadata"))
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, meta_path)
+
+
+def chunk_index_paths(prefix: str):
+    """Return tuple (embedding_path, metadata_path) for an index *prefix*."""
+    return f"{prefix}.emb", f"{prefix}.meta.json"
+
+
+def vector_index_path(prefix: str, kind: str) -> str:
+    """Return the path of the *kind* search backend saved for an index *prefix*."""
+    return f"{prefix}.{kind}.npz"
+
+
+def lexical_index_path(prefix: str) -> str:
+    """Return the path of the BM25 index saved for an index *prefix*."""
+    return f"{prefix}.bm25.npz"
+
+
+def sparse_index_path(prefix: str) -> str:
+    """Return the path of the bge-m3 lexical-weight index saved for an index *prefix*."""
+    return f"{prefix}.sparse.npz"
+
+
+def multi_vector_paths(prefix: str):
+    """Return tuple (vectors_path, offsets_path) of the token vectors saved for an index *prefix*."""
+    return f"{prefix}.colbert.npy", f"{prefix}.colbert.offsets.npy"
+
+
+def section_store_paths(prefix: str):
+    """Return tuple (title_emb_path, avg_chunk_emb_path, metadata_path) for a section *prefix*."""
+    return f"{prefix}.title.emb", f"{prefix}.avg.emb", f"{prefix}.meta.json"
+
+
+def section_sum_path(prefix: str) -> str:
+    """Return the path of the per-section chunk embedding sums for a section *prefix*."""
+    return f"{prefix}.sum.emb"
+
+
+def save_chunk_index(index: ChunkIndex, prefix: str, dtype: str = "float32"):
+    """
+    Persist a :class:`ChunkIndex` in the binary format.
+
+    Two files are written:
+
+    - ``<prefix>.emb`` – the L2-normalized embedding matrix as raw
+      ``float32`` (or ``float16``) rows.
+    - ``<prefix>.meta.json`` – a compact JSON document with the matrix
+      shape/dtype, the per-chunk metadata list, a content hash per chunk
+      and the list of deleted rows (tombstones, see :func:`update_chunk_rows`).
+
+    The BM25 index of *index* is saved as ``<prefix>.bm25.npz`` when it has
+    been built, its bge-m3 sparse index / token vectors (see
+    :func:`save_multi_vector_index`) when set, and its search backend (see
+    :func:`save_vector_index`) unless it is exact; stale files of any of
+    these kinds are removed otherwise.
+
+    Parameters
+    ----------
+    index : ChunkIndex
+        Index to save.
+    prefix : str
+        Path prefix, e.g. ``data/index/sample_chunks_vectors``.
+    dtype : {"float32", "float16"}, default = "float32"
+        Storage precision of the embedding matrix.
+    """
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    emb_path, meta_path = chunk_index_paths(prefix)
+    os.makedirs(os.path.dirname(emb_path) or ".", exist_ok=True)
+
+    _write_matrix(emb_path, index.embeddings.astype(dtype, copy=False))
+    header = {
+        "format": CHUNK_FORMAT,
+        "dtype": dtype,
+        "shape": list(index.embeddings.shape),
+        "metadata": index.metadata,
+        "content_hashes": [content_hash(m.get("content", "")) for m in index.metadata],
+        "tombstones": [],
+    }
+    _write_header(meta_path, header)
+
+    if index.lexical is not None:
+        save_lexical_index(index, prefix)
+    elif os.path.exists(lexical_index_path(prefix)):
+        os.remove(lexical_index_path(prefix))
+    if index.sparse is not None or index.multi_vectors is not None:
+        save_multi_vector_index(index, prefix)
+    else:
+        for path in (sparse_index_path(prefix), *multi_vector_paths(prefix)):
+            if os.path.exists(path):
+                os.remove(path)
+    for kind in VECTOR_INDEX_TYPES:
+        if kind != index.backend.kind and os.path.exists(vector_index_path(prefix, kind)):
+            os.remove(vector_index_path(prefix, kind))
+    if index.backend.kind != "exact":
+        save_vector_index(index, prefix)
+
+
+def load_chunk_index(prefix: str, mmap: bool = True, index_type: str = "exact") -> ChunkIndex:
+    """
+    Open an index written by :func:`save_chunk_index`.
+
+    With ``mmap=True`` the embedding matrix is a read-only ``np.memmap``, so
+    several processes opening the same index share its pages through the OS
+    page cache instead of each holding a private copy.
+
+    *index_type* selects the search backend. A backend saved next to the index
+    (``<prefix>.<index_type>.npz``) is loaded when it covers the same rows;
+    otherwise it is built in memory.
+
+    Rows deleted by :func:`update_chunk_rows` are left out; while an index
+    has tombstones its live rows are copied out of the map, so indexes with
+    many deletions should be compacted (:func:`compact_chunk_index`).
+
+    A BM25 index saved next to it (``<prefix>.bm25.npz``) is attached when
+    its row count matches; otherwise it is built on first lexical search.
+    A bge-m3 sparse index and token vectors written by
+    :func:`save_multi_vector_index` are attached the same way (they are
+    never built on the fly).
+    """
+    emb_path, meta_path = chunk_index_paths(prefix)
+    header = _read_header(meta_path, CHUNK_FORMAT)
+
+    embeddings = _open_matrix(emb_path, header["dtype"], header["shape"], mmap=mmap)
+    metadata = header["metadata"]
+    tombstones = header.get("tombstones", [])
+    if tombstones:
+        live = np.setdiff1d(np.arange(len(metadata)), tombstones)
+        embeddings = embeddings[live]
+        metadata = [metadata[row] for row in live]
+    index = ChunkIndex(embeddings, metadata, normalized=True)
+    if index_type != "exact":
+        backend_path = vector_index_path(prefix, index_type)
+        backend = None
+        if os.path.exists(backend_path):
+            try:
+                backend = load_vector_index(backend_path, index.embeddings)
+            except ValueError:
+                backend = None  # saved for another version of the matrix
+        index.set_backend(backend or build_vector_index(index_type, index.embeddings))
+    lexical_path = lexical_index_path(prefix)
+    if os.path.exists(lexical_path):
+        lexical = BM25Index.load(lexical_path)
+        if len(lexical) == len(index):
+            index.set_lexical(lexical)
+    if os.path.exists(sparse_index_path(prefix)):
+        sparse = SparseIndex.load(sparse_index_path(prefix))
+        if len(sparse) == len(index):
+            index.set_sparse(sparse)
+    if os.path.exists(multi_vector_paths(prefix)[1]):
+        store = MultiVectorStore.load(multi_vector_paths(prefix)[0][:-len(".npy")], mmap=mmap)
+        if len(store) == len(index):
+            index.set_multi_vectors(store)
+    return index
+
+
+def save_multi_vector_index(index: ChunkIndex, prefix: str):
+    """
+    Save the bge-m3 sparse index (``<prefix>.sparse.npz``) and token vectors
+    (``<prefix>.colbert.npy`` + ``.colbert.offsets.npy``, memory-mapped on
+    load) of *index*, whichever are set.
+    """
+    if index.sparse is not None:
+        index.sparse.save(sparse_index_path(prefix))
+    if index.multi_vectors is not None:
+        index.multi_vectors.save(multi_vector_paths(prefix)[0][:-len(".npy")])
+
+
+def save_lexical_index(index: ChunkIndex, prefix: str):
+    """Save the BM25 index of *index* (building it if needed) next to its embedding matrix."""
+    index.lexical_index().save(lexical_index_path(prefix))
+
+
+def save_vector_index(index: ChunkIndex, prefix: str):
+    """Save the search backend of *index* next to its embedding matrix."""
+    index.backend.save(vector_index_path(prefix, index.backend.kind))
+
+
+def load_chunk_header(prefix: str) -> Dict:
+    """Read the metadata header of a chunk index (without opening the matrix)."""
+    return _read_header(chunk_index_paths(prefix)[1], CHUNK_FORMAT)
+
+
+def read_chunk_rows(prefix: str, rows: Sequence[int]) -> np.ndarray:
+    """Return the stored (normalized) embeddings of *rows* as ``float32``."""
+    header = load_chunk_header(prefix)
+    matrix = _open_matrix(chunk_index_paths(prefix)[0], header["dtype"], header["shape"])
+    return np.asarray(matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+
+def update_chunk_rows(prefix: str, metadata: List[Dict], keep_rows: Sequence[int],
+                      new_embeddings: np.ndarray, new_metadata: List[Dict]) -> np.ndarray:
+    """
+    Apply additions and deletions to a saved chunk index in place.
+
+    The embedding file is append-only: *new_embeddings* are normalized and
+    appended to ``<prefix>.emb``, and every live row not listed in
+    *keep_rows* is marked deleted in the header. *metadata* replaces the
+    metadata of the existing rows (same length as the stored list), so
+    unchanged chunks that moved (e.g. to another page) keep their embedding.
+    Saved search backends and row-aligned side indexes (``<prefix>.*.npz`` /
+    ``.npy``) are removed since their row ids no longer match.
+
+    Returns
+    -------
+    np.ndarray
+        Row ids assigned to the appended chunks.
+    """
+    emb_path, meta_path = chunk_index_paths(prefix)
+    header = _read_header(meta_path, CHUNK_FORMAT)
+    n_rows, dim = header["shape"]
+    if len(metadata) != n_rows:
+        raise ValueError(f"metadata has {len(metadata)} entries but the index has {n_rows} rows")
+
+    new_embeddings = np.asarray(new_embeddings, dtype=np.float32).reshape(len(new_metadata), -1)
+    if len(new_metadata):
+        if n_rows and new_embeddings.shape[1] != dim:
+            raise ValueError(f"new embeddings have dim {new_embeddings.shape[1]}, index has {dim}")
+        dim = new_embeddings.shape[1]
+        new_embeddings = new_embeddings / (np.linalg.norm(new_embeddings, axis=1, keepdims=True) + 1e-8)
+        itemsize = np.dtype(header["dtype"]).itemsize
+        with open(emb_path, "ab") as f:
+            # Drop bytes past the recorded shape (left by an interrupted append)
+            f.truncate(n_rows * dim * itemsize)
+            f.write(np.ascontiguousarray(new_embeddings.astype(header["dtype"])).tobytes())
+
+    keep = set(int(r) for r in keep_rows)
+    header["tombstones"] = sorted(set(header.get("tombstones", [])) | (set(range(n_rows)) - keep))
+    hashes = header.get("content_hashes") or [content_hash(m.get("content", "")) for m in header["metadata"]]
+    header["metadata"] = list(metadata) + list(new_metadata)
+    header["content_hashes"] = hashes + [content_hash(m.get("content", "")) for m in new_metadata]
+    header["shape"] = [n_rows + len(new_metadata), dim]
+    _write_header(meta_path, header)
+
+    for path in glob.glob(f"{glob.escape(prefix)}.*.np[yz]"):
+        os.remove(path)
+    return np.arange(n_rows, n_rows + len(new_metadata))
+
+
+def compact_chunk_index(prefix: str):
+    """Rewrite a chunk index without its deleted rows."""
+    header = load_chunk_header(prefix)
+    if not header.get("tombstones"):
+        return
+    index = load_chunk_index(prefix, mmap=False)
+    save_chunk_index(index, prefix, dtype=header["dtype"])
+
+
+def save_sections(sections: List[Dict], prefix: str, dtype: str = "float32"):
+    """
+    Persist sections with their ``title_emb``/``avg_chunk_emb`` vectors split
+    out into raw matrices next to a compact JSON metadata file.
+
+    Sections whose ``avg_chunk_emb`` is ``None`` get a zero row and are flagged
+    in the metadata so they load back as ``None``. When the sections carry
+    running ``chunk_emb_sum`` vectors (see ``build_section_reps``) they are
+    stored in a third matrix, ``<prefix>.sum.emb``.
+    """
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+    title_path, avg_path, meta_path = section_store_paths(prefix)
+    os.makedirs(os.path.dirname(meta_path) or ".", exist_ok=True)
+
+    dim = 0
+    for sec in sections:
+        for key in SECTION_EMB_KEYS:
+            if sec.get(key) is not None:
+                dim = len(sec[key])
+                break
+        if dim:
+            break
+
+    matrices = {key: np.zeros((len(sections), dim), dtype=dtype) for key in SECTION_EMB_KEYS}
+    has_sums = any(sec.get("chunk_emb_sum") is not None for sec in sections)
+    sums = np.zeros((len(sections), dim), dtype=np.float32)
+    records = []
+    for i, sec in enumerate(sections):
+        record = {k: v for k, v in sec.items() if k not in SECTION_EMB_KEYS and k != "chunk_emb_sum"}
+        if sec.get("chunk_emb_sum") is not None:
+            sums[i] = np.asarray(sec["chunk_emb_sum"], dtype=np.float32)
+        missing = []
+        for key in SECTION_EMB_KEYS:
+            if sec.get(key) is None:
+                missing.append(key)
+            else:
+                matrices[key][i] = np.asarray(sec[key], dtype=np.float32)
+        record["_missing"] = missing
+        records.append(record)
+
+    _write_matrix(title_path, matrices["title_emb"])
+    _write_matrix(avg_path, matrices["avg_chunk_emb"])
+    if has_sums:
+        # Sums are kept in float32: they are updated incrementally
+        _write_matrix(section_sum_path(prefix), sums)
+    header = {
+        "format": SECTION_FORMAT,
+        "dtype": dtype,
+        "shape": [len(sections), dim],
+        "has_sums": has_sums,
+        "sections": records,
+    }
+    _write_header(meta_path, header)
+
+
+def load_sections(prefix: str, mmap: bool = True) -> List[Dict]:
+    """
+    Open sections written by :func:`save_sections`.
+
+    ``title_emb`` and ``avg_chunk_emb`` are returned as rows of the shared
+    (memory-mapped) matrices rather than Python float lists.
+    """
+    title_path, avg_path, meta_path = section_store_paths(prefix)
+    header = _read_header(meta_path, SECTION_FORMAT)
+
+    sums = _open_matrix(section_sum_path(prefix), "float32", header["shape"], mmap=mmap) \
+        if header.get("has_sums") else None
+    matrices = {
+        "title_emb": _open_matrix(title_path, header["dtype"], header["shape"], mmap=mmap),
+        "avg_chunk_emb": _open_matrix(avg_path, header["dtype"], header["shape"], mmap=mmap),
+    }
+    sections = []
+    for i, record in enumerate(header["sections"]):
+        sec = {k: v for k, v in record.items() if k != "_missing"}
+        for key in SECTION_EMB_KEYS:
+            sec[key] = None if key in record.get("_missing", []) else matrices[key][i]
+        if sums is not None:
+            sec["chunk_emb_sum"] = sums[i]
+        sections.append(sec)
+    return sections
+
+
+def convert_json_chunk_index(json_path: str, prefix: str, dtype: str = "float32"):
+    """Convert a legacy ``*_chunks_vectors.json`` file to the binary format."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    save_chunk_index(ChunkIndex.from_records(records), prefix, dtype=dtype)
+
+
+def convert_json_sections(json_path: str, prefix: str, dtype: str = "float32"):
+    """Convert a legacy ``*sections_with_emb.json`` file to the binary format."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        sections = json.load(f)
+    save_sections(sections, prefix, dtype=dtype)
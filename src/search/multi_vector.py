@@ -0,0 +1,161 @@
+# src/search/multi_vector.py
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .vector_index import top_k_indices
+
+
+class SparseIndex:
+    def __init__(self, indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray, n_docs: int):
+        """
+        Inverted index over bge-m3 lexical weights (``{token_id: weight}`` per row).
+
+        Posting lists are indexed directly by tokenizer id and stored CSR-style:
+        the rows containing token ``t`` are ``doc_ids[indptr[t]:indptr[t + 1]]``
+        with their weights in ``weights``. A query scores
+        ``sum(q_w[t] * d_w[t])`` over its tokens, as bge-m3's own
+        ``compute_lexical_matching_score``.
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def build(cls, lexical_weights: Sequence[Dict]) -> "SparseIndex":
+        """Build the index from one ``{token_id: weight}`` mapping per row."""
+        counts = [len(w) for w in lexical_weights]
+        tokens = np.fromiter((int(t) for w in lexical_weights for t in w), dtype=np.int64, count=sum(counts))
+        weights = np.fromiter((float(v) for w in lexical_weights for v in w.values()), dtype=np.float32,
+                              count=sum(counts))
+        docs = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        order = np.argsort(tokens, kind="stable")
+        n_tokens = int(tokens.max()) + 1 if len(tokens) else 0
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(tokens, minlength=n_tokens))))
+        return cls(indptr, docs[order], weights[order], len(counts))
+
+    def __len__(self):
+        return self.n_docs
+
+    def score(self, query_weights: Dict) -> np.ndarray:
+        """Lexical matching score of every row for a query's ``{token_id: weight}``."""
+        docs, weights = [], []
+        for token, q_w in query_weights.items():
+            t = int(token)
+            if t + 1 >= len(self.indptr):
+                continue
+            span = slice(self.indptr[t], self.indptr[t + 1])
+            docs.append(self.doc_ids[span])
+            weights.append(self.weights[span] * float(q_w))
+        if not docs:
+            return np.zeros(self.n_docs, dtype=np.float32)
+        return np.bincount(np.concatenate(docs), weights=np.concatenate(weights),
+                           minlength=self.n_docs).astype(np.float32)
+
+    def search(self, query_weights: Dict, top_k: int = 10,
+               rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top *top_k* ``(rows, scores)`` with a positive score, optionally restricted to *rows*."""
+        scores = self.score(query_weights)
+        if rows is not None:
+            rows = np.asarray(rows)
+            scores = scores[rows]
+        top = top_k_indices(scores, top_k)
+        top = top[scores[top] > 0]
+        ids = top if rows is None else rows[top]
+        return ids.astype(np.int64), scores[top]
+
+    def save(self, path: str):
+        np.savez(path, indptr=self.indptr, doc_ids=self.doc_ids, weights=self.weights,
+                 n_docs=np.asarray(self.n_docs))
+
+    @classmethod
+    def load(cls, path: str) -> "SparseIndex":
+        data = np.load(path, allow_pickle=False)
+        return cls(data["indptr"], data["doc_ids"], data["weights"], int(data["n_docs"]))
+
+
+def prune_token_vectors(vectors: np.ndarray, max_tokens: Optional[int] = None,
+                        dedup_threshold: Optional[float] = 0.95) -> np.ndarray:
+    """
+    Shrink one chunk's token vectors before storing them.
+
+    A token whose vector has cosine above *dedup_threshold* with an earlier
+    token of the chunk adds (almost) nothing to MaxSim and is dropped. If
+    more than *max_tokens* remain, that many are kept evenly spaced over the
+    chunk so every part of the text stays represented.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dedup_threshold is not None and len(vectors) > 1:
+        unit = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
+        duplicate = np.triu(unit @ unit.T > dedup_threshold, k=1).any(axis=0)
+        vectors = vectors[~duplicate]
+    if max_tokens is not None and len(vectors) > max_tokens:
+        keep = np.linspace(0, len(vectors) - 1, max_tokens).round().astype(np.int64)
+        vectors = vectors[np.unique(keep)]
+    return vectors
+
+
+class MultiVectorStore:
+    def __init__(self, vectors: np.ndarray, offsets: np.ndarray):
+        """
+        ColBERT-style token vectors of every row, concatenated.
+
+        The token vectors of row ``i`` are ``vectors[offsets[i]:offsets[i + 1]]``.
+        *vectors* is normally a read-only ``float16`` memmap; only the tokens
+        of the rows being re-scored are read and upcast.
+        """
+        self.vectors = vectors
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def build(cls, token_vectors: Sequence[np.ndarray], dtype: str = "float16", max_tokens: Optional[int] = None,
+              dedup_threshold: Optional[float] = 0.95) -> "MultiVectorStore":
+        """Build a store from one ``(num_tokens, dim)`` array per row (see :func:`prune_token_vectors`)."""
+        pruned = [prune_token_vectors(v, max_tokens, dedup_threshold) for v in token_vectors]
+        lengths = [len(v) for v in pruned]
+        dim = next((v.shape[1] for v in pruned if v.ndim == 2 and len(v)), 0)
+        vectors = np.concatenate(pruned).astype(dtype) if sum(lengths) else np.empty((0, dim), dtype=dtype)
+        return cls(vectors, np.concatenate(([0], np.cumsum(lengths))))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def maxsim(self, query_vectors: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Late-interaction (MaxSim) scores of *rows* for one query.
+
+        For each row: the mean over query tokens of the best dot product with
+        any of the row's tokens. The token vectors of all *rows* are gathered
+        into one matrix, scored against every query token with a single
+        matrix product, and reduced per row with ``np.maximum.reduceat``.
+        Rows without stored tokens score 0.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        q = np.asarray(query_vectors, dtype=np.float32)
+        starts, stops = self.offsets[rows], self.offsets[rows + 1]
+        lengths = stops - starts
+        scores = np.zeros(len(rows), dtype=np.float32)
+        present = np.flatnonzero(lengths > 0)
+        if len(present) == 0 or len(q) == 0:
+            return scores
+
+        # Token ids of every present row, back to back
+        lens = lengths[present]
+        seg = np.concatenate(([0], np.cumsum(lens)[:-1]))
+        tokens = np.repeat(starts[present] - seg, lens) + np.arange(lens.sum())
+        sims = np.asarray(self.vectors[tokens], dtype=np.float32) @ q.T  # (tokens, query tokens)
+        best = np.maximum.reduceat(sims, seg, axis=0)  # (rows, query tokens)
+        scores[present] = best.mean(axis=1)
+        return scores
+
+    def save(self, prefix_path: str):
+        """Write ``<prefix_path>.npy`` (vectors) and ``<prefix_path>.offsets.npy``."""
+        np.save(f"{prefix_path}.npy", np.ascontiguousarray(self.vectors))
+        np.save(f"{prefix_path}.offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, prefix_path: str, mmap: bool = True) -> "MultiVectorStore":
+        vectors = np.load(f"{prefix_path}.npy", mmap_mode="r" if mmap else None)
+        return cls(vectors, np.load(f"{prefix_path}.offsets.npy"))
@@ -0,0 +1,162 @@
+# src/search/quantization.py
+
+import numpy as np
+
+# Rows decoded at a time while scoring compressed codes
+CODE_BLOCK = 16384
+
+
+def cluster_sums(x: np.ndarray, assign: np.ndarray, n_clusters: int):
+    """
+    Per-cluster sums and counts of the rows of *x*.
+
+    Rows are sorted by cluster once and summed with ``np.add.reduceat``, which
+    is much faster than scattering with ``np.add.at``.
+    """
+    counts = np.bincount(assign, minlength=n_clusters)
+    sums = np.zeros((n_clusters, x.shape[1]), dtype=np.float32)
+    nonempty = np.flatnonzero(counts)
+    if nonempty.size:
+        order = np.argsort(assign, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)))[nonempty]
+        sums[nonempty] = np.add.reduceat(x[order], starts, axis=0)
+    return sums, counts
+
+
+def kmeans_l2(x: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0) -> np.ndarray:
+    """
+    Plain (Euclidean) k-means in NumPy. Returns ``(n_clusters, dim)`` centroids.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    n_clusters = min(n_clusters, x.shape[0])
+    centroids = x[rng.choice(x.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        # argmin ||x - c||^2 == argmax (x·c - ||c||^2 / 2)
+        assign = np.argmax(x @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        sums, counts = cluster_sums(x, assign, n_clusters)
+        empty = counts == 0
+        centroids = sums / np.maximum(counts, 1)[:, None]
+        if empty.any():
+            centroids[empty] = x[rng.choice(x.shape[0], int(empty.sum()), replace=False)]
+    return centroids
+
+
+class ScalarQuantizer:
+    def __init__(self, vmin: np.ndarray, scale: np.ndarray):
+        """
+        Per-dimension 8-bit scalar quantizer.
+
+        A value is stored as ``round((x - vmin) / scale)`` in ``uint8``, so each
+        dimension takes one byte instead of four.
+        """
+        self.vmin = vmin.astype(np.float32, copy=False)
+        self.scale = scale.astype(np.float32, copy=False)
+
+    @classmethod
+    def train(cls, x: np.ndarray) -> "ScalarQuantizer":
+        vmin = x.min(axis=0).astype(np.float32)
+        vmax = x.max(axis=0).astype(np.float32)
+        scale = np.maximum(vmax - vmin, 1e-8) / 255.0
+        return cls(vmin, scale)
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        codes = np.empty(x.shape, dtype=np.uint8)
+        for start in range(0, x.shape[0], CODE_BLOCK):
+            block = np.asarray(x[start:start + CODE_BLOCK], dtype=np.float32)
+            codes[start:start + CODE_BLOCK] = np.clip(np.rint((block - self.vmin) / self.scale), 0, 255)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.vmin + codes.astype(np.float32) * self.scale
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """
+        Asymmetric dot products between float queries and every code row.
+
+        ``q·x ≈ q·vmin + (q * scale)·code``, so the codes never need decoding.
+        *q* is a single query ``(dim,)`` or a batch ``(num_queries, dim)``;
+        the result is ``(N,)`` or ``(N, num_queries)``.
+        """
+        q2 = np.atleast_2d(q)
+        weights = (q2 * self.scale).T  # (dim, B)
+        offset = q2 @ self.vmin  # (B,)
+        out = np.empty((codes.shape[0], q2.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], CODE_BLOCK):
+            stop = start + CODE_BLOCK
+            out[start:stop] = codes[start:stop].astype(np.float32) @ weights
+        out += offset
+        return out[:, 0] if q.ndim == 1 else out
+
+
+class ProductQuantizer:
+    def __init__(self, codebooks: np.ndarray):
+        """
+        Product quantizer.
+
+        The vector is split into ``m`` sub-vectors, each replaced by the id of
+        its nearest centroid in a 256-entry codebook, so a vector takes ``m``
+        bytes.
+
+        Parameters
+        ----------
+        codebooks : np.ndarray
+            ``(m, 256, dim // m)`` centroids.
+        """
+        self.codebooks = codebooks.astype(np.float32, copy=False)
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    @property
+    def sub_dim(self) -> int:
+        return self.codebooks.shape[2]
+
+    @classmethod
+    def train(cls, x: np.ndarray, m: int, n_iter: int = 20, seed: int = 0) -> "ProductQuantizer":
+        dim = x.shape[1]
+        if dim % m != 0:
+            raise ValueError(f"dim={dim} is not divisible by m={m}")
+        sub_dim = dim // m
+        x = np.asarray(x, dtype=np.float32)
+        codebooks = np.zeros((m, 256, sub_dim), dtype=np.float32)
+        for j in range(m):
+            centroids = kmeans_l2(x[:, j * sub_dim:(j + 1) * sub_dim], 256, n_iter=n_iter, seed=seed + j)
+            # Fewer training rows than codebook entries: repeat centroids
+            codebooks[j] = centroids[np.arange(256) % len(centroids)]
+        return cls(codebooks)
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        codes = np.empty((x.shape[0], self.m), dtype=np.uint8)
+        half_norms = 0.5 * (self.codebooks ** 2).sum(axis=2)  # (m, 256)
+        for start in range(0, x.shape[0], CODE_BLOCK):
+            block = np.asarray(x[start:start + CODE_BLOCK], dtype=np.float32)
+            for j in range(self.m):
+                sub = block[:, j * self.sub_dim:(j + 1) * self.sub_dim]
+                # Nearest sub-centroid: argmax (x·c - ||c||^2 / 2)
+                codes[start:start + CODE_BLOCK, j] = np.argmax(sub @ self.codebooks[j].T - half_norms[j], axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.m), codes]  # (n, m, sub_dim)
+        return parts.reshape(codes.shape[0], -1)
+
+    def lookup_table(self, q: np.ndarray) -> np.ndarray:
+        """``(m, 256)`` table of dot products between each query sub-vector and each centroid."""
+        return np.einsum("ms,mks->mk", q.reshape(self.m, self.sub_dim), self.codebooks)
+
+    def scores(self, codes: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """
+        Asymmetric distance computation: each float query is compared with the
+        codes through its lookup table, one gather per sub-space. *q* may be a
+        single query or a batch, as for :meth:`ScalarQuantizer.scores`.
+        """
+        q2 = np.atleast_2d(q)
+        out = np.zeros((q2.shape[0], codes.shape[0]), dtype=np.float32)
+        code_columns = [np.ascontiguousarray(codes[:, j]) for j in range(self.m)]
+        for b, query in enumerate(q2):
+            table = self.lookup_table(query)
+            for j, column in enumerate(code_columns):
+                out[b] += table[j, column]
+        return out[0] if q.ndim == 1 else out.T
@@ -2,7 +2,8 @@
 
 import numpy as np
 
-from ..inference.embedding_model import embedding_model
+from ..inference.embedding_model import get_embedding_model
+from .vector_index import normalize_queries, top_k_indices
 
 
 def cosine_similarity(v1, v2):
@@ -14,7 +15,7 @@ def cosine_similarity(v1, v2):
     return dot / denom
 
 
-def coarse_search_sections(query: str, sections: list, beta=0.3, top_k=5):
+def coarse_search_sections(query: str, sections: list, beta=0.3, top_k=5, query_emb=None):
     """
     Select the most relevant document sections for the given query using a
     two‑stage cosine‑similarity score.
@@ -35,6 +36,9 @@ def coarse_search_sections(query: str, sections: list, beta=0.3, top_k=5):
         Interpolation weight between title similarity and average‑chunk similarity.
     top_k : int, default = 5
         Number of top‑scoring sections to return.
+    query_emb : list[float] | np.ndarray, optional
+        Precomputed embedding of *query*. When given, the query is not
+        encoded again.
 
     Notes
     -----
@@ -46,7 +50,8 @@ def coarse_search_sections(query: str, sections: list, beta=0.3, top_k=5):
 
         final_score = beta * sim_title + (1 - beta) * sim_chunk
     """
-    query_emb = embedding_model.get_embedding(query)
+    if query_emb is None:
+        query_emb = get_embedding_model().get_embedding(query)
 
     scored = []
 
@@ -68,3 +73,67 @@ def coarse_search_sections(query: str, sections: list, beta=0.3, top_k=5):
     top_sections = [x[1] for x in scored[:top_k]]
 
     return top_sections
+
+
+def build_section_matrices(sections: list):
+    """
+    Stack the section embeddings into normalized matrices for batched scoring.
+
+    Returns
+    -------
+    tuple(np.ndarray, np.ndarray, np.ndarray)
+        ``(positions, title_mat, chunk_mat)`` where *positions* are the indices
+        (into *sections*) of the sections that have both embeddings, and the
+        matrices hold their L2-normalized ``title_emb``/``avg_chunk_emb`` rows.
+    """
+    positions = [i for i, sec in enumerate(sections)
+                 if sec.get("title_emb") is not None and sec.get("avg_chunk_emb") is not None]
+    if not positions:
+        empty = np.empty((0, 0), dtype=np.float32)
+        return np.empty(0, dtype=np.int64), empty, empty
+    title_mat = normalize_queries([sections[i]["title_emb"] for i in positions])
+    chunk_mat = normalize_queries([sections[i]["avg_chunk_emb"] for i in positions])
+    return np.asarray(positions, dtype=np.int64), title_mat, chunk_mat
+
+
+def coarse_search_sections_batch(query_embs, sections: list, beta=0.3, top_k=5, section_matrices=None):
+    """
+    Batched :func:`coarse_search_sections`: score many queries at once.
+
+    Both similarity terms are computed for every (query, section) pair with
+    one matrix-matrix product each, then the top *top_k* sections are
+    selected per query.
+
+    Parameters
+    ----------
+    query_embs : np.ndarray
+        ``(num_queries, dim)`` query embeddings.
+    sections : list[dict]
+        Same format as for :func:`coarse_search_sections`.
+    beta : float, default = 0.3
+        Interpolation weight between title similarity and average‑chunk similarity.
+    top_k : int, default = 5
+        Number of top‑scoring sections to return per query.
+    section_matrices : tuple, optional
+        Output of :func:`build_section_matrices` for *sections*, so callers
+        that search repeatedly can build it once.
+
+    Returns
+    -------
+    list[list[dict]]
+        Ranked sections for each query.
+    """
+    if section_matrices is None:
+        section_matrices = build_section_matrices(sections)
+    positions, title_mat, chunk_mat = section_matrices
+
+    q = normalize_queries(query_embs)
+    if len(positions) == 0:
+        return [[] for _ in range(q.shape[0])]
+
+    scores = beta * (q @ title_mat.T) + (1 - beta) * (q @ chunk_mat.T)  # (num_queries, num_sections)
+    results = []
+    for row in scores:
+        top = top_k_indices(row, top_k)
+        results.append([sections[positions[i]] for i in top])
+    return results
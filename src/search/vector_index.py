@@ -0,0 +1,401 @@
+# src/search/vector_index.py
+
+from typing import Dict, Optional, Protocol, Tuple, Type
+
+import numpy as np
+
+from .quantization import ProductQuantizer, ScalarQuantizer, cluster_sums
+
+# Rows upcast at a time when scoring a float16 matrix
+SCORE_BLOCK = 16384
+
+# Queries scored together by the exact backend (bounds the score matrix size)
+QUERY_BLOCK = 256
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Return the indices of the *top_k* largest scores in descending order.
+
+    ``argpartition`` selects the candidates in linear time, so only the
+    *top_k* survivors are fully sorted.
+    """
+    n = scores.shape[0]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(n)
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def dot_scores(mat: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """
+    ``mat @ q`` (``q`` 1-D) or ``mat @ q.T`` (``q`` 2-D) in ``float32``.
+
+    ``float16`` matrices are upcast block by block instead of materializing a
+    ``float32`` copy of the whole matrix.
+    """
+    rhs = q if q.ndim == 1 else q.T
+    if mat.dtype == np.float32:
+        return mat @ rhs
+    out = np.empty((mat.shape[0],) + rhs.shape[1:], dtype=np.float32)
+    for start in range(0, mat.shape[0], SCORE_BLOCK):
+        stop = start + SCORE_BLOCK
+        out[start:stop] = mat[start:stop].astype(np.float32) @ rhs
+    return out
+
+
+def normalize_queries(queries) -> np.ndarray:
+    """Return *queries* as a 2-D ``float32`` matrix with unit-length rows."""
+    q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    return q / (np.linalg.norm(q, axis=1, keepdims=True) + 1e-8)
+
+
+class VectorIndex(Protocol):
+    """
+    Search backend over the rows of a normalized embedding matrix.
+
+    ``search`` takes a ``(num_queries, dim)`` matrix of normalized queries and
+    returns ``(scores, ids)``, both of shape ``(num_queries, top_k)`` and sorted
+    by descending score. Slots without a result hold id ``-1``. Backend-specific
+    keyword arguments (e.g. ``nprobe``) tune each call.
+    """
+
+    kind: str
+
+    def search(self, queries: np.ndarray, top_k: int, **params) -> Tuple[np.ndarray, np.ndarray]:
+        ...
+
+    def save(self, path: str) -> None:
+        ...
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray) -> "VectorIndex":
+        ...
+
+
+def _empty_result(num_queries: int, top_k: int):
+    return (np.full((num_queries, top_k), -np.inf, dtype=np.float32),
+            np.full((num_queries, top_k), -1, dtype=np.int64))
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, vectors: np.ndarray):
+        """Brute-force search: every query is scored against every row."""
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, vectors: np.ndarray) -> "ExactIndex":
+        return cls(vectors)
+
+    def search(self, queries: np.ndarray, top_k: int, **params) -> Tuple[np.ndarray, np.ndarray]:
+        out_scores, out_ids = _empty_result(queries.shape[0], top_k)
+        if self.vectors.shape[0] == 0:
+            return out_scores, out_ids
+        for start in range(0, queries.shape[0], QUERY_BLOCK):
+            block = dot_scores(self.vectors, queries[start:start + QUERY_BLOCK])  # (N, b)
+            for j in range(block.shape[1]):
+                col = block[:, j]
+                top = top_k_indices(col, top_k)
+                out_scores[start + j, :len(top)] = col[top]
+                out_ids[start + j, :len(top)] = top
+        return out_scores, out_ids
+
+    def save(self, path: str) -> None:
+        # Nothing beyond the embedding matrix itself
+        np.savez(path, kind=self.kind)
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray) -> "ExactIndex":
+        return cls(vectors)
+
+
+def nearest_centroids(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every row of *x*, computed in blocks."""
+    assign = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], SCORE_BLOCK):
+        stop = start + SCORE_BLOCK
+        assign[start:stop] = np.argmax(dot_scores(x[start:stop], centroids), axis=1)
+    return assign
+
+
+def spherical_kmeans(x: np.ndarray, n_clusters: int, n_iter: int = 20,
+                     seed: int = 0) -> np.ndarray:
+    """
+    K-means on the unit sphere (cosine similarity) in pure NumPy.
+
+    Returns the ``(n_clusters, dim)`` matrix of normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    x = x.astype(np.float32, copy=False)
+    centroids = x[rng.choice(x.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = nearest_centroids(x, centroids)
+        sums, counts = cluster_sums(x, assign, n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters with random points
+            sums[empty] = x[rng.choice(x.shape[0], int(empty.sum()), replace=False)]
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-8)
+    return centroids
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray,
+                 list_offsets: np.ndarray, list_ids: np.ndarray, nprobe: int = 8):
+        """
+        Inverted-file index with a k-means coarse quantizer.
+
+        Rows are bucketed by their nearest centroid. A query only scores the
+        rows of its *nprobe* closest buckets, trading recall for latency.
+
+        Parameters
+        ----------
+        vectors : np.ndarray
+            Normalized ``(N, dim)`` matrix the ids refer to.
+        centroids : np.ndarray
+            ``(n_lists, dim)`` normalized centroids.
+        list_offsets, list_ids : np.ndarray
+            CSR inverted lists: the rows of list ``list_id`` are
+            ``list_ids[list_offsets[list_id]:list_offsets[list_id + 1]]``.
+        nprobe : int, default = 8
+            Default number of lists probed per query.
+        """
+        self.vectors = vectors
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, n_lists: Optional[int] = None, nprobe: int = 8,
+              n_iter: int = 20, train_size: int = 100_000, seed: int = 0) -> "IVFIndex":
+        """
+        Train the coarse quantizer on a sample of *vectors* and bucket every row.
+
+        *n_lists* defaults to ``4 * sqrt(N)``, a common IVF starting point.
+        """
+        n = vectors.shape[0]
+        if n == 0:
+            return cls(vectors, np.empty((0, vectors.shape[1]), dtype=np.float32),
+                       np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64), nprobe=nprobe)
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= train_size else vectors[np.sort(rng.choice(n, train_size, replace=False))]
+        centroids = spherical_kmeans(np.asarray(sample, dtype=np.float32), n_lists, n_iter=n_iter, seed=seed)
+
+        assign = nearest_centroids(vectors, centroids)
+        list_ids = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        return cls(vectors, centroids, list_offsets, list_ids, nprobe=nprobe)
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None,
+               **params) -> Tuple[np.ndarray, np.ndarray]:
+        out_scores, out_ids = _empty_result(queries.shape[0], top_k)
+        if self.vectors.shape[0] == 0:
+            return out_scores, out_ids
+        nprobe = max(1, min(nprobe or self.nprobe, self.n_lists))
+
+        centroid_scores = queries @ self.centroids.T  # (B, n_lists)
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), centroid_scores.shape)
+
+        for b, q in enumerate(queries):
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[list_id]:self.list_offsets[list_id + 1]] for list_id in probes[b]
+            ])
+            if candidates.size == 0:
+                continue
+            candidates.sort()
+            scores = dot_scores(self.vectors[candidates], q)
+            top = top_k_indices(scores, top_k)
+            out_scores[b, :len(top)] = scores[top]
+            out_ids[b, :len(top)] = candidates[top]
+        return out_scores, out_ids
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=self.kind, centroids=self.centroids,
+                 list_offsets=self.list_offsets, list_ids=self.list_ids,
+                 nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray) -> "IVFIndex":
+        data = np.load(path)
+        return cls(vectors, data["centroids"], data["list_offsets"], data["list_ids"],
+                   nprobe=int(data["nprobe"]))
+
+
+class _CompressedIndex:
+    """
+    Shared search logic for backends that keep only compressed codes resident.
+
+    Scores are computed asymmetrically (float query vs. codes). With
+    ``rerank > 0`` the best ``rerank`` candidates are re-scored against the
+    float32 vectors, which can stay memory-mapped on disk.
+    """
+
+    kind = ""
+
+    def __init__(self, vectors: Optional[np.ndarray], quantizer, codes: np.ndarray, rerank: int = 0):
+        self.vectors = vectors
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rerank = rerank
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the compressed codes."""
+        return self.codes.nbytes
+
+    def search(self, queries: np.ndarray, top_k: int, rerank: Optional[int] = None,
+               **params) -> Tuple[np.ndarray, np.ndarray]:
+        out_scores, out_ids = _empty_result(queries.shape[0], top_k)
+        if self.codes.shape[0] == 0:
+            return out_scores, out_ids
+        rerank = self.rerank if rerank is None else rerank
+        use_rerank = rerank > 0 and self.vectors is not None
+
+        for start in range(0, queries.shape[0], QUERY_BLOCK):
+            block = self.quantizer.scores(self.codes, queries[start:start + QUERY_BLOCK])  # (N, b)
+            for j in range(block.shape[1]):
+                b, q, approx = start + j, queries[start + j], block[:, j]
+                top = top_k_indices(approx, max(top_k, rerank) if use_rerank else top_k)
+                scores = approx[top]
+                if use_rerank:
+                    candidates = np.sort(top)
+                    exact = dot_scores(self.vectors[candidates], q)
+                    best = top_k_indices(exact, top_k)
+                    top, scores = candidates[best], exact[best]
+                out_scores[b, :len(top)] = scores
+                out_ids[b, :len(top)] = top
+        return out_scores, out_ids
+
+
+class SQ8Index(_CompressedIndex):
+    kind = "sq8"
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, rerank: int = 0, train_size: int = 100_000,
+              seed: int = 0) -> "SQ8Index":
+        """8-bit scalar quantization: 4x smaller than float32."""
+        n = vectors.shape[0]
+        if n == 0:
+            dim = vectors.shape[1]
+            return cls(vectors, ScalarQuantizer(np.zeros(dim), np.ones(dim)), np.empty((0, dim), dtype=np.uint8),
+                       rerank=rerank)
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= train_size else vectors[np.sort(rng.choice(n, train_size, replace=False))]
+        quantizer = ScalarQuantizer.train(np.asarray(sample, dtype=np.float32))
+        return cls(vectors, quantizer, quantizer.encode(vectors), rerank=rerank)
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=self.kind, vmin=self.quantizer.vmin, scale=self.quantizer.scale,
+                 codes=self.codes, rerank=self.rerank)
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray) -> "SQ8Index":
+        data = np.load(path)
+        return cls(vectors, ScalarQuantizer(data["vmin"], data["scale"]), data["codes"],
+                   rerank=int(data["rerank"]))
+
+
+class PQIndex(_CompressedIndex):
+    kind = "pq"
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, m: Optional[int] = None, rerank: int = 0, n_iter: int = 20,
+              train_size: int = 50_000, seed: int = 0) -> "PQIndex":
+        """
+        Product quantization with *m* one-byte sub-codes per vector.
+
+        *m* defaults to ``dim // 8``, i.e. 32x smaller than float32.
+        """
+        dim = vectors.shape[1]
+        m = m or max(1, dim // 8)
+        n = vectors.shape[0]
+        if n == 0:
+            if dim % m != 0:
+                raise ValueError(f"dim={dim} is not divisible by m={m}")
+            return cls(vectors, ProductQuantizer(np.zeros((m, 256, dim // m))), np.empty((0, m), dtype=np.uint8),
+                       rerank=rerank)
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= train_size else vectors[np.sort(rng.choice(n, train_size, replace=False))]
+        quantizer = ProductQuantizer.train(np.asarray(sample, dtype=np.float32), m, n_iter=n_iter, seed=seed)
+        return cls(vectors, quantizer, quantizer.encode(vectors), rerank=rerank)
+
+    def save(self, path: str) -> None:
+        np.savez(path, kind=self.kind, codebooks=self.quantizer.codebooks,
+                 codes=self.codes, rerank=self.rerank)
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray) -> "PQIndex":
+        data = np.load(path)
+        return cls(vectors, ProductQuantizer(data["codebooks"]), data["codes"],
+                   rerank=int(data["rerank"]))
+
+
+VECTOR_INDEX_TYPES: Dict[str, Type] = {
+    ExactIndex.kind: ExactIndex,
+    IVFIndex.kind: IVFIndex,
+    SQ8Index.kind: SQ8Index,
+    PQIndex.kind: PQIndex,
+}
+
+
+def build_vector_index(kind: str, vectors: np.ndarray, **params) -> VectorIndex:
+    """Build a backend of type *kind* (``"exact"``, ``"ivf"``, ``"sq8"``, ``"pq"``) over *vectors*."""
+    if kind not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type: {kind}")
+    return VECTOR_INDEX_TYPES[kind].build(vectors, **params)
+
+
+def load_vector_index(path: str, vectors: np.ndarray) -> VectorIndex:
+    """
+    Load a backend saved with ``save`` and attach it to *vectors*.
+
+    Raises :class:`ValueError` when the backend was built over a different
+    number of rows than *vectors* has.
+    """
+    data = np.load(path)
+    kind = str(data["kind"])
+    if kind not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type in {path}: {kind}")
+    rows = next((len(data[key]) for key in ("list_ids", "codes") if key in data.files), None)
+    if rows is not None and rows != vectors.shape[0]:
+        raise ValueError(f"{path} covers {rows} rows but the matrix has {vectors.shape[0]}")
+    return VECTOR_INDEX_TYPES[kind].load(path, vectors)
+
+
+def recall_at_k(index: VectorIndex, reference: VectorIndex, queries, k: int = 10, **params) -> float:
+    """
+    Fraction of *reference*'s top-*k* ids that *index* also returns, averaged
+    over *queries*. Use an :class:`ExactIndex` as reference to measure the
+    recall of an approximate backend at given search *params*.
+    """
+    q = normalize_queries(queries)
+    _, ids = index.search(q, k, **params)
+    _, ref_ids = reference.search(q, k)
+    hits = 0
+    total = 0
+    for got, want in zip(ids, ref_ids):
+        want = want[want >= 0]
+        hits += len(np.intersect1d(got[got >= 0], want))
+        total += len(want)
+    return hits / total if total else 1.0
@@ -1,9 +1,11 @@
 # src/search/vector_search.py
 
-from typing import List, Dict
+from typing import List, Dict, Union
 
 import numpy as np
 
+from .chunk_index import ChunkIndex
+
 
 def cosine_similarity(v1, v2):
     v1 = np.array(v1)
@@ -13,22 +15,12 @@ def cosine_similarity(v1, v2):
     return dot / denom
 
 
-def simple_vector_search(query_emb, index_data: List[Dict], top_k=8):
+def simple_vector_search(query_emb, index_data: Union[ChunkIndex, List[Dict]], top_k=8, **search_params):
     """
     query_emb: numpy array or list[float]
-    index_data: [{"embedding": [...], "metadata": {...}}, ...]
+    index_data: ChunkIndex, or [{"embedding": [...], "metadata": {...}}, ...]
+    search_params: per-query backend options, e.g. nprobe=16 for an IVF backend
     """
-    results = []
-    query_vec = np.array(query_emb)
-    q_norm = np.linalg.norm(query_vec)
-
-    for item in index_data:
-        emb = np.array(item["embedding"])
-        dot = np.dot(query_vec, emb)
-        denom = np.linalg.norm(emb) * q_norm + 1e-8
-        score = dot / denom
-        results.append((score, item))
-
-    results.sort(key=lambda x: x[0], reverse=True)
-    top_results = [r[1] for r in results[:top_k]]
-    return top_results
+    if isinstance(index_data, list):
+        index_data = ChunkIndex.from_records(index_data)
+    return index_data.search(query_emb, top_k=top_k, **search_params)
@@ -0,0 +1,63 @@
+# src/utils/admission.py
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class Overloaded(Exception):
+    """Raised when a request is rejected by :class:`AdmissionController`."""
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 64):
+        """
+        Bound the number of requests processed and waiting at the same time.
+
+        At most *max_in_flight* requests hold a slot; up to *max_queue* more
+        wait for one. A request arriving when the queue is full is rejected
+        with :class:`Overloaded` instead of piling up behind the others; one
+        whose deadline passes while waiting gets :class:`TimeoutError`.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.expired = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def slot(self, deadline: float = None):
+        """
+        Hold one processing slot for the duration of the ``async with`` block.
+
+        *deadline* is a ``time.monotonic()`` timestamp after which waiting
+        for a slot is abandoned with :class:`TimeoutError`.
+        """
+        # Counted synchronously, so requests arriving in the same loop tick
+        # see each other before any of them acquires the semaphore.
+        if self.in_flight + self.waiting >= self.max_in_flight + self.max_queue:
+            self.rejected += 1
+            raise Overloaded(f"{self.waiting} requests already waiting")
+
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.expired += 1
+            raise TimeoutError("deadline passed while waiting for a slot") from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "rejected": self.rejected,
+                "expired": self.expired, "max_in_flight": self.max_in_flight, "max_queue": self.max_queue}
@@ -0,0 +1,134 @@
+# src/utils/content_cache.py
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+# Marker written last into a complete entry; its mtime is the entry's last use
+_COMPLETE = ".complete"
+
+
+class DiscardEntry(Exception):
+    """Raise inside :meth:`ContentCache.store` to drop the entry being written without publishing it."""
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class ContentCache:
+    def __init__(self, root: str = "data/cache", max_bytes: int = 10 * 1024 ** 3):
+        """
+        Content-addressed on-disk cache shared by every user.
+
+        An entry is a directory ``<root>/<namespace>/<key>`` whose files are
+        written by the caller. Keys come from :meth:`key` (e.g. the SHA-256
+        of a PDF plus the pipeline and model versions), so identical inputs
+        map to the same entry regardless of file name or uploader. Entries are
+        written to a temporary directory and renamed into place, so readers
+        never see partial entries. When the cache grows past *max_bytes* the
+        least recently used entries are removed.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        """Hex SHA-256 of the ``str()`` of *parts*."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.root, namespace, key)
+
+    def lookup(self, namespace: str, key: str) -> Optional[str]:
+        """Return the entry directory if it is complete (marking it as used), else ``None``."""
+        path = self.path(namespace, key)
+        marker = os.path.join(path, _COMPLETE)
+        if not os.path.exists(marker):
+            return None
+        try:
+            os.utime(marker)
+        except OSError:  # evicted concurrently
+            return None
+        return path
+
+    @contextmanager
+    def store(self, namespace: str, key: str):
+        """
+        Write a new entry: yields a temporary directory to fill, which is
+        published under *key* when the block exits without an exception.
+        Raising :class:`DiscardEntry` in the block drops the entry quietly.
+        """
+        os.makedirs(os.path.join(self.root, namespace), exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=f".{key[:16]}-", dir=os.path.join(self.root, namespace))
+        try:
+            yield tmp
+            open(os.path.join(tmp, _COMPLETE), "w").close()
+            try:
+                os.rename(tmp, self.path(namespace, key))
+            except OSError:
+                # Another writer published the same content first
+                pass
+        except DiscardEntry:
+            pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """List ``(last_used, size_bytes, path)`` for every complete entry."""
+        result = []
+        for namespace in os.listdir(self.root):
+            ns_path = os.path.join(self.root, namespace)
+            if not os.path.isdir(ns_path):
+                continue
+            for key in os.listdir(ns_path):
+                path = os.path.join(ns_path, key)
+                marker = os.path.join(path, _COMPLETE)
+                try:
+                    result.append((os.path.getmtime(marker), _dir_size(path), path))
+                except OSError:  # temporary or half-deleted entry
+                    continue
+        return result
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in ``max_bytes``."""
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                # Drop the marker first so concurrent lookups miss the entry
+                try:
+                    os.remove(os.path.join(path, _COMPLETE))
+                except OSError:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
@@ -0,0 +1,154 @@
+# src/utils/context_packer.py
+
+from typing import Dict, List, Optional, Tuple
+
+# Characters of a chunk's start searched for in its predecessor to find an overlap
+OVERLAP_PROBE = 32
+
+
+def merge_overlap(a: str, b: str, probe: int = OVERLAP_PROBE) -> Optional[str]:
+    """
+    Join *b* onto *a* if *b* starts with a suffix of *a* (as consecutive
+    chunks with overlap do) or is contained in it; ``None`` otherwise.
+    """
+    if b in a:
+        return a
+    head = b[:probe]
+    start = a.find(head, max(len(a) - len(b), 0))
+    while start != -1:
+        tail = a[start:]
+        if b.startswith(tail):
+            return a + b[len(tail):]
+        start = a.find(head, start + 1)
+    return None
+
+
+def _is_next(prev: Dict, meta: Dict) -> bool:
+    """Whether chunk *meta* directly follows chunk *prev* in the same document section."""
+    if (prev.get("file_path"), prev.get("section_title")) != (meta.get("file_path"), meta.get("section_title")):
+        return False
+    prev_page = prev.get("page_end", prev.get("page_idx"))
+    if meta.get("page_idx") == prev.get("page_idx"):
+        return meta.get("chunk_index") == prev.get("chunk_index", -2) + 1
+    return meta.get("page_idx") == (prev_page or 0) + 1 and meta.get("chunk_index") == 0
+
+
+def merge_adjacent(chunks: List[Dict]) -> List[Dict]:
+    """
+    Merge retrieved chunks that are consecutive in their document.
+
+    Chunks of the same file and section are put in document order; a chunk
+    that directly follows the previous one (next ``chunk_index`` on the same
+    page, or the first chunk of the next page) or overlaps its text is
+    joined onto it, with the shared text kept once. Each merged block keeps
+    the best (lowest) retrieval rank of its members, and blocks are returned
+    in that order.
+
+    Returns
+    -------
+    list[dict]
+        ``{"metadata", "content", "rank", "members"}`` per block.
+    """
+    ranked = [(rank, c.get("metadata", {})) for rank, c in enumerate(chunks)]
+    ranked.sort(key=lambda item: (str(item[1].get("file_path")), str(item[1].get("section_title")),
+                                  item[1].get("page_idx") or 0, item[1].get("chunk_index") or 0))
+
+    blocks: List[Dict] = []
+    for rank, meta in ranked:
+        content = meta.get("content", "")
+        last = blocks[-1] if blocks else None
+        if last is not None and (last["metadata"].get("file_path"), last["metadata"].get("section_title")) == \
+                (meta.get("file_path"), meta.get("section_title")):
+            merged = merge_overlap(last["content"], content)
+            if merged is None and _is_next(last["last"], meta):
+                merged = last["content"] + " " + content
+            if merged is not None:
+                last["content"] = merged
+                last["rank"] = min(last["rank"], rank)
+                last["members"] += 1
+                last["last"] = meta
+                continue
+        blocks.append({"metadata": meta, "content": content, "rank": rank, "members": 1, "last": meta})
+
+    for block in blocks:
+        del block["last"]
+    blocks.sort(key=lambda b: b["rank"])
+    return blocks
+
+
+def _shingles(text: str, n: int = 5) -> set:
+    """Character n-grams of the whitespace-normalized text (works for Korean and English alike)."""
+    text = " ".join(text.split())
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+
+
+def drop_near_duplicates(blocks: List[Dict], threshold: float = 0.8) -> Tuple[List[Dict], int]:
+    """
+    Drop blocks whose character 5-gram Jaccard similarity with a better-ranked
+    kept block exceeds *threshold* (e.g. the same paragraph in two manuals).
+    """
+    kept, kept_shingles, dropped = [], [], 0
+    for block in blocks:
+        shingles = _shingles(block["content"])
+        if any(len(shingles & other) / len(shingles | other) > threshold for other in kept_shingles):
+            dropped += 1
+            continue
+        kept.append(block)
+        kept_shingles.append(shingles)
+    return kept, dropped
+
+
+def format_block(block: Dict) -> str:
+    return f"[{block['metadata'].get('section_title', '')}] {block['content']}"
+
+
+def pack_context(chunks: List[Dict], tokenizer, max_tokens: int, dedup_threshold: float = 0.8,
+                 min_partial_tokens: int = 64) -> Tuple[List[str], Dict]:
+    """
+    Fit retrieved chunks into a token budget for the prompt.
+
+    Steps: :func:`merge_adjacent` (overlapping or consecutive chunks become
+    one block), :func:`drop_near_duplicates`, then blocks are taken in
+    retrieval-rank order while their token count (measured with *tokenizer*,
+    the LLM's, in one batched call) fits in *max_tokens*. The first block
+    that does not fit is cut to the remaining budget when at least
+    *min_partial_tokens* are left; the rest are left out.
+
+    Returns
+    -------
+    tuple
+        ``(parts, stats)``: the formatted ``"[section] content"`` strings and
+        ``{"chunks", "blocks", "merged", "duplicates", "dropped",
+        "truncated", "tokens"}``.
+    """
+    blocks = merge_adjacent(chunks)
+    merged = len(chunks) - len(blocks)
+    blocks, duplicates = drop_near_duplicates(blocks, dedup_threshold)
+
+    texts = [format_block(b) for b in blocks]
+    token_ids = tokenizer(texts, add_special_tokens=False)["input_ids"] if texts else []
+    # Blocks are joined with a blank line, which costs about one token each
+    parts, used, truncated = [], 0, 0
+    for text, ids in zip(texts, token_ids):
+        cost = len(ids) + (1 if parts else 0)
+        if used + cost <= max_tokens:
+            parts.append(text)
+            used += cost
+            continue
+        remaining = max_tokens - used - (1 if parts else 0)
+        if remaining >= min_partial_tokens:
+            parts.append(tokenizer.decode(ids[:remaining], skip_special_tokens=True))
+            used += remaining + (1 if len(parts) > 1 else 0)
+            truncated += 1
+        break
+
+    stats = {
+        "chunks": len(chunks),
+        "blocks": len(blocks),
+        "merged": merged,
+        "duplicates": duplicates,
+        "dropped": len(blocks) - len(parts),
+        "truncated": truncated,
+        "tokens": used,
+    }
+    return parts, stats
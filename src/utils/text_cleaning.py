@@ -26,4 +26,28 @@ def basic_clean_text(text: str) -> str:
     # Collapse multiple spaces into a single space
     text = re.sub(r'\s+', ' ', text)
 
-    return text.strip()
\ No newline at end of file
+    return text.strip()
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…。！？])\s+')
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split cleaned text into sentences.
+
+    Sentences end at ``.``, ``!``, ``?``, ``…`` (and their full-width forms)
+    followed by whitespace, which covers both English and Korean
+    (``...습니다.``) text. Empty pieces are dropped.
+
+    Parameters
+    ----------
+    text : str
+        Text normalized by :func:`basic_clean_text`.
+
+    Returns
+    -------
+    list[str]
+        Sentences in order.
+    """
+    return [s for s in _SENTENCE_END.split(text) if s]
@@ -3,15 +3,19 @@
 import concurrent.futures
 import json
 import os
-import pickle
 import shutil
 import threading
 from typing import Tuple
 
 import gradio as gr
 
-from scripts import pdf_extractor, chunker, build_index, section_rep_builder
+from scripts import stream_pipeline
 from src.chatbot import PDFChatBot
+from src.search.chunk_index import ChunkIndex, MultiChunkIndex
+from src.search.index_store import (chunk_index_paths, lexical_index_path, load_chunk_index, load_sections,
+                                    save_chunk_index, save_lexical_index, save_sections, section_store_paths,
+                                    section_sum_path)
+from src.utils.content_cache import ContentCache
 
 # ---------------------------------------------------------------------
 # Persistent user database (credentials + uploads + prompts)
@@ -43,8 +47,17 @@ DEFAULT_PROMPT = (
     "Your response should reference the context clearly, but you may paraphrase or summarize appropriately."
 )
 
-# Max time (seconds) allowed for pdf_extractor.extract_pdf_content
+# Max time (seconds) allowed for the extraction → chunking → embedding pipeline
 EXTRACT_TIMEOUT = 120  # 2 minutes
+# Pages are extracted by a process pool of EXTRACT_WORKERS processes
+# (one per CPU by default); a single page may take at most PAGE_TIMEOUT seconds.
+EXTRACT_WORKERS = int(os.environ.get("QUERYDOC_EXTRACT_WORKERS", "0")) or None
+PAGE_TIMEOUT = 30
+# Extracted pages and chunk indexes are shared between users in a
+# content-addressed cache (keyed by the PDF's SHA-256), capped at
+# QUERYDOC_CACHE_MAX_GB gigabytes with least-recently-used eviction.
+CONTENT_CACHE = ContentCache(os.path.join("data", "cache"),
+                             max_bytes=int(float(os.environ.get("QUERYDOC_CACHE_MAX_GB", "10")) * 1024 ** 3))
 
 # In‑memory view of the persistent database
 _USER_DB = _load_user_db()
@@ -117,58 +130,62 @@ def login_and_prepare(username: str, password: str):
 # Extraction cache helpers (per‑user, per‑PDF)
 # ---------------------------------------------------------------------
 def _cache_paths(user_dir: str, pdf_basename: str):
-    """Return tuple (sections_path, index_path) inside the user directory."""
-    sec_path = os.path.join(user_dir, f"{pdf_basename}_sections.json")
-    idx_path = os.path.join(user_dir, f"{pdf_basename}_index.pkl")
-    return sec_path, idx_path
+    """Return tuple (sections_prefix, index_prefix) inside the user directory."""
+    sec_prefix = os.path.join(user_dir, f"{pdf_basename}_sections")
+    idx_prefix = os.path.join(user_dir, f"{pdf_basename}_index")
+    return sec_prefix, idx_prefix
+
+
+def _cache_files(user_dir: str, pdf_basename: str):
+    """Every file the cache of one PDF may consist of (including legacy pickle caches)."""
+    sec_prefix, idx_prefix = _cache_paths(user_dir, pdf_basename)
+    return [*section_store_paths(sec_prefix), section_sum_path(sec_prefix), *chunk_index_paths(idx_prefix),
+            lexical_index_path(idx_prefix), f"{sec_prefix}.json", f"{idx_prefix}.pkl"]
 
 
 def _save_cache(user_dir: str, pdf_basename: str,
-                sections: list, chunk_index: list):
-    sec_path, idx_path = _cache_paths(user_dir, pdf_basename)
-    with open(sec_path, "w", encoding="utf-8") as f:
-        json.dump(sections, f, ensure_ascii=False, indent=2)
-    with open(idx_path, "wb") as f:
-        pickle.dump(chunk_index, f)
+                sections: list, chunk_index: ChunkIndex):
+    """Store sections and chunk index in the binary format (float32 matrices + columnar metadata, BM25 postings)."""
+    sec_prefix, idx_prefix = _cache_paths(user_dir, pdf_basename)
+    save_chunk_index(chunk_index, idx_prefix)
+    save_lexical_index(chunk_index, idx_prefix)
+    save_sections(sections, sec_prefix)
 
 
 def _load_cache(user_dir: str, pdf_basename: str):
-    sec_path, idx_path = _cache_paths(user_dir, pdf_basename)
-    if os.path.exists(sec_path) and os.path.exists(idx_path):
+    """Open a cached PDF; the embedding matrices are memory-mapped, not read."""
+    sec_prefix, idx_prefix = _cache_paths(user_dir, pdf_basename)
+    if os.path.exists(section_store_paths(sec_prefix)[2]) and os.path.exists(chunk_index_paths(idx_prefix)[1]):
         try:
-            with open(sec_path, "r", encoding="utf-8") as f:
-                sections = json.load(f)
-            with open(idx_path, "rb") as f:
-                chunk_index = pickle.load(f)
-            return sections, chunk_index
-        except Exception:
+            return load_sections(sec_prefix), load_chunk_index(idx_prefix)
+        except (OSError, ValueError, KeyError):
             # corrupted cache – ignore
             pass
     return None, None
 
 
-def process_pdf(pdf_path: str, user_dir: str, timeout: int = EXTRACT_TIMEOUT) -> Tuple[list, list]:
+def process_pdf(pdf_path: str, user_dir: str, timeout: int = EXTRACT_TIMEOUT) -> Tuple[list, ChunkIndex]:
     """
     Run the extraction/index pipeline with a timeout guard.
     Results are cached to disk inside user_dir for later reuse.
     """
     pdf_basename = os.path.splitext(os.path.basename(pdf_path))[0]
 
-    # Run extractor with timeout
-    def _do_extract():
-        return pdf_extractor.extract_pdf_content(pdf_path)
+    # Pages stream through extraction → chunking → embedding (see
+    # scripts/stream_pipeline.py), guarded by an overall timeout. A PDF whose
+    # content was already processed (by any user, under any name) is served
+    # from CONTENT_CACHE.
+    def _do_index():
+        return stream_pipeline.index_pdf_cached(pdf_path, CONTENT_CACHE, workers=EXTRACT_WORKERS,
+                                                page_timeout=PAGE_TIMEOUT)
 
     try:
         with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-            future = ex.submit(_do_extract)
-            extracted = future.result(timeout=timeout)
+            future = ex.submit(_do_index)
+            sections, chunk_index = future.result(timeout=timeout)
     except concurrent.futures.TimeoutError:
         raise RuntimeError("PDF extraction timed out (over 2 minutes).")
 
-    chunks = chunker.process_extracted_file(extracted)
-    chunk_index = build_index.build_chunk_index(chunks)
-    sections = section_rep_builder.build_section_reps(extracted["sections"], chunk_index)
-
     # Save to cache
     _save_cache(user_dir, pdf_basename, sections, chunk_index)
     return sections, chunk_index
@@ -246,20 +263,23 @@ def load_all_cached_pdfs(username):
         if sections is None or chunk_index is None:
             # Skip files that were never processed / cache missing
             continue
-        # Tag each section with its source PDF name
+        # Tag each section with its source PDF so that equal section titles
+        # across PDFs resolve to their own chunks
         tagged_sections = []
         for sec in sections:
             sec_copy = sec.copy()
             sec_copy["file_name"] = pdf_basename  # add filename field
+            sec_copy.setdefault("file_path", pdf_path)
             tagged_sections.append(sec_copy)
         all_sections.extend(tagged_sections)
-        all_chunks.extend(chunk_index)
+        all_chunks.append(chunk_index)
 
     if not all_sections:
         return None, None, "No cached data found. Process PDFs first."
 
     msg = f"Loaded cached data for {len(all_sections)} sections across {len(uploads)} PDFs"
-    return all_sections, all_chunks, msg
+    # One virtual index over the per-PDF memory-mapped matrices (no copies)
+    return all_sections, MultiChunkIndex(all_chunks), msg
 
 
 def delete_cached_pdf(selected_name, username):
@@ -284,8 +304,7 @@ def delete_cached_pdf(selected_name, username):
 
     # Remove cached section/index files
     pdf_basename = os.path.splitext(selected_name)[0]
-    sec_path, idx_path = _cache_paths(user_dir, pdf_basename)
-    for p in (sec_path, idx_path):
+    for p in _cache_files(user_dir, pdf_basename):
         if os.path.exists(p):
             try:
                 os.remove(p)
@@ -314,12 +333,9 @@ def ask_question(question, sections, chunk_index, system_prompt, username, use_i
         return "Please upload and process a PDF first."
     prompt = system_prompt or DEFAULT_PROMPT
     bot = PDFChatBot(sections, chunk_index, system_prompt=prompt)
-    answer = bot.answer(question, fine_only=fine_only)
-    answer = answer.replace('<|endoftext|><|im_start|>user', "=== System Prompt ===")
-    answer = answer.replace('<|im_end|>\n<|im_start|>assistant', '')
-    answer = answer.replace('<|im_end|>', '')
-    answer_output = answer.split("=== Answer ===")[-1].strip()
-    reference_output = answer.split("=== User Question ===")[0].strip().split("=== Document Context ===")[-1].strip()
+    answer_output = bot.answer(question, fine_only=fine_only).strip()
+    # Show the document context the answer was generated from
+    reference_output = bot.last_prompt.split("=== User Question ===")[0].split("=== Document Context ===")[-1].strip()
 
     return answer_output, reference_output
 